@@ -1,8 +1,11 @@
 # add_date.py
 import os
 import re
-from tkinter import messagebox
-from utils import read_file_safely
+from functools import partial
+import metrics
+from batch import FileOperation, iter_files
+from ledger import content_hash, done_key, fingerprint
+from utils import CP1251_WHITESPACE, decode_text, is_cp1251_bytes, normalize_newlines, to_output_bytes
 
 
 DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
@@ -24,29 +27,136 @@ def _normalize_text(s: str) -> str:
     return s
 
 
-def _append_date_to_line(line: str, date_str: str) -> str:
+def normalized_content(data: bytes, encoding: str):
+    """Нормализованное содержимое файла: bytes cp1251 на быстром пути, иначе str."""
+    if is_cp1251_bytes(data, encoding):
+        # быстрый путь: файл уже в cp1251 — работаем с байтами
+        with metrics.stage("normalize"):
+            return normalize_newlines(data).replace(b"\xa0", b" ")
+    content = decode_text(data, encoding)
+    with metrics.stage("normalize"):
+        return _normalize_text(content)
+
+
+def append_date_to_content(content, date_str: str):
     """
-    Добавляет дату в конец строки как новое поле.
-    Сохраняем формат с разделителем ';' и финальным ';'.
+    Добавляет дату во все непустые строки текста. content — str или байты cp1251
+    (быстрый путь без декодирования). Возвращает (новое содержимое, число строк).
     """
-    base = line.rstrip("\n")
-    if not base.strip():
-        return base  # пустые строки не трогаем
+    if isinstance(content, bytes):
+        nl, semi, blank = b"\n", b";", CP1251_WHITESPACE
+        date = date_str.encode("ascii")
+    else:
+        nl, semi, blank = "\n", ";", None
+        date = date_str
+
+    new_lines = []
+    replaced_lines = 0
+    for line in content.split(nl):
+        # чтобы не добавлять дату в полностью пустую последнюю строку
+        if not line.strip(blank):
+            new_lines.append(line)
+            continue
+        # дата — новое поле в конце строки, формат с разделителем ';' и финальным ';'
+        if line.endswith(semi):
+            new_lines.append(line + date + semi)
+        else:
+            new_lines.append(line + semi + date + semi)
+        replaced_lines += 1
+    return nl.join(new_lines), replaced_lines
+
+
+def _file_date(path, mode: str, manual_date: str = ""):
+    return extract_date_from_filename(os.path.basename(path)) if mode == "from_filename" else manual_date
+
+
+def add_date_fingerprint(path, mode: str, manual_date: str = ""):
+    """Отпечаток операции для журнала (None — дата не найдена, отслеживать нечего)."""
+    date_str = _file_date(path, mode, manual_date)
+    return fingerprint("add_date", date_str) if date_str else None
 
-    # Если строка уже заканчивается ';', то просто дописываем дату и ';'
-    if base.endswith(";"):
-        return base + date_str + ";"
-    # Иначе добавляем через ';' и закрываем ';'
-    return base + ";" + date_str + ";"
 
+def add_date_skipped(path, mode: str, manual_date: str = ""):
+    """Результат для файла, который журнал пропустил без чтения."""
+    return {"path": path, "date": _file_date(path, mode, manual_date), "lines": 0, "written": False,
+            "skipped": True, "state": None, "source_hash": None, "error": None}
 
-def append_date_to_files(file_paths, mode: str, manual_date: str = "", log_text_widget=None):
+
+def _add_date_start(path, mode: str, manual_date: str = "", done=frozenset()):
+    """Результат до чтения; файл без даты (в имени) не читается."""
+    result = {"path": path, "date": None, "lines": 0, "written": False, "skipped": False, "state": None,
+              "source_hash": None, "error": None}
+    result["date"] = _file_date(path, mode, manual_date) or None
+    return result, result["date"] is not None
+
+
+def _add_date_transform(result, data, encoding, mode: str, manual_date: str = "", done=frozenset()):
+    """Вычислительная часть add_date_to_file: (result, новые байты или None, хэш итогового содержимого)."""
+    date_str = result["date"]
+    digest = result["source_hash"] = content_hash(data)
+    if done_key(fingerprint("add_date", date_str), digest) in done:
+        result["skipped"] = True
+        return result, None, digest
+
+    content = normalized_content(data, encoding)
+    with metrics.stage("add_date"):
+        new_content, result["lines"] = append_date_to_content(content, date_str)
+    if new_content == content:
+        return result, None, digest
+    if isinstance(new_content, str):
+        new_content = new_content.encode("cp1251", errors="replace")
+    new_content = to_output_bytes(new_content)
+    return result, new_content, content_hash(new_content)
+
+
+# чтение и запись отдельно от вычислений — для executor="async" (см. batch.FileOperation)
+ADD_DATE_OPERATION = FileOperation(_add_date_start, _add_date_transform)
+
+
+def add_date_to_file(path, mode: str, manual_date: str = "", done=frozenset()):
+    """
+    Добавляет дату в один файл. Возвращает словарь для лога: path, date (None — дата
+    не найдена в имени, файл пропущен), lines, written, skipped, state (для журнала
+    ledger.Ledger), error — подходит для пула процессов.
+    done — ключи уже обработанного содержимого: в такой файл дата второй раз не добавляется.
+    """
+    return ADD_DATE_OPERATION(path, mode, manual_date, done)
+
+
+def iter_add_date(file_paths, mode: str, manual_date: str = "", ledger=None,
+                  workers: int = 1, executor: str = "process", cancel=None, journal=None):
+    """
+    Результаты add_date_to_file по пачке (см. batch.iter_files, executor="async" — сетевые папки).
+    С журналом ledger
+    файлы, в которые эта дата уже добавлена, пропускаются, а обработанные — записываются в него.
+    journal — undo.UndoJournal: изменения записываются для отмены.
+    """
+    undo = {} if journal is None else {"undo": True}
+    if ledger is None:
+        results = iter_files(ADD_DATE_OPERATION, file_paths, mode, manual_date,
+                             workers=workers, executor=executor, cancel=cancel, **undo)
+    else:
+        results = ledger.iter_files(ADD_DATE_OPERATION, file_paths, mode, manual_date,
+                                    fingerprint_of=partial(add_date_fingerprint, mode=mode, manual_date=manual_date),
+                                    skipped_result=partial(add_date_skipped, mode=mode, manual_date=manual_date),
+                                    workers=workers, executor=executor, cancel=cancel, **undo)
+    return results if journal is None else journal.record_all(results)
+
+
+def append_date_to_files(file_paths, mode: str, manual_date: str = "", log_text_widget=None,
+                         workers: int = 1, executor: str = "process", ledger=None, journal=None):
     """
     mode:
       - "from_filename": дату берём из имени каждого файла
       - "manual": используем manual_date для всех файлов
+    workers > 1 — файлы обрабатываются параллельно (см. batch.iter_files),
+    лог собирается в порядке file_paths.
+    ledger — ledger.Ledger: файлы, в которые эта дата уже добавлена, пропускаются.
+    journal — undo.UndoJournal (по умолчанию новый): изменения можно отменить.
     Возвращает количество изменённых файлов.
     """
+    from tkinter import messagebox
+
     if not file_paths:
         messagebox.showwarning("Внимание", "Файлы не выбраны!")
         return 0
@@ -57,53 +167,44 @@ def append_date_to_files(file_paths, mode: str, manual_date: str = "", log_text_
             messagebox.showwarning("Ошибка", "Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
             return 0
 
-    changed_files = 0
+    if journal is None:
+        from undo import UndoJournal
+        journal = UndoJournal("add_date")
+    results = list(iter_add_date(file_paths, mode, manual_date, ledger, workers=workers, executor=executor,
+                                 journal=journal))
 
-    for path in file_paths:
-        filename = os.path.basename(path)
+    if log_text_widget:
+        for result in results:
+            for line in add_date_log_lines(result):
+                log_text_widget.insert("end", line)
+
+    changed_files, message = add_date_summary(results)
+    messagebox.showinfo("Готово", message)
+    return changed_files
 
-        if mode == "from_filename":
-            date_str = extract_date_from_filename(filename)
-            if not date_str:
-                if log_text_widget:
-                    log_text_widget.insert("end", f"{filename}: дата YYYY-MM-DD не найдена в имени — пропущен\n")
-                continue
-        else:
-            date_str = manual_date
-
-        try:
-            raw = read_file_safely(path)
-            content = _normalize_text(raw)
-            lines = content.split("\n")
-
-            new_lines = []
-            replaced_lines = 0
-
-            for line in lines:
-                # чтобы не добавлять дату в полностью пустую последнюю строку
-                if not line.strip():
-                    new_lines.append(line)
-                    continue
-                new_lines.append(_append_date_to_line(line, date_str))
-                replaced_lines += 1
-
-            new_content = "\n".join(new_lines)
-
-            if new_content != content:
-                with open(path, "w", encoding="cp1251", errors="replace") as f:
-                    f.write(new_content)
-                changed_files += 1
-                if log_text_widget:
-                    log_text_widget.insert("end", f"{filename}: добавлена дата {date_str} в {replaced_lines} строк\n")
-
-        except Exception as e:
-            if log_text_widget:
-                log_text_widget.insert("end", f"Ошибка при обработке {filename}: {e}\n")
-            continue
 
+def add_date_log_lines(result):
+    """Строки лога по результату add_date_to_file."""
+    filename = os.path.basename(result["path"])
+    if result["date"] is None:
+        return [f"{filename}: дата YYYY-MM-DD не найдена в имени — пропущен\n"]
+    if result["error"]:
+        return [f"Ошибка при обработке {filename}: {result['error']}\n"]
+    if result.get("skipped"):
+        return [f"{filename}: дата {result['date']} уже добавлена — пропущен\n"]
+    if result["written"]:
+        return [f"{filename}: добавлена дата {result['date']} в {result['lines']} строк\n"]
+    return []
+
+
+def add_date_summary(results):
+    """Итог пачки: (количество изменённых файлов, текст итогового сообщения)."""
+    changed_files = sum(1 for result in results if result["written"])
     if changed_files == 0:
-        messagebox.showinfo("Готово", "Файлы не изменялись (возможно, дата не найдена в названиях).")
+        message = "Файлы не изменялись (возможно, дата не найдена в названиях)."
     else:
-        messagebox.showinfo("Готово", f"Дата добавлена. Изменено файлов: {changed_files}")
-
-    return changed_files
+        message = f"Дата добавлена. Изменено файлов: {changed_files}"
+    skipped = sum(1 for result in results if result.get("skipped"))
+    if skipped:
+        message += f"\nПропущено уже обработанных файлов: {skipped}"
+    return changed_files, message
@@ -0,0 +1,205 @@
+# aio.py
+# Асинхронный ввод-вывод для пачек файлов на сетевых папках (SMB): там у каждого
+# open/read/write большая задержка, и при обработке файлов по одному время пачки —
+# сумма задержек. Здесь цикл asyncio держит в работе сразу много чтений и записей
+# (не больше io_concurrency, сами блокирующие вызовы — в пуле потоков ввода-вывода),
+# а вычисления идут в отдельном исполнителе. Результаты отдаются строго по порядку;
+# файлов в работе и готовых, но ещё не забранных — не больше window: если
+# потребитель (запись объединённого файла, лог) не успевает, новые чтения ждут.
+#
+# Модуль импортируется только при executor="async" — asyncio заметно удлиняет запуск.
+import asyncio
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import metrics
+
+IO_CONCURRENCY = 16  # одновременных операций ввода-вывода
+WINDOW_FACTOR = 2  # файлов в работе и в очереди на выдачу: io_concurrency * WINDOW_FACTOR
+
+_END = object()
+
+
+def _measured(func, value):
+    """Шаг в процессе пула с замерами: (результат, замеры для metrics.merge)."""
+    with metrics.collect() as collected:
+        value = func(value)
+    return value, collected.to_dict()
+
+
+class _Pipeline:
+    """
+    Цикл asyncio в отдельном потоке: для каждого элемента read (ввод-вывод) →
+    transform (вычисления, cpu_pool) → write (ввод-вывод). Шаги — функции одного
+    аргумента, результат шага передаётся следующему; None вместо шага — пропустить.
+    Исключение шага поднимается у потребителя на месте этого элемента.
+    """
+
+    def __init__(self, items, read, transform=None, write=None, io_concurrency: int = IO_CONCURRENCY,
+                 workers: int = 1, process: bool = False, cancel=None, window=None):
+        self.items = list(items)
+        self.steps = (read, transform, write)
+        self.io_concurrency = max(1, io_concurrency)
+        self.window = window or self.io_concurrency * WINDOW_FACTOR
+        self.workers = max(1, workers)
+        self.process = process
+        self.cancel = cancel
+        self.results = queue.Queue()
+        self._stopped = False
+        self._loop = None
+        self._slots = None
+        self._ready = threading.Event()
+
+    def _cancelled(self):
+        return self._stopped or (self.cancel is not None and self.cancel.is_set())
+
+    async def _main(self):
+        loop = self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.window)
+        self._ready.set()
+        io_limit = asyncio.Semaphore(self.io_concurrency)
+        read, transform, write = self.steps
+        # run_in_executor не переносит contextvars в потоки пулов — сбор замеров передаётся явно
+        read = metrics.bind(read)
+        if write is not None:
+            write = metrics.bind(write)
+        measured = self.process and transform is not None and metrics.active()
+        if measured:
+            transform = partial(_measured, transform)
+        elif transform is not None and not self.process:
+            transform = metrics.bind(transform)
+        done, next_index = {}, 0
+
+        def deliver(index, outcome):
+            nonlocal next_index
+            done[index] = outcome
+            while next_index in done:
+                self.results.put(done.pop(next_index))
+                next_index += 1
+
+        async def run(index, value, io_pool, cpu_pool):
+            try:
+                async with io_limit:
+                    value = await loop.run_in_executor(io_pool, read, value)
+                if transform is not None:
+                    value = await loop.run_in_executor(cpu_pool, transform, value)
+                    if measured:
+                        value, collected = value
+                        metrics.merge(collected)
+                if write is not None:
+                    async with io_limit:
+                        value = await loop.run_in_executor(io_pool, write, value)
+                outcome = (True, value)
+            except Exception as e:
+                outcome = (False, e)
+            deliver(index, outcome)
+
+        cpu_class = ProcessPoolExecutor if self.process else ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.io_concurrency) as io_pool, \
+                cpu_class(max_workers=self.workers) as cpu_pool:
+            tasks = []
+            for index, item in enumerate(self.items):
+                await self._slots.acquire()
+                if self._cancelled():
+                    break
+                tasks.append(asyncio.ensure_future(run(index, item, io_pool, cpu_pool)))
+            await asyncio.gather(*tasks)
+
+    def _thread_main(self):
+        try:
+            asyncio.run(self._main())
+        except BaseException as e:
+            self.results.put((False, e))
+        finally:
+            self._ready.set()
+            self.results.put(_END)
+
+    def _release(self):
+        """Потребитель забрал результат — можно начинать следующий файл."""
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._slots.release)
+            except RuntimeError:  # цикл уже завершился
+                pass
+
+    def __iter__(self):
+        thread = threading.Thread(target=metrics.bind(self._thread_main), name="aio", daemon=True)
+        thread.start()
+        self._ready.wait()
+        try:
+            while True:
+                outcome = self.results.get()
+                if outcome is _END:
+                    return
+                self._release()
+                ok, value = outcome
+                if not ok:
+                    raise value
+                yield value
+        finally:
+            # потребитель остановился раньше — новые файлы не начинаются, начатые доделываются
+            self._stopped = True
+            self._release()
+            thread.join()
+
+
+def iter_pipeline(items, read, transform=None, write=None, io_concurrency: int = IO_CONCURRENCY,
+                  workers: int = 1, process: bool = False, cancel=None, window=None):
+    """
+    Результаты read → transform → write для каждого элемента items, по порядку items.
+    read и write выполняются в пуле ввода-вывода (одновременно не больше io_concurrency),
+    transform — в workers потоках или (process=True) процессах; для процессов transform
+    должна сериализоваться (функция уровня модуля или partial от неё).
+    cancel — threading.Event: после установки новые элементы не начинаются, начатые отдаются.
+    """
+    return iter(_Pipeline(items, read, transform, write, io_concurrency, workers, process, cancel, window))
+
+
+# --- batch.FileOperation: чтение → вычисления → запись с состоянием для журнала ---
+def _read_step(operation, args, kwargs, path):
+    from utils import read_bytes
+    result, proceed = operation.start(path, *args, **kwargs)
+    if not proceed:
+        return result, None, None, False
+    try:
+        data, encoding = read_bytes(path)
+    except Exception as e:
+        result["error"] = str(e)
+        return result, None, None, False
+    return result, data, encoding, True
+
+
+def _transform_step(compute, args, kwargs, value):
+    result, data, encoding, proceed = value
+    if not proceed:
+        return result, None, None, False
+    try:
+        return (*compute(result, data, encoding, *args, **kwargs), True)
+    except Exception as e:
+        result["error"] = str(e)
+        return result, None, None, False
+
+
+def _write_step(value):
+    from ledger import save_output
+    result, output, digest, proceed = value
+    if proceed:
+        try:
+            save_output(result, output, digest)
+        except Exception as e:
+            result["error"] = str(e)
+    return result
+
+
+def iter_file_operation(operation, file_paths, *args, workers: int = 1, cancel=None,
+                        io_concurrency: int = IO_CONCURRENCY, **kwargs):
+    """
+    Результаты batch.FileOperation по пачке файлов, по порядку file_paths (как batch.iter_files):
+    чтение и запись идут одновременно для многих файлов, transform — в потоке (workers <= 1)
+    или в workers процессах. Ошибки — в result["error"], как у синхронного вызова.
+    """
+    undo = kwargs.pop("undo", False)
+    return iter_pipeline(file_paths, partial(_read_step, operation, args, kwargs),
+                         partial(_transform_step, operation.compute, args, dict(kwargs, undo=undo)), _write_step,
+                         io_concurrency=io_concurrency, workers=workers, process=workers > 1, cancel=cancel)
@@ -0,0 +1,180 @@
+# background.py
+import queue
+import threading
+import time
+import tkinter as tk
+from tkinter import messagebox, ttk
+import metrics
+from batch import Cancelled, iter_files
+
+POLL_MS = 100  # как часто окно забирает из очереди лог и прогресс
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class TaskWindow:
+    """
+    Окно лога для долгой операции. Работа идёт в фоновом потоке и общается с окном
+    только через очередь: окно раз в POLL_MS (через after()) забирает накопленные
+    строки лога одной вставкой, двигает прогресс, показывает файлы/с и оставшееся время.
+    Кнопка "Отмена" (и закрытие окна) ставят cancel_event — операция останавливается
+    между файлами.
+    """
+
+    def __init__(self, root, title: str, total: int = 0, cancellable: bool = True):
+        self.title = title
+        self.total = total
+        self.cancel_event = threading.Event()
+        self._queue = queue.Queue()
+        self._done = 0
+        self._started = time.monotonic()
+        self._running = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        top = tk.Frame(self.window)
+        top.pack(fill="x", padx=10, pady=(10, 0))
+        self.progress = ttk.Progressbar(top, length=400, mode="determinate" if total else "indeterminate",
+                                        maximum=max(total, 1))
+        self.progress.pack(side=tk.LEFT, fill="x", expand=True)
+        self.cancel_button = tk.Button(top, text="Отмена", command=self.cancel,
+                                       state=tk.NORMAL if cancellable else tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=(10, 0))
+
+        self.status = tk.Label(self.window, anchor="w")
+        self.status.pack(fill="x", padx=10)
+
+        self.log_text = tk.Text(self.window, width=100, height=30)
+        self.log_text.pack(padx=10, pady=10, fill="both", expand=True)
+
+    # --- вызывается из фонового потока ---
+    def report(self, lines=(), done: int = 1):
+        """Добавить строки лога и отметить обработанные файлы."""
+        self._queue.put(("progress", list(lines), done))
+
+    # --- главный поток ---
+    def start(self, work):
+        """
+        Запускает work() в фоновом потоке. work возвращает текст итогового сообщения
+        (или None); batch.Cancelled и другие исключения показываются в конце.
+        Если в настройках включены замеры (metrics.load_settings), их сводка
+        дописывается в лог, а JSON (и профиль cProfile) сохраняются в папку metrics.
+        """
+        settings = metrics.load_settings()
+
+        def target():
+            try:
+                if settings["enabled"] or settings["profile"]:
+                    work_result = self._measured(work, settings["profile"])
+                else:
+                    work_result = work()
+                self._queue.put(("done", work_result))
+            except Cancelled:
+                self._queue.put(("done", "Операция остановлена."))
+            except Exception as e:
+                self._queue.put(("error", e))
+
+        self._running = True
+        if not self.total:
+            self.progress.start(15)
+        threading.Thread(target=target, daemon=True).start()
+        self.window.after(POLL_MS, self._poll)
+
+    def _measured(self, work, profile: bool):
+        collected = None
+        try:
+            with metrics.collect(self.title, profile=profile) as collected:
+                return work()
+        finally:
+            if collected is not None:
+                lines = collected.summary_lines()
+                try:
+                    lines.append(f"Замеры сохранены: {collected.save()}\n")
+                except OSError as e:
+                    lines.append(f"Не удалось сохранить замеры: {e}\n")
+                self.report(lines, done=0)
+
+    def run_batch(self, func, file_paths, args, log_lines, summary, workers: int = 1):
+        """
+        Типовая пачка файлов: func(path, *args) через batch.iter_files, строки лога
+        log_lines(result) сразу в окно, итог — summary(results)[1].
+        """
+        file_paths = list(file_paths)
+        self.run_results(lambda cancel: iter_files(func, file_paths, *args, workers=workers, cancel=cancel),
+                         log_lines, summary)
+
+    def run_results(self, make_results, log_lines, summary):
+        """
+        То же для готового источника результатов: make_results(cancel_event) возвращает
+        итератор результатов (например, replace.iter_replacements с журналом).
+        """
+        def work():
+            results = []
+            for result in make_results(self.cancel_event):
+                results.append(result)
+                self.report(log_lines(result))
+            return summary(results)[1]
+
+        self.start(work)
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED, text="Остановка...")
+
+    def _on_close(self):
+        if self._running:
+            self.cancel()
+        else:
+            self.window.destroy()
+
+    def _poll(self):
+        lines = []
+        finished = None
+        while finished is None:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] == "progress":
+                lines.extend(item[1])
+                self._done += item[2]
+            else:
+                finished = item
+
+        if lines:
+            # одна вставка на всю пачку строк — Text не тормозит на тысячах файлов
+            self.log_text.insert("end", "".join(lines))
+            self.log_text.see("end")
+        self._update_status()
+
+        if finished is None:
+            self.window.after(POLL_MS, self._poll)
+        else:
+            self._finish(*finished)
+
+    def _update_status(self):
+        elapsed = time.monotonic() - self._started
+        if not self.total:
+            self.status.config(text=f"Прошло {_format_seconds(elapsed)}")
+            return
+        self.progress["value"] = self._done
+        text = f"{self._done} / {self.total} файлов"
+        if self._done and elapsed > 0:
+            rate = self._done / elapsed
+            text += f" · {rate:.1f} файл/с · осталось ~{_format_seconds((self.total - self._done) / rate)}"
+        self.status.config(text=text)
+
+    def _finish(self, kind, value):
+        self._running = False
+        self.progress.stop()
+        self.cancel_button.config(state=tk.DISABLED)
+        if kind == "error":
+            messagebox.showerror("Ошибка", str(value), parent=self.window)
+        elif value:
+            title = "Остановлено" if self.cancel_event.is_set() else "Готово"
+            messagebox.showinfo(title, value, parent=self.window)
@@ -0,0 +1,136 @@
+# batch.py
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import metrics
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+# "async" — чтение и запись многих файлов одновременно (aio.py), только для FileOperation
+EXECUTORS = ("process", "thread", "async")
+# сколько файлов процесс получает за раз (реже гоняем правила через pickle, но отмена — грубее)
+MAX_CHUNK_SIZE = 8
+
+
+class Cancelled(Exception):
+    """Операция остановлена пользователем между файлами."""
+
+
+class FileOperation:
+    """
+    Обработка одного файла, разделённая на части, чтобы ввод-вывод можно было вести
+    отдельно от вычислений (executor="async", см. aio.py):
+      start(path, *args, **kwargs) -> (result, нужно ли читать файл) — без ввода-вывода;
+      transform(result, data, encoding, *args, **kwargs) -> (result, новые байты или None,
+      хэш итогового содержимого или None) — только вычисления над прочитанными байтами.
+    Чтение (utils.read_bytes) и запись с состоянием для журнала (ledger.save_output) общие.
+    Вызов operation(path, *args, **kwargs) делает всё по порядку — как обычная функция
+    для iter_files; ошибка любой части попадает в result["error"].
+    undo=True — в result["undo"] кладётся запись для журнала отмены (см. undo.UndoJournal).
+    """
+
+    def __init__(self, start, transform):
+        self.start = start
+        self.transform = transform
+
+    def compute(self, result, data, encoding, *args, undo: bool = False, **kwargs):
+        """transform и (undo=True) запись для отмены — обе части нужны исходные и новые байты."""
+        result, output, digest = self.transform(result, data, encoding, *args, **kwargs)
+        if undo and output is not None:
+            from ledger import content_hash
+            from undo import undo_entry
+            before = result.get("source_hash") or content_hash(data)
+            result["undo"] = undo_entry(data, output, before, digest)
+        return result, output, digest
+
+    def __call__(self, path, *args, undo: bool = False, **kwargs):
+        from ledger import save_output
+        from utils import read_bytes
+        result, proceed = self.start(path, *args, **kwargs)
+        if not proceed:
+            return result
+        try:
+            data, encoding = read_bytes(path)
+            result, output, digest = self.compute(result, data, encoding, *args, undo=undo, **kwargs)
+            save_output(result, output, digest)
+        except Exception as e:
+            result["error"] = str(e)
+        return result
+
+
+def _call(func, args, kwargs, path):
+    return func(path, *args, **kwargs)
+
+
+def _call_chunk(call, paths):
+    return [call(path) for path in paths]
+
+
+def _call_chunk_measured(call, paths):
+    """Пачка в процессе пула с замерами: (результаты, замеры для metrics.merge)."""
+    with metrics.collect() as collected:
+        results = _call_chunk(call, paths)
+    return results, collected.to_dict()
+
+
+def iter_files(func, file_paths, *args, workers: int = 1, executor: str = "process", cancel=None, **kwargs):
+    """
+    Вызывает func(path, *args, **kwargs) для каждого файла и отдаёт результаты по мере
+    готовности, но строго в порядке file_paths.
+    workers > 1 — параллельно: executor="process" для разбора и замен (CPU),
+    "thread" — когда время уходит на чтение/запись (сетевые папки).
+    executor="async" — для FileOperation: много файлов читается и пишется одновременно,
+    вычисления идут в workers процессах (см. aio.iter_file_operation).
+    Для процессов func должна быть функцией уровня модуля, а аргументы — сериализуемыми.
+    cancel — threading.Event: после его установки новые файлы не начинаются,
+    уже начатые доделываются и отдаются.
+    Если идёт сбор замеров (metrics.collect), замеры процессов пула добавляются к нему.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Неизвестный исполнитель: {executor}")
+    if executor == "async":
+        if not isinstance(func, FileOperation):
+            raise ValueError("executor='async' работает только с batch.FileOperation")
+        from aio import iter_file_operation
+        yield from iter_file_operation(func, file_paths, *args, workers=workers, cancel=cancel, **kwargs)
+        return
+    call = partial(_call, func, args, kwargs)
+    file_paths = list(file_paths)
+
+    if workers <= 1 or len(file_paths) <= 1:
+        for path in file_paths:
+            if cancel is not None and cancel.is_set():
+                return
+            yield call(path)
+        return
+
+    workers = min(workers, len(file_paths))
+    measured = False
+    if executor == "thread":
+        pool_class, chunk_size = ThreadPoolExecutor, 1
+        run_chunk = metrics.bind(_call_chunk)  # потоки пишут замеры прямо в сбор вызывающего
+    else:
+        pool_class = ProcessPoolExecutor
+        chunk_size = max(1, min(MAX_CHUNK_SIZE, len(file_paths) // (workers * 4)))
+        measured = metrics.active()
+        run_chunk = _call_chunk_measured if measured else _call_chunk
+    chunks = deque(file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size))
+
+    with pool_class(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            # в работе не больше пачки на исполнителя плюс одна в запасе — память и отмена под контролем
+            while chunks and len(pending) <= workers and not (cancel is not None and cancel.is_set()):
+                pending.append(pool.submit(run_chunk, call, chunks.popleft()))
+            if not pending:
+                return
+            results = pending.popleft().result()
+            if measured:
+                results, collected = results
+                metrics.merge(collected)
+            yield from results
+
+
+def map_files(func, file_paths, *args, workers: int = 1, executor: str = "process", **kwargs):
+    """То же, что iter_files, но сразу списком результатов в порядке file_paths."""
+    return list(iter_files(func, file_paths, *args, workers=workers, executor=executor, **kwargs))
@@ -0,0 +1,303 @@
+# bench.py
+# Замер скорости без GUI: генерирует синтетические PNX-файлы и прогоняет по ним
+# чтение, объединение, разделение, замену и добавление даты. Результаты — в JSON
+# (ключи отсортированы), чтобы сравнивать версии обычным diff.
+#
+#   python bench.py --sizes 64K,1M,32M --files 4 --output bench.json
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = "64K,1M,16M"
+RESULT_POLL_SECONDS = 1.0  # как часто проверять, жив ли процесс с операцией
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+ENCODINGS = ("cp1251", "utf-8", "utf-8-sig")
+EXTRA_MATERIALS = ["МДФ 16 белый", "ХДФ 3", "Фанера 18", "Кромка ПВХ 0,4", "Стекло 4"]
+BENCH_REPLACE_RULES = [
+    {"old": "тимбер", "new": "Тимбер"},
+    {"old": "ЛДСП", "new": "ЛДСП "},
+    {"old": "evogloss", "new": "EvoGloss"},
+]
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def _materials(rules):
+    """Названия материалов: ключевые слова правил разделения с вариациями плюс "прочие"."""
+    materials = []
+    for keywords in rules.values():
+        for keyword in [keywords] if isinstance(keywords, str) else keywords:
+            materials += [keyword, f"{keyword} 16 дуб сонома", f"{keyword.capitalize()}-Galif 18"]
+    return materials + EXTRA_MATERIALS
+
+
+def generate_pnx(path, size: int, encoding: str = "cp1251", rules=None, seed: int = 0):
+    """
+    Пишет синтетический раскрой примерно size байт: материал;длина;ширина;кол-во;деталь;текстура;кромка.
+    encoding "utf-8-sig" — UTF-8 с BOM. Возвращает число строк.
+    """
+    if rules is None:
+        from split import load_rules
+        rules = load_rules()
+    rnd = random.Random(seed)
+    materials = _materials(rules)
+    newline = "\r\n" if rnd.random() < 0.7 else "\n"
+    written = lines = 0
+    with open(path, "w", encoding=encoding, newline="") as f:
+        while written < size:
+            chunk = []
+            for _ in range(1000):
+                chunk.append(f"{rnd.choice(materials)};{rnd.randint(80, 2800)};{rnd.randint(50, 2070)};"
+                             f"{rnd.randint(1, 12)};Деталь {rnd.randint(1, 400)};{rnd.choice('01')};"
+                             f"{rnd.choice(['', 'ПВХ 0,4', 'ПВХ 2'])}{newline}")
+            text = "".join(chunk)
+            f.write(text)
+            written += len(text.encode(encoding))
+            lines += len(chunk)
+    return lines
+
+
+def generate_dataset(folder, sizes, files_per_size: int = 1, seed: int = 0):
+    """Набор файлов cutlist_YYYY-MM-DD_N.pnx всех размеров в перемешанных кодировках."""
+    os.makedirs(folder, exist_ok=True)
+    from split import load_rules
+    rules = load_rules()
+    dataset = []
+    n = 0
+    for size in sizes:
+        for _ in range(files_per_size):
+            encoding = ENCODINGS[n % len(ENCODINGS)]
+            path = os.path.join(folder, f"cutlist_2025-{n % 12 + 1:02d}-{n % 28 + 1:02d}_{n}.pnx")
+            lines = generate_pnx(path, size, encoding, rules, seed + n)
+            dataset.append({"path": path, "bytes": os.path.getsize(path), "lines": lines, "encoding": encoding})
+            n += 1
+    return dataset
+
+
+# --- замеряемые операции: func(папка с копией набора, пути файлов, workers) ---
+def _check(results):
+    """Ошибки обработки файлов возвращаются в результатах — в замере они должны быть видны."""
+    errors = [f"{os.path.basename(r['path'])}: {r['error']}" for r in results if r["error"]]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+
+def _case_read(folder, paths, workers):
+    from utils import read_file_safely
+    for path in paths:
+        read_file_safely(path)
+
+
+def _case_combine(folder, paths, workers):
+    from combine import combine_to_file
+    combine_to_file(folder, "cutlist_", ".pnx")
+
+
+def _case_split(folder, paths, workers):
+    from split import split_into_categories
+    for path in paths:
+        split_into_categories(path)
+
+
+def _case_replace(folder, paths, workers):
+    from batch import map_files
+    from replace import compile_replace_rules, replace_in_file
+    _check(map_files(replace_in_file, paths, compile_replace_rules(BENCH_REPLACE_RULES), workers=workers))
+
+
+def _case_add_date(folder, paths, workers):
+    from add_date import add_date_to_file
+    from batch import map_files
+    _check(map_files(add_date_to_file, paths, "from_filename", workers=workers))
+
+
+def _case_pipeline(folder, paths, workers):
+    from batch import map_files
+    from pipeline import process_file
+    from replace import compile_replace_rules
+    from split import compile_rules
+    _check(map_files(process_file, paths, compile_replace_rules(BENCH_REPLACE_RULES), "from_filename", "",
+                     compile_rules(), os.path.join(folder, "out"), workers=workers))
+
+
+CASES = {
+    "read_file_safely": _case_read,
+    "combine": _case_combine,
+    "split": _case_split,
+    "replace": _case_replace,
+    "add_date": _case_add_date,
+    "pipeline": _case_pipeline,
+}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # с пулом процессов (--workers) учитывается и самый "тяжёлый" из дочерних процессов
+    peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    # Linux — килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_case(name, source, work, workers, queue):
+    """Выполняется в отдельном процессе: пиковая память — только этой операции."""
+    try:
+        if os.path.exists(work):
+            shutil.rmtree(work)
+        shutil.copytree(source, work)
+        os.makedirs(os.path.join(work, "out"), exist_ok=True)
+        paths = sorted(os.path.join(work, f) for f in os.listdir(work) if f.endswith(".pnx"))
+        started = time.perf_counter()
+        CASES[name](work, paths, workers)
+        queue.put({"seconds": time.perf_counter() - started, "peak_rss_mb": _peak_rss_mb(), "error": None})
+    except Exception as e:
+        queue.put({"seconds": None, "peak_rss_mb": _peak_rss_mb(), "error": f"{type(e).__name__}: {e}"})
+
+
+def _wait_result(process, results):
+    """
+    Результат из очереди дочернего процесса. Если процесс умер, ничего не отправив
+    (например, его убили из-за нехватки памяти), — результат с ошибкой, а не вечное ожидание.
+    """
+    while True:
+        try:
+            return results.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # процесс мог успеть положить результат перед выходом
+        try:
+            return results.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            return {"seconds": None, "peak_rss_mb": None,
+                    "error": f"процесс завершился с кодом {process.exitcode}, не вернув результат"}
+
+
+def run_case(name, source, work, workers: int = 1, repeat: int = 1):
+    """Лучшее время из repeat запусков, каждый — в новом процессе на свежей копии набора."""
+    context = multiprocessing.get_context("spawn")
+    best = None
+    for _ in range(repeat):
+        results = context.Queue()
+        process = context.Process(target=_run_case, args=(name, source, work, workers, results))
+        process.start()
+        result = _wait_result(process, results)
+        process.join()
+        if result["error"] or best is None or result["seconds"] < best["seconds"]:
+            best = result
+        if result["error"]:
+            break
+    shutil.rmtree(work, ignore_errors=True)
+    return best
+
+
+def measure_startup(repeat: int = 1):
+    """
+    Холодный запуск GUI: время процесса `main.py --startup-time` до первого окна
+    (как его видит сам main) и полное время процесса. Нужен дисплей — без него ошибка.
+    """
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, main_py, "--startup-time"], capture_output=True, text=True)
+        total = time.perf_counter() - started
+        if proc.returncode != 0 or "startup_seconds=" not in proc.stdout:
+            message = (proc.stderr.strip().splitlines() or ["нет вывода"])[-1]
+            return {"seconds": None, "process_seconds": None, "error": message}
+        seconds = float(proc.stdout.split("startup_seconds=", 1)[1].split()[0])
+        if best is None or seconds < best["seconds"]:
+            best = {"seconds": round(seconds, 4), "process_seconds": round(total, 4), "error": None}
+    return best
+
+
+def run_benchmarks(sizes, files_per_size: int = 1, cases=None, workers: int = 1, repeat: int = 1,
+                   workdir=None, seed: int = 0, startup: bool = False, log=print):
+    """Генерирует набор, прогоняет операции и возвращает словарь результатов для JSON."""
+    cases = list(cases or CASES)
+    # временную папку удаляем целиком, а в папке пользователя — только созданное здесь
+    # (source/ и папки операций, их убирает run_case)
+    created = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="pnx_bench_")
+    source = os.path.join(workdir, "source")
+    try:
+        dataset = generate_dataset(source, sizes, files_per_size, seed)
+        total_bytes = sum(item["bytes"] for item in dataset)
+        total_lines = sum(item["lines"] for item in dataset)
+        log(f"Набор: {len(dataset)} файлов, {total_bytes / 1024 ** 2:.1f} МБ, {total_lines} строк")
+
+        results = {}
+        for name in cases:
+            result = run_case(name, source, os.path.join(workdir, name), workers, repeat)
+            if result["seconds"]:
+                result["lines_per_s"] = round(total_lines / result["seconds"])
+                result["mb_per_s"] = round(total_bytes / 1024 ** 2 / result["seconds"], 2)
+                result["seconds"] = round(result["seconds"], 4)
+            results[name] = result
+            log(f"{name}: {result}")
+    finally:
+        shutil.rmtree(workdir if created else source, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "repeat": repeat,
+        "dataset": {"files": len(dataset), "bytes": total_bytes, "lines": total_lines,
+                    "sizes": sizes, "encodings": sorted({item["encoding"] for item in dataset})},
+        "cases": results,
+    }
+    if startup:
+        report["startup"] = measure_startup(repeat)
+        log(f"startup: {report['startup']}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер скорости операций PNX Tool на синтетических файлах.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"размеры файлов через запятую ({DEFAULT_SIZES})")
+    parser.add_argument("--files", type=int, default=1, help="файлов каждого размера")
+    parser.add_argument("--cases", help="операции через запятую: " + ", ".join(CASES))
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1, help="запусков на операцию (берётся лучший)")
+    parser.add_argument("--workdir", help="папка для набора (по умолчанию временная; из своей папки "
+                        "удаляется только созданное бенчмарком)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup", action="store_true", help="замерить и холодный запуск окна (нужен дисплей)")
+    parser.add_argument("-o", "--output", default="bench.json")
+    args = parser.parse_args(argv)
+
+    cases = args.cases.split(",") if args.cases else None
+    unknown = set(cases or ()) - set(CASES)
+    if unknown:
+        parser.error(f"неизвестные операции: {', '.join(sorted(unknown))}")
+    report = run_benchmarks([parse_size(s) for s in args.sizes.split(",")], args.files, cases,
+                            args.workers, args.repeat, args.workdir, args.seed, args.startup)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Результаты записаны в {args.output}")
+    return 1 if any(result["error"] for result in report["cases"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# cli.py
+# Запуск без GUI (сервер, ночные задания): задания читаются из JSONL-файла или stdin,
+# по одному JSON-объекту в строке, результаты печатаются тоже построчно в JSON.
+# tkinter не импортируется — работает без дисплея.
+#
+#   {"op": "combine", "folder": "D:/cut", "search": "cutlist_", "ext": ".pnx", "incremental": true,
+#    "dedup": "files"}
+#   {"op": "split", "paths": ["D:/cut/*.pnx"], "rules": "rules.json", "streaming": null}
+#   {"op": "replace", "paths": ["a.pnx", "b.pnx"], "rules": "replace_rules.json", "mode": "auto"}
+#   {"op": "add_date", "paths": ["D:/cut/*.pnx"], "mode": "manual", "date": "2025-12-19"}
+#   {"op": "pipeline", "paths": [...], "replace_rules": ..., "date_mode": "from_filename",
+#    "split_rules": ..., "output_folder": "D:/out"}
+#   {"op": "report", "folder": "D:/cut/out", "columns": [2, 3, 4], "area_columns": [2, 3, 4]}
+#   {"op": "partition", "paths": ["D:/cut/week.pnx"], "date_field": "last", "output_folder": "D:/out",
+#    "max_open": 64}
+#   {"op": "undo", "operation": "replace"}   (или "journal": путь — см. undo.py)
+#
+# Правила — путь к JSON или сам список/словарь; без них берутся сохранённые правила.
+# Правило замены — {"old", "new"} и необязательные "column" (номер поля с 1),
+# "regex": true (old — регулярное выражение, new — шаблон с \1), "word": true (целое слово).
+# Необязательные поля любого задания: "id" (вернётся в результате), "workers", "executor";
+# "executor": "async" для combine, replace и add_date — сетевые папки: много файлов
+# читается и пишется одновременно (aio.py);
+# replace и add_date пропускают уже обработанные файлы по журналу, "ledger": false — отключить,
+# и пишут журнал отмены (путь — в "undo_journal"), "undo": false — не писать.
+# "dedup" для combine и split — выбросить повторы: "files" (только combine) — целых файлов,
+# "lines" — строк, уже бывших в предыдущих файлах (с потерями: одинаковые детали разных
+# раскроев тоже выбрасываются); сколько выброшено из каждого файла — в "duplicates" (см. dedup.py).
+# --metrics добавляет к результату задания замеры по этапам (см. metrics.py),
+# --profile FILE сохраняет статистику cProfile всего запуска.
+import argparse
+import glob
+import json
+import sys
+import time
+
+import metrics
+from batch import DEFAULT_WORKERS
+
+
+def _expand_paths(paths):
+    """Список путей задания; шаблоны вида *.pnx раскрываются."""
+    if isinstance(paths, str):
+        paths = [paths]
+    expanded = []
+    for path in paths:
+        expanded.extend(sorted(glob.glob(path)) if glob.has_magic(path) else [path])
+    return expanded
+
+
+def _load_json_value(value, default_loader):
+    """Правила задания: путь к JSON, само значение или (None) default_loader() — сохранённые."""
+    if value is None:
+        return default_loader()
+    if isinstance(value, str):
+        with open(value, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return value
+
+
+def _pool_args(job, workers):
+    return {"workers": int(job.get("workers", workers)), "executor": job.get("executor", "process")}
+
+
+def _dedup(job):
+    """dedup.Deduplicator по полю "dedup" задания или None."""
+    if not job.get("dedup"):
+        return None
+    from dedup import Deduplicator
+    return Deduplicator(job["dedup"])
+
+
+def _duplicates(dedup):
+    if dedup is None:
+        return {}
+    return {"duplicates": dedup.dropped, "duplicate_files": dedup.duplicate_files}
+
+
+def run_combine(job, workers):
+    from combine import ASYNC_READS, READ_AHEAD_WORKERS, combine_incremental, combine_to_file
+    executor = job.get("executor", "thread")
+    io_args = {"executor": executor,
+               "workers": int(job.get("workers", ASYNC_READS if executor == "async" else READ_AHEAD_WORKERS))}
+    dedup = _dedup(job)
+    try:
+        if job.get("incremental"):
+            output_file, all_files, appended, rebuilt = combine_incremental(
+                job["folder"], job["search"], job.get("ext", ".pnx"), dedup=dedup, **io_args)
+            return {"output": output_file, "files": all_files, "appended": appended, "rebuilt": rebuilt,
+                    **_duplicates(dedup)}
+        output_file, all_files = combine_to_file(job["folder"], job["search"], job.get("ext", ".pnx"),
+                                                 dedup=dedup, **io_args)
+        return {"output": output_file, "files": all_files, **_duplicates(dedup)}
+    finally:
+        if dedup is not None:
+            dedup.close()
+
+
+def run_split(job, workers):
+    from split import compile_rules, split_into_categories
+    classifier = compile_rules(_load_json_value(job.get("rules"), compile_rules))
+    dedup = _dedup(job)
+    if dedup is not None and dedup.mode != "lines":
+        raise ValueError("При разделении повторы убираются только по строкам: \"dedup\": \"lines\"")
+    files = []
+    try:
+        for path in _expand_paths(job["paths"]):
+            try:
+                created = split_into_categories(path, classifier, streaming=job.get("streaming"), dedup=dedup)
+                files.append({"path": path, "created": created, "error": None})
+            except Exception as e:
+                files.append({"path": path, "created": [], "error": str(e)})
+    finally:
+        if dedup is not None:
+            dedup.close()
+    return {"files": files, **_duplicates(dedup)}
+
+
+def _ledger(job):
+    """Журнал обработанных файлов (ledger.Ledger); "ledger": false в задании — без него."""
+    from ledger import Ledger
+    return Ledger() if job.get("ledger", True) else None
+
+
+def _journal(job, operation):
+    """Журнал отмены (undo.UndoJournal); "undo": false в задании — без него."""
+    from undo import UndoJournal
+    return UndoJournal(operation) if job.get("undo", True) else None
+
+
+def run_replace(job, workers):
+    from replace import compile_replace_rules, compiled_replace_rules, iter_replacements, replace_summary
+    mode = job.get("mode", "auto")
+    compiled = compile_replace_rules(_load_json_value(job.get("rules"), lambda: compiled_replace_rules(mode)), mode)
+    journal = _journal(job, "replace")
+    results = list(iter_replacements(compiled, _expand_paths(job["paths"]), _ledger(job), **_pool_args(job, workers),
+                                     journal=journal))
+    changed, message = replace_summary(results)
+    return {"files": results, "changed": changed, "summary": message, "undo_journal": journal and journal.path}
+
+
+def run_add_date(job, workers):
+    from add_date import DATE_RE, add_date_summary, iter_add_date
+    mode = job.get("mode", "from_filename")
+    manual_date = (job.get("date") or "").strip()
+    if mode == "manual" and not DATE_RE.fullmatch(manual_date):
+        raise ValueError("Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
+    journal = _journal(job, "add_date")
+    results = list(iter_add_date(_expand_paths(job["paths"]), mode, manual_date, _ledger(job),
+                                 **_pool_args(job, workers), journal=journal))
+    changed, message = add_date_summary(results)
+    return {"files": results, "changed": changed, "summary": message, "undo_journal": journal and journal.path}
+
+
+def run_pipeline_job(job, workers):
+    from add_date import DATE_RE
+    from batch import map_files
+    from pipeline import pipeline_summary, process_file
+    from replace import compile_replace_rules, compiled_replace_rules
+    from split import compile_rules
+    date_mode = job.get("date_mode")
+    manual_date = (job.get("date") or "").strip()
+    if date_mode == "manual" and not DATE_RE.fullmatch(manual_date):
+        raise ValueError("Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
+    # правила этапа: true — сохранённые, путь/значение — свои, нет поля — этап выключен
+    compiled_rules = classifier = None
+    if job.get("replace_rules") is not None:
+        rules = job["replace_rules"]
+        compiled_rules = compile_replace_rules(_load_json_value(None if rules is True else rules, compiled_replace_rules))
+    if job.get("split_rules") is not None:
+        rules = job["split_rules"]
+        classifier = compile_rules(_load_json_value(None if rules is True else rules, compile_rules))
+    results = map_files(process_file, _expand_paths(job["paths"]), compiled_rules, date_mode, manual_date,
+                        classifier, job.get("output_folder"), **_pool_args(job, workers))
+    processed, message = pipeline_summary(results, classifier is not None)
+    return {"files": results, "processed": processed, "summary": message}
+
+
+def run_report(job, workers):
+    from report import build_report, report_summary
+    output, results = build_report(job["folder"], job.get("ext", ".pnx"), job.get("output"),
+                                   _load_json_value(job.get("rules"), lambda: None), job.get("columns"),
+                                   job.get("area_columns"), **_pool_args(job, workers))
+    files, message = report_summary(results, output)
+    return {"output": output, "files": files, "errors": [r for r in results if r["error"]], "summary": message}
+
+
+def run_partition(job, workers):
+    from partition import DEFAULT_MAX_OPEN, partition_files, partition_summary
+    from split import compile_rules
+    classifier = compile_rules(_load_json_value(job.get("rules"), compile_rules))
+    results = partition_files(_expand_paths(job["paths"]), job.get("output_folder"), classifier,
+                              job.get("date_field"), job.get("ext"), int(job.get("max_open", DEFAULT_MAX_OPEN)))
+    return {"partitions": results, "summary": partition_summary(results)}
+
+
+def run_undo(job, workers):
+    from undo import iter_undo, latest_journal, undo_summary
+    path = job.get("journal") or latest_journal(job.get("operation"))
+    if path is None:
+        raise ValueError("Нет журналов для отмены")
+    results = list(iter_undo(path))
+    restored, message = undo_summary(results)
+    return {"journal": path, "files": results, "restored": restored, "summary": message}
+
+
+OPERATIONS = {
+    "combine": run_combine,
+    "split": run_split,
+    "replace": run_replace,
+    "add_date": run_add_date,
+    "pipeline": run_pipeline_job,
+    "report": run_report,
+    "partition": run_partition,
+    "undo": run_undo,
+}
+
+
+def run_job(job, workers: int = DEFAULT_WORKERS, measure: bool = False):
+    """
+    Выполняет одно задание и возвращает словарь результата (ошибка — в "error").
+    measure — добавить замеры по этапам в "metrics".
+    """
+    started = time.perf_counter()
+    record = {"id": job.get("id"), "op": job.get("op"), "ok": False}
+    collected = None
+    try:
+        operation = OPERATIONS.get(job.get("op"))
+        if operation is None:
+            raise ValueError(f"Неизвестная операция: {job.get('op')!r}")
+        if measure:
+            with metrics.collect(str(job.get("op"))) as collected:
+                record["result"] = operation(job, workers)
+        else:
+            record["result"] = operation(job, workers)
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    if collected is not None:
+        record["metrics"] = collected.to_dict()
+    return record
+
+
+def iter_jobs(stream):
+    """Задания из JSONL: пустые строки и строки, начинающиеся с #, пропускаются."""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            job = {"op": None, "_error": f"строка {line_no}: {e}"}
+        if not isinstance(job, dict):
+            job = {"op": None, "_error": f"строка {line_no}: задание должно быть JSON-объектом"}
+        job.setdefault("id", line_no)
+        yield job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PNX Tool без GUI: задания из JSONL, результаты в JSONL.")
+    parser.add_argument("jobs", nargs="?", default="-", help="файл заданий JSONL или '-' для stdin")
+    parser.add_argument("-o", "--output", help="куда писать результаты (по умолчанию stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"процессов на задание по умолчанию ({DEFAULT_WORKERS})")
+    parser.add_argument("--metrics", action="store_true", help="замеры по этапам в результате каждого задания")
+    parser.add_argument("--profile", metavar="FILE", help="сохранить профиль cProfile всего запуска")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    source = sys.stdin if args.jobs == "-" else open(args.jobs, "r", encoding="utf-8")
+    out = sys.stdout if not args.output else open(args.output, "w", encoding="utf-8")
+    failed = total = 0
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        for job in iter_jobs(source):
+            if "_error" in job:
+                record = {"id": job["id"], "op": None, "ok": False, "error": job["_error"], "seconds": 0.0}
+            else:
+                record = run_job(job, args.workers, args.metrics)
+            total += 1
+            failed += not record["ok"]
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+        out.write(json.dumps({"op": "summary", "jobs": total, "failed": failed,
+                              "seconds": round(time.perf_counter() - started, 4)}, ensure_ascii=False) + "\n")
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,304 @@
+import hashlib
+import json
 import os
-from tkinter import messagebox
-from utils import read_file_safely
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import metrics
+from batch import Cancelled
+from utils import EXTRA_LINE_BREAKS_RE, OUTPUT_LINESEP, decode_text, is_cp1251_bytes, normalize_newlines, read_bytes
+
+# сколько файлов читается заранее, пока пишется текущий (медленные сетевые папки)
+READ_AHEAD_WORKERS = 4
+# то же для executor="async": чтений в работе одновременно (задержка SMB, а не диск)
+ASYNC_READS = 16
+COMBINED_PREFIX = "объединено_"  # имя результата: объединено_<строка поиска><ext>
+# манифест инкрементального объединения лежит рядом с результатом: объединено_*.pnx.manifest.json
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def find_combine_inputs(folder, search_text, file_ext):
+    """Имена файлов папки с нужным расширением и строкой поиска в имени (в порядке os.listdir)."""
+    return [f for f in os.listdir(folder) if f.endswith(file_ext) and search_text in f]
+
+
+def combined_output_path(folder, search_text, file_ext):
+    return os.path.join(folder, f"{COMBINED_PREFIX}{search_text.replace(' ', '_')}{file_ext}")
+
+
+def _read_input(file_path):
+    """Ввод-вывод для одного входного файла: (байты, кодировка, запись для манифеста)."""
+    st = os.stat(file_path)
+    data, encoding = read_bytes(file_path)
+    return data, encoding, {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _combined_input(file_path, digest: bool = False):
+    """
+    Содержимое одного файла в том виде, в каком оно попадает в объединённый файл (cp1251),
+    и запись для манифеста: размер, mtime и (digest=True) хэш исходных байтов.
+    """
+    return _prepare_input(_read_input(file_path), digest)
+
+
+def _prepare_input(read_value, digest: bool = False):
+    """Вычислительная часть _combined_input над результатом _read_input."""
+    data, encoding, info = read_value
+    if digest:
+        with metrics.stage("hash"):
+            info["hash"] = hashlib.sha1(data).hexdigest()
+
+    if is_cp1251_bytes(data, encoding) and not EXTRA_LINE_BREAKS_RE.search(data):
+        # быстрый путь: файл уже в cp1251 — режем байты без декодирования
+        with metrics.stage("normalize"):
+            lines = normalize_newlines(data).rstrip(b"\n").splitlines()
+            return OUTPUT_LINESEP.join(lines) + OUTPUT_LINESEP, info
+
+    content = decode_text(data, encoding)
+    with metrics.stage("normalize"):
+        # Разбиваем на строки и убираем пустые в конце
+        lines = content.rstrip("\n").splitlines()
+        # ровно один перенос между файлами; os.linesep — как при записи в текстовом режиме
+        text = os.linesep.join(lines) + os.linesep
+        return text.encode("cp1251", errors="replace"), info
+
+
+def _iter_inputs_threads(paths, workers, cancel, digest):
+    """Входы по порядку, следующие читаются заранее в пуле потоков."""
+    paths = iter(paths)
+    read = metrics.bind(_combined_input)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(read, p, digest) for _, p in zip(range(workers * 2), paths))
+        while pending:
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    future.cancel()
+                raise Cancelled()
+            result = pending.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(pool.submit(read, next_path, digest))
+            yield result
+
+
+def _iter_inputs_async(paths, workers, cancel, digest):
+    """Входы по порядку: чтения идут одновременно через aio (workers — сколько сразу), разбор — в потоке."""
+    from aio import iter_pipeline
+    inputs = iter_pipeline(paths, _read_input, partial(_prepare_input, digest=digest),
+                           io_concurrency=workers, cancel=cancel)
+    try:
+        for result in inputs:
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            yield result
+    finally:
+        inputs.close()
+
+
+def _write_inputs(out, folder, names, workers, progress=None, cancel=None, digest: bool = False,
+                  executor: str = "thread", dedup=None):
+    """
+    Дописывает файлы names в out с текущей позиции, пока следующие читаются заранее:
+    executor="thread" — в пуле потоков (workers), "async" — через aio (до workers
+    чтений одновременно, для сетевых папок). dedup — dedup.Deduplicator: повторы
+    не записываются. Возвращает записи манифеста (имя, размер, mtime, хэш, смещение, длина).
+    """
+    workers = max(1, workers)
+    paths = [os.path.join(folder, f) for f in names]
+    iter_inputs = _iter_inputs_async if executor == "async" else _iter_inputs_threads
+    offset = out.tell()
+    entries = []
+    inputs = iter_inputs(paths, workers, cancel, digest)
+    try:
+        for name, (chunk, info) in zip(names, inputs):
+            if dedup is not None:
+                chunk = dedup.filter_chunk(name, chunk)
+            with metrics.stage("write"):
+                out.write(chunk)
+            metrics.count("bytes_written", len(chunk))
+            entries.append({"name": name, **info, "offset": offset, "length": len(chunk)})
+            offset += len(chunk)
+            if progress is not None:
+                progress(name)
+    finally:
+        inputs.close()
+    if cancel is not None and cancel.is_set() and len(entries) < len(names):
+        raise Cancelled()
+    return entries
+
+
+def _rebuild(output_file, folder, names, workers, progress, cancel, digest: bool = False, executor: str = "thread",
+             dedup=None):
+    tmp_file = output_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as out:
+            entries = _write_inputs(out, folder, names, workers, progress, cancel, digest, executor, dedup)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    return entries
+
+
+def combine_to_file(folder, search_text, file_ext, workers: int = READ_AHEAD_WORKERS,
+                    progress=None, cancel=None, executor: str = "thread", dedup=None):
+    """
+    Объединяет файлы без диалогов и возвращает (output_file, список имён файлов),
+    output_file = None, если файлов нет. Пишет сразу в файл по мере чтения, пока
+    следующие файлы читаются заранее в пуле потоков. Запись идёт во временный
+    файл, который в конце заменяет результат, — поэтому старый объединённый файл,
+    если он подходит под фильтр, читается как раньше.
+    progress(file_name) вызывается после записи каждого файла; cancel — threading.Event:
+    при остановке между файлами результат не меняется и поднимается batch.Cancelled.
+    executor="async" — для сетевых папок: до workers файлов читаются одновременно (aio.py).
+    dedup — dedup.Deduplicator: повторы строк или целых файлов выбрасываются, сколько
+    выброшено из каждого файла — в dedup.dropped.
+    """
+    all_files = find_combine_inputs(folder, search_text, file_ext)
+    if not all_files:
+        return None, []
+
+    # сохраняем только в cp1251
+    output_file = combined_output_path(folder, search_text, file_ext)
+    _rebuild(output_file, folder, all_files, workers, progress, cancel, executor=executor, dedup=dedup)
+    # результат собран заново — манифест инкрементального режима к нему больше не относится
+    if os.path.exists(manifest_path(output_file)):
+        os.remove(manifest_path(output_file))
+    return output_file, all_files
+
+
+# --- Инкрементальное объединение ---
+def manifest_path(output_file):
+    return output_file + MANIFEST_SUFFIX
+
+
+def load_manifest(output_file):
+    """Манифест объединённого файла или None, если его нет или он испорчен."""
+    try:
+        with open(manifest_path(output_file), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(output_file, entries, dedup_mode=None):
+    st = os.stat(output_file)
+    manifest = {"version": MANIFEST_VERSION, "output_size": st.st_size,
+                "output_mtime_ns": st.st_mtime_ns, "dedup": dedup_mode, "files": entries}
+    tmp_file = manifest_path(output_file) + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_file, manifest_path(output_file))
+
+
+def _unchanged_entries(manifest, output_file, folder, names, dedup_mode=None):
+    """
+    Записи манифеста, если всё уже объединённое на месте и не изменилось, иначе None.
+    Файл с тем же размером, но другим mtime проверяется по хэшу (например, его просто
+    скопировали заново); объединённый файл должен совпадать с записанным в манифест
+    и быть собран с тем же режимом повторов.
+    """
+    if manifest is None or manifest.get("dedup") != dedup_mode:
+        return None
+    try:
+        st = os.stat(output_file)
+    except OSError:
+        return None
+    if st.st_size != manifest["output_size"] or st.st_mtime_ns != manifest["output_mtime_ns"]:
+        return None
+
+    present = set(names)
+    entries = manifest["files"]
+    for entry in entries:
+        if entry["name"] not in present:
+            return None
+        path = os.path.join(folder, entry["name"])
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_size != entry["size"]:
+            return None
+        if st.st_mtime_ns != entry["mtime_ns"]:
+            with open(path, "rb") as f:
+                if hashlib.sha1(f.read()).hexdigest() != entry["hash"]:
+                    return None
+            entry["mtime_ns"] = st.st_mtime_ns
+    return entries
+
+
+def _remember_merged(dedup, output_file, entries):
+    """Уже объединённое — в dedup: новые файлы сверяются и с ним (объединённый файл читается один раз)."""
+    with open(output_file, "rb") as f:
+        for entry in entries:
+            f.seek(entry["offset"])
+            dedup.remember_chunk(entry["name"], f.read(entry["length"]))
+
+
+def combine_incremental(folder, search_text, file_ext, workers: int = READ_AHEAD_WORKERS,
+                        progress=None, cancel=None, executor: str = "thread", dedup=None):
+    """
+    Инкрементальное объединение: рядом с объединённым файлом хранится манифест
+    (имя, размер, mtime, хэш, смещение в результате) уже объединённых файлов.
+    Новые файлы дописываются в конец, остальные не читаются; полная пересборка —
+    только если объединённый файл изменился или пропал, либо кто-то из уже
+    объединённых изменился или удалён. Сам объединённый файл во входы не попадает.
+    Возвращает (output_file, все файлы, дописанные в этот раз, была ли пересборка);
+    progress/cancel/executor/dedup — как в combine_to_file, при отмене результат не меняется;
+    с dedup дописываемые файлы сверяются и с уже объединёнными.
+    """
+    output_file = combined_output_path(folder, search_text, file_ext)
+    output_name = os.path.basename(output_file)
+    all_files = [f for f in find_combine_inputs(folder, search_text, file_ext) if f != output_name]
+    if not all_files:
+        return None, [], [], False
+
+    dedup_mode = dedup.mode if dedup is not None else None
+    entries = _unchanged_entries(load_manifest(output_file), output_file, folder, all_files, dedup_mode)
+    if entries is None:
+        entries = _rebuild(output_file, folder, all_files, workers, progress, cancel, digest=True, executor=executor,
+                           dedup=dedup)
+        save_manifest(output_file, entries, dedup_mode)
+        return output_file, all_files, all_files, True
+
+    merged = {entry["name"] for entry in entries}
+    new_files = [f for f in all_files if f not in merged]
+    if new_files:
+        if dedup is not None:
+            _remember_merged(dedup, output_file, entries)
+        size = os.path.getsize(output_file)
+        with open(output_file, "r+b") as out:
+            out.seek(size)
+            try:
+                entries = entries + _write_inputs(out, folder, new_files, workers, progress, cancel, digest=True,
+                                                  executor=executor, dedup=dedup)
+            except BaseException:
+                # откатываем дописанное — объединённый файл остаётся как был
+                out.truncate(size)
+                out.close()
+                save_manifest(output_file, entries, dedup_mode)
+                raise
+    # манифест пишется и без новых файлов: могли обновиться mtime после проверки хэша
+    save_manifest(output_file, entries, dedup_mode)
+    return output_file, [entry["name"] for entry in entries], new_files, False
+
 
 def combine_files(folder, search_text, file_ext):
+    from tkinter import messagebox
+
     if not folder or not search_text or not file_ext:
         messagebox.showwarning("Ошибка", "Заполните все поля!")
         return
 
-    all_files = [f for f in os.listdir(folder) if f.endswith(file_ext) and search_text in f]
+    output_file, all_files = combine_to_file(folder, search_text, file_ext)
 
     if not all_files:
         messagebox.showinfo("Результат", "Файлы не найдены.")
         return
 
-    combined_content = ""
-    for file_name in all_files:
-        file_path = os.path.join(folder, file_name)
-        content = read_file_safely(file_path)
-        # Разбиваем на строки и убираем пустые в конце
-        lines = content.rstrip("\n").splitlines()
-        combined_content += "\n".join(lines) + "\n"  # добавляем ровно один перенос между файлами
-
-    # сохраняем только в cp1251
-    output_file = os.path.join(folder, f"объединено_{search_text.replace(' ', '_')}{file_ext}")
-    with open(output_file, "w", encoding="cp1251", errors="replace") as f:
-        f.write(combined_content)
-
     messagebox.showinfo("Готово", f"Объединено {len(all_files)} файлов в {output_file}")
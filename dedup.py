@@ -0,0 +1,247 @@
+# dedup.py
+# Повторы при объединении и разделении: один и тот же раскрой, выгруженный дважды
+# под разными именами, иначе попадает в результат два раза (и детали режутся дважды).
+#   "files" — (по умолчанию) файл, содержимое которого (после приведения переводов
+#             строк) уже встречалось, пропускается целиком; отпечаток — blake2b всего файла;
+#   "lines" — выбрасываются строки, которые уже были в ПРЕДЫДУЩИХ файлах пачки;
+#             повторы внутри одного файла и пустые строки не трогаются. Режим с потерями:
+#             одинаковая деталь из двух разных раскроев тоже выбрасывается — только
+#             для пачек, где раскрои заведомо пересекаются.
+# Строки помнятся по отпечатку (blake2b, 16 байт) с номером файла, где встретились
+# впервые: в dict, пока их не больше max_lines; дальше — во временной базе sqlite,
+# а в памяти остаётся фильтр Блума (~2 байта на строку): строки, которой нет в
+# фильтре, точно не было, а "возможно, была" проверяется по базе.
+# Всё за один проход, строки обрабатываются пачками по мере чтения.
+import hashlib
+import os
+import sqlite3
+import tempfile
+import metrics
+from utils import OUTPUT_LINESEP
+
+DEDUP_MODES = ("files", "lines")
+MAX_MEMORY_LINES = 1_000_000  # отпечатков в памяти до переноса в базу
+BLOOM_BITS_PER_LINE = 16  # при двух битах на строку ложных "возможно, была" около 1,5%
+DIGEST_SIZE = 16
+_INSERT_BATCH = 10_000
+_SELECT_BATCH = 500
+
+
+def _digest(line: bytes) -> bytes:
+    return hashlib.blake2b(line, digest_size=DIGEST_SIZE).digest()
+
+
+class LineSet:
+    """
+    Отпечатки строк (bytes) с номером файла и ограниченной памятью: add_new(lines, file_no)
+    отдаёт строки, которых не было в файлах с другим номером, и запоминает их.
+    Больше max_lines — перенос в sqlite (в folder, по умолчанию — временная папка)
+    с фильтром Блума. close() удаляет базу.
+    """
+
+    def __init__(self, max_lines: int = MAX_MEMORY_LINES, folder=None):
+        self.max_lines = max(1, max_lines)
+        self.folder = folder
+        self.spilled = False
+        self._seen = {}  # отпечаток -> номер файла, где строка встретилась впервые
+        self._db = None
+        self._db_path = None
+        self._bloom = None
+        self._mask = 0
+        self._count = 0  # строк в базе
+        self._capacity = 0  # на столько строк рассчитан фильтр
+
+    def __len__(self):
+        return self._count if self.spilled else len(self._seen)
+
+    def add_new(self, lines, file_no: int) -> list:
+        """Строки из lines, которых не было в других файлах (в порядке lines); пустые — всегда."""
+        if self.spilled:
+            return self._add_new_spilled(lines, file_no)
+        seen = self._seen
+        kept = []
+        for line in lines:
+            if not line:
+                kept.append(line)
+                continue
+            first = seen.setdefault(_digest(line), file_no)
+            if first == file_no:
+                kept.append(line)
+        if len(seen) > self.max_lines:
+            self._spill()
+        return kept
+
+    # --- перенос в базу ---
+    def _spill(self):
+        fd, self._db_path = tempfile.mkstemp(prefix="pnx_dedup_", suffix=".sqlite", dir=self.folder)
+        os.close(fd)
+        db = self._db = sqlite3.connect(self._db_path)
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("CREATE TABLE lines (digest BLOB PRIMARY KEY, file_no INTEGER) WITHOUT ROWID")
+        self._insert(self._seen)
+        self._seen = {}
+        self.spilled = True
+        self._resize_bloom(self._count * 2)
+
+    def _insert(self, first_seen):
+        """first_seen — {отпечаток: номер файла}."""
+        # по порядку ключа вставка в B-дерево идёт заметно быстрее
+        rows = [(digest, first_seen[digest]) for digest in sorted(first_seen)]
+        for start in range(0, len(rows), _INSERT_BATCH):
+            self._db.executemany("INSERT OR IGNORE INTO lines VALUES (?, ?)", rows[start:start + _INSERT_BATCH])
+        self._db.commit()
+        self._count += len(rows)
+
+    def _resize_bloom(self, capacity: int):
+        """Фильтр на capacity строк заново — по всем строкам базы (размер удваивается, итог линейный)."""
+        bits = 1 << min(32, max(16, (capacity * BLOOM_BITS_PER_LINE - 1).bit_length()))
+        self._bloom = bloom = bytearray(bits // 8)
+        self._mask = mask = bits - 1
+        self._capacity = capacity
+        for (digest,) in self._db.execute("SELECT digest FROM lines"):
+            h = int.from_bytes(digest[:8], "little")
+            a, b = h & mask, (h >> 32) & mask
+            bloom[a >> 3] |= 1 << (a & 7)
+            bloom[b >> 3] |= 1 << (b & 7)
+
+    def _known(self, digests) -> dict:
+        """Отпечаток -> номер файла для тех из digests, что уже есть в базе (запросами по _SELECT_BATCH)."""
+        found = {}
+        for start in range(0, len(digests), _SELECT_BATCH):
+            part = digests[start:start + _SELECT_BATCH]
+            query = f"SELECT digest, file_no FROM lines WHERE digest IN ({','.join('?' * len(part))})"
+            found.update(self._db.execute(query, part))
+        return found
+
+    def _add_new_spilled(self, lines, file_no: int) -> list:
+        # отпечаток уже равномерный — два бита фильтра из младших и старших 32 бит его первых 8 байт
+        bloom, mask = self._bloom, self._mask
+        new = set()  # отпечатки, впервые встреченные в этой пачке
+        digests = []
+        maybe = []  # "возможно, была" — проверить по базе
+        for line in lines:
+            if not line:
+                digests.append(None)
+                continue
+            digest = _digest(line)
+            digests.append(digest)
+            if digest in new:
+                continue
+            h = int.from_bytes(digest[:8], "little")
+            a, b = h & mask, (h >> 32) & mask
+            if bloom[a >> 3] >> (a & 7) & 1 and bloom[b >> 3] >> (b & 7) & 1:
+                maybe.append(digest)
+            else:
+                bloom[a >> 3] |= 1 << (a & 7)
+                bloom[b >> 3] |= 1 << (b & 7)
+                new.add(digest)
+        known = self._known(maybe) if maybe else {}
+        # ложное срабатывание фильтра — строка новая
+        new.update(digest for digest in maybe if digest not in known)
+        kept = [line for line, digest in zip(lines, digests)
+                if digest is None or known.get(digest, file_no) == file_no]
+        if new:
+            self._insert(dict.fromkeys(new, file_no))
+            if self._count > self._capacity:
+                self._resize_bloom(self._count * 2)
+        return kept
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            try:
+                os.remove(self._db_path)
+            except OSError:
+                pass
+        self._seen = {}
+
+
+class Deduplicator:
+    """
+    Повторы по пачке файлов (mode — см. DEDUP_MODES). Один объект на всю пачку:
+    повтором считается то, что было в предыдущих файлах; строки одного файла
+    передаются подряд (можно несколькими вызовами). После работы —
+    dropped (имя файла -> выброшено строк) и duplicate_files (имя -> имя файла
+    с тем же содержимым); см. dedup_summary.
+    """
+
+    def __init__(self, mode: str = "files", max_lines: int = MAX_MEMORY_LINES, folder=None):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Неизвестный режим повторов: {mode}")
+        self.mode = mode
+        self.dropped = {}
+        self.duplicate_files = {}
+        self._files = {}  # отпечаток содержимого -> имя первого файла
+        self._lines = LineSet(max_lines, folder) if mode == "lines" else None
+        self._name = None  # текущий файл и его номер для LineSet
+        self._file_no = 0
+
+    def _number(self, name) -> int:
+        if name != self._name:
+            self._name = name
+            self._file_no += 1
+        return self._file_no
+
+    def unique_lines(self, name, lines) -> list:
+        """Строки файла name без повторов из предыдущих файлов (режим "lines"); выброшенные — в dropped."""
+        with metrics.stage("dedup"):
+            kept = self._lines.add_new(lines, self._number(name))
+        if len(kept) != len(lines):
+            self.dropped[name] = self.dropped.get(name, 0) + len(lines) - len(kept)
+            metrics.count("duplicate_lines", len(lines) - len(kept))
+        return kept
+
+    def filter_chunk(self, name, chunk: bytes) -> bytes:
+        """
+        Содержимое файла name для объединённого файла (строки через OUTPUT_LINESEP и
+        OUTPUT_LINESEP в конце) без повторов: b"" — файл целиком повтор.
+        """
+        if self.mode == "files":
+            digest = hashlib.blake2b(chunk, digest_size=DIGEST_SIZE).digest()
+            first = self._files.setdefault(digest, name)
+            if first == name:
+                return chunk
+            self.duplicate_files[name] = first
+            self.dropped[name] = chunk.count(OUTPUT_LINESEP)
+            metrics.count("duplicate_files")
+            return b""
+        lines = chunk.split(OUTPUT_LINESEP)
+        lines.pop()  # после последнего перевода строки
+        kept = self.unique_lines(name, lines)
+        if len(kept) == len(lines):
+            return chunk
+        return OUTPUT_LINESEP.join(kept) + OUTPUT_LINESEP if kept else b""
+
+    def remember_chunk(self, name, chunk: bytes):
+        """Уже объединённое содержимое (инкрементальный режим): запомнить без подсчёта повторов."""
+        if self.mode == "files":
+            if chunk:
+                self._files.setdefault(hashlib.blake2b(chunk, digest_size=DIGEST_SIZE).digest(), name)
+            return
+        lines = chunk.split(OUTPUT_LINESEP)
+        lines.pop()
+        self._lines.add_new(lines, self._number(name))
+
+    def close(self):
+        if self._lines is not None:
+            self._lines.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def dedup_summary(dedup) -> str:
+    """Итог по повторам для сообщения пользователю (пусто, если повторов не было)."""
+    if dedup is None or not dedup.dropped:
+        return ""
+    total = sum(dedup.dropped.values())
+    lines = [f"Выброшено повторов: {total} строк в {len(dedup.dropped)} файлах:"]
+    for name, count in dedup.dropped.items():
+        first = dedup.duplicate_files.get(name)
+        lines.append(f"  {name} — {count} строк" + (f" (тот же файл, что {first})" if first else ""))
+    return "\n".join(lines)
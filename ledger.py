@@ -0,0 +1,189 @@
+# ledger.py
+# Журнал обработанных файлов: чтобы "Добавить дату" и "Замена текста" не применялись
+# к одному файлу дважды. Хранится в папке PNXTool (processed.json):
+#   files — путь -> [размер, mtime_ns, sha1 содержимого] на момент последней обработки;
+#   done  — sha1 содержимого -> отпечатки операций, которые к нему уже применены;
+#   sizes — sha1 содержимого из done -> его размер (в обработчик передаётся только
+#           содержимое того же размера, что у файлов пачки).
+# Результат операции наследует отпечатки исходного содержимого: дата, добавленная
+# до замены текста, остаётся добавленной и после неё.
+import hashlib
+import json
+import os
+from collections import deque
+from batch import iter_files
+from utils import app_data_dir, write_bytes
+
+LEDGER_FILE = os.path.join(app_data_dir(), "processed.json")
+LEDGER_VERSION = 1
+LEDGER_MAX_ENTRIES = 100_000  # сверх этого вытесняются дольше всего не использованные записи
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def fingerprint(op: str, *parts) -> str:
+    """Отпечаток операции с её параметрами (правила, режим, дата)."""
+    raw = json.dumps([op, *parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def done_key(op_fingerprint: str, digest: str) -> str:
+    return f"{op_fingerprint}:{digest}"
+
+
+def file_state(path, digest: str):
+    """[размер, mtime_ns, хэш] — снимается сразу после чтения или записи файла."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, digest]
+
+
+def save_output(result, output, digest):
+    """
+    Ввод-вывод после обработки файла: output (если не None) записывается на место
+    исходного, result["state"] — состояние файла для журнала (digest — хэш итогового содержимого).
+    """
+    path = result["path"]
+    if output is not None:
+        write_bytes(path, output)
+        result["written"] = True
+    if digest is not None:
+        result["state"] = file_state(path, digest)
+
+
+class Ledger:
+    """
+    Пропуск уже обработанных файлов. Файл, не менявшийся с последней обработки
+    (тот же размер и mtime), пропускается без открытия; изменённый или скопированный
+    читается, и его хэш сверяется в обработчике (см. параметр done у replace_in_file
+    и add_date_to_file).
+    """
+
+    def __init__(self, path: str = LEDGER_FILE):
+        self.path = path
+        self.files = {}
+        self.done = {}
+        self.sizes = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != LEDGER_VERSION:
+            return
+        self.files = data.get("files", {})
+        self.done = data.get("done", {})
+        self.sizes = data.get("sizes", {})
+        for size, _, digest in self.files.values():
+            self.sizes.setdefault(digest, size)
+
+    def save(self):
+        if not self._dirty:
+            return
+        # записи упорядочены по последнему использованию (см. _use и record)
+        for table in (self.files, self.done):
+            for key in list(table)[:max(0, len(table) - LEDGER_MAX_ENTRIES)]:
+                del table[key]
+        self.sizes = {digest: size for digest, size in self.sizes.items() if digest in self.done}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": LEDGER_VERSION, "files": self.files, "done": self.done, "sizes": self.sizes}, f)
+        os.replace(tmp_file, self.path)
+        self._dirty = False
+
+    def is_done(self, path, op_fingerprint: str) -> bool:
+        """Обработан ли файл этой операцией — только по stat, без чтения."""
+        entry = self.files.get(os.path.abspath(path))
+        if entry is None:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if [st.st_size, st.st_mtime_ns] != entry[:2] or op_fingerprint not in self.done.get(entry[2], ()):
+            return False
+        self._use(os.path.abspath(path))
+        return True
+
+    def _use(self, key):
+        """Запись файла и его содержимого — в конец очереди вытеснения."""
+        entry = self.files[key] = self.files.pop(key)
+        self.done[entry[2]] = self.done.pop(entry[2])
+        self._dirty = True
+
+    def done_keys(self, op_fingerprints, sizes=None):
+        """
+        Ключи done_key обработанного содержимого для этих операций — передаются в обработчик.
+        sizes — размеры файлов пачки: содержимое другого размера не может совпасть ни с одним
+        из них, и его ключи не передаются (размер неизвестен — передаются).
+        """
+        keys = set()
+        for digest, fps in self.done.items():
+            size = self.sizes.get(digest)
+            if sizes is not None and size is not None and size not in sizes:
+                continue
+            keys.update(done_key(fp, digest) for fp in fps if fp in op_fingerprints)
+        return frozenset(keys)
+
+    def record(self, path, op_fingerprint: str, state, source_hash=None):
+        """Файл path обработан: state — его состояние после операции, source_hash — до неё."""
+        key = os.path.abspath(path)
+        self.files.pop(key, None)
+        self.files[key] = state
+        self.sizes[state[2]] = state[0]
+        fps = self.done.pop(state[2], [])
+        for fp in self.done.get(source_hash, []) + [op_fingerprint]:
+            if fp not in fps:
+                fps.append(fp)
+        self.done[state[2]] = fps
+        self._dirty = True
+
+    def iter_files(self, func, file_paths, *args, fingerprint_of, skipped_result,
+                   workers: int = 1, executor: str = "process", cancel=None, **kwargs):
+        """
+        Как batch.iter_files, но файлы, уже обработанные с тем же отпечатком
+        fingerprint_of(path) (None — не отслеживать), сразу отдаются как skipped_result(path).
+        func получает done= — ключи для проверки по хэшу (и остальные kwargs) и возвращает
+        "state" (см. file_state) и "source_hash" — хэш содержимого до обработки.
+        Результаты — в порядке file_paths. Журнал сохраняется в конце, в том числе после отмены.
+        """
+        todo, fingerprints, sizes = [], {}, set()
+        skipped = deque()  # (сколько файлов todo было до пропущенного, путь)
+        for path in file_paths:
+            fp = fingerprint_of(path)
+            if fp is not None and self.is_done(path, fp):
+                skipped.append((len(todo), path))
+                continue
+            todo.append(path)
+            if fp is not None:
+                fingerprints[path] = fp
+                try:
+                    sizes.add(os.path.getsize(path))
+                except OSError:
+                    pass
+
+        # в обработчики (и в каждую порцию для пула процессов) — только ключи, которые
+        # могут совпасть с файлами этой пачки, а не весь журнал
+        done = self.done_keys(set(fingerprints.values()), sizes)
+        try:
+            position = 0
+            for result in iter_files(func, todo, *args, done=done, workers=workers, executor=executor,
+                                     cancel=cancel, **kwargs):
+                while skipped and skipped[0][0] == position:
+                    yield skipped_result(skipped.popleft()[1])
+                position += 1
+                fp = fingerprints.get(result["path"])
+                if fp is not None and result.get("state") and not result["error"]:
+                    self.record(result["path"], fp, result["state"], result.get("source_hash"))
+                yield result
+            # после отмены — только пропущенные до первого необработанного файла
+            while skipped and skipped[0][0] == position:
+                yield skipped_result(skipped.popleft()[1])
+        finally:
+            self.save()
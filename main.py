@@ -1,15 +1,18 @@
 import os
 import json
+import sys
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+from rules_store import DEFAULT_SPLIT_RULES, SPLIT_RULES_FILE, split_rules
+from utils import app_data_dir, ensure_app_data_dir
 
-# --- Папка для хранения данных ---
-APPDATA_DIR = os.path.join(os.environ["APPDATA"], "PNXTool")
-os.makedirs(APPDATA_DIR, exist_ok=True)
+STARTED = time.perf_counter()  # для замера времени запуска до первого окна
+
+# --- Папка для хранения данных (создаётся при первом сохранении) ---
+APPDATA_DIR = app_data_dir()
 
 LAST_VALUES_FILE = os.path.join(APPDATA_DIR, "last_values.json")
-RULES_FILE = os.path.join(APPDATA_DIR, "rules.json")
-REPLACE_RULES_FILE = os.path.join(APPDATA_DIR, "replace_rules.json")
 
 
 # --- Работа с последними значениями для объединения ---
@@ -20,37 +23,27 @@ def load_last_values():
     return {"folder": "", "search": "cutlist_", "ext": ".pnx"}
 
 
-def save_last_values(folder, search, ext):
+def save_last_values(folder, search, ext, incremental=False):
+    ensure_app_data_dir()
     with open(LAST_VALUES_FILE, "w", encoding="utf-8") as f:
-        json.dump({"folder": folder, "search": search, "ext": ext}, f, ensure_ascii=False, indent=4)
+        json.dump({"folder": folder, "search": search, "ext": ext, "incremental": incremental},
+                  f, ensure_ascii=False, indent=4)
 
 
-# --- Работа с правилами разделения ---
+# --- Работа с правилами разделения (общее хранилище с движками — rules_store) ---
 def load_rules():
-    if os.path.exists(RULES_FILE):
-        with open(RULES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    else:
-        return {
-            "тим": ["тимбер", "вуд", "лдсп"],
-            "без тим": ["синкрон", "пост"],
-            "agt": ["evosoft", "evogloss", "agt"]
-        }
+    return split_rules().load()
 
 
 def save_rules(rules):
-    with open(RULES_FILE, "w", encoding="utf-8") as f:
-        json.dump(rules, f, ensure_ascii=False, indent=4)
-    messagebox.showinfo("Сохранено", f"Правила сохранены в {RULES_FILE}")
+    split_rules().save(rules)
+    messagebox.showinfo("Сохранено", f"Правила сохранены в {SPLIT_RULES_FILE}")
 
 
 # ---------------------------
 # Вкладка 1: Объединение
 # ---------------------------
-def create_combine_tab(notebook):
-    tab = ttk.Frame(notebook)
-    notebook.add(tab, text="Объединение")
-
+def create_combine_tab(tab):
     folder_path = tk.StringVar()
     last = load_last_values()
     folder_path.set(last["folder"])
@@ -74,30 +67,90 @@ def create_combine_tab(notebook):
     file_ext_entry.grid(row=2, column=1, sticky="w", padx=5, pady=5)
     file_ext_entry.insert(0, last["ext"])
 
+    # Только новые файлы: уже объединённые пропускаются по манифесту рядом с результатом
+    incremental_var = tk.BooleanVar(value=last.get("incremental", False))
+    tk.Checkbutton(tab, text="Дописывать только новые файлы", variable=incremental_var).grid(
+        row=3, column=1, sticky="w", padx=5, pady=5
+    )
+    # сетевая папка: много файлов читается одновременно (aio.py)
+    network_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(tab, text="Сетевая папка", variable=network_var).grid(row=3, column=2, sticky="w", padx=5, pady=5)
+
+    # повторы: тот же раскрой, выгруженный дважды под разными именами (dedup.py)
+    # "lines" — с потерями: одинаковые детали разных раскроев тоже выбрасываются
+    dedup_modes = {"оставить": None, "убрать повторы файлов": "files",
+                   "убрать строки из других файлов": "lines"}
+    tk.Label(tab, text="Повторы:").grid(row=4, column=0, sticky="w", padx=5, pady=5)
+    dedup_var = tk.StringVar(value="оставить")
+    ttk.Combobox(tab, textvariable=dedup_var, values=list(dedup_modes), state="readonly", width=25).grid(
+        row=4, column=1, sticky="w", padx=5, pady=5
+    )
+
     def on_combine():
-        if not folder_path.get() or not search_entry.get() or not file_ext_entry.get():
+        folder, search, ext = folder_path.get(), search_entry.get(), file_ext_entry.get()
+        if not folder or not search or not ext:
             messagebox.showwarning("Ошибка", "Заполните все поля!")
             return
-        from combine import combine_files
-        combine_files(folder_path.get(), search_entry.get(), file_ext_entry.get())
-        save_last_values(folder_path.get(), search_entry.get(), file_ext_entry.get())
+        from background import TaskWindow
+        from combine import ASYNC_READS, READ_AHEAD_WORKERS, combine_incremental, combine_to_file, find_combine_inputs
+        from contextlib import nullcontext
+        from dedup import Deduplicator, dedup_summary
+        incremental = incremental_var.get()
+        save_last_values(folder, search, ext, incremental)
+        network = network_var.get()
+        io_args = {"workers": ASYNC_READS if network else READ_AHEAD_WORKERS,
+                   "executor": "async" if network else "thread"}
+        dedup_mode = dedup_modes[dedup_var.get()]
+
+        def with_duplicates(message, dedup):
+            summary = dedup_summary(dedup)
+            return f"{message}\n\n{summary}" if summary else message
+
+        if incremental:
+            # сколько файлов новых, заранее неизвестно — прогресс без шкалы
+            task = TaskWindow(tab.winfo_toplevel(), "Объединение")
+
+            def work():
+                with (Deduplicator(dedup_mode) if dedup_mode else nullcontext()) as dedup:
+                    output_file, all_files, appended, rebuilt = combine_incremental(
+                        folder, search, ext,
+                        progress=lambda name: task.report([f"{name}\n"]),
+                        cancel=task.cancel_event, dedup=dedup, **io_args
+                    )
+                if not all_files:
+                    return "Файлы не найдены."
+                if rebuilt:
+                    return with_duplicates(
+                        f"Объединённый файл собран заново: {len(all_files)} файлов в {output_file}", dedup)
+                return with_duplicates(f"Добавлено новых файлов: {len(appended)}, "
+                                       f"без изменений: {len(all_files) - len(appended)}. Результат: {output_file}",
+                                       dedup)
+
+            task.start(work)
+            return
+
+        task = TaskWindow(tab.winfo_toplevel(), "Объединение", total=len(find_combine_inputs(folder, search, ext)))
+
+        def work():
+            with (Deduplicator(dedup_mode) if dedup_mode else nullcontext()) as dedup:
+                output_file, all_files = combine_to_file(
+                    folder, search, ext,
+                    progress=lambda name: task.report([f"{name}\n"]),
+                    cancel=task.cancel_event, dedup=dedup, **io_args
+                )
+            if not all_files:
+                return "Файлы не найдены."
+            return with_duplicates(f"Объединено {len(all_files)} файлов в {output_file}", dedup)
 
-    tk.Button(tab, text="Объединить файлы", command=on_combine).grid(row=3, column=0, columnspan=3, pady=10)
+        task.start(work)
+
+    tk.Button(tab, text="Объединить файлы", command=on_combine).grid(row=5, column=0, columnspan=3, pady=10)
 
 
 # ---------------------------
 # Вкладка 2: Разделение
 # ---------------------------
-def create_split_tab(notebook):
-    tab = ttk.Frame(notebook)
-    notebook.add(tab, text="Разделение")
-
-    DEFAULT_RULES = {
-        "тим": ["тимбер", "вуд", "лдсп"],
-        "без тим": ["синкрон", "пост"],
-        "agt": ["evosoft", "evogloss", "agt"]
-    }
-
+def create_split_tab(tab):
     rules = load_rules()
 
     rules_text = tk.Text(tab, width=60, height=15, state=tk.NORMAL)
@@ -134,42 +187,153 @@ def create_split_tab(notebook):
             messagebox.showerror("Ошибка", f"Не удалось сохранить правила:\n{e}")
 
     def restore_defaults():
-        load_rules_to_text(DEFAULT_RULES)
-        save_rules(DEFAULT_RULES)
+        load_rules_to_text(DEFAULT_SPLIT_RULES)
+        save_rules(DEFAULT_SPLIT_RULES)
         messagebox.showinfo("Восстановлено", "Стандартные настройки восстановлены.")
 
     def on_split():
-        from split import split_file
-        split_file()
+        from background import TaskWindow
+        from split import split_into_categories, split_summary
+        file_path = filedialog.askopenfilename(
+            title="Выберите файл для разделения",
+            filetypes=[("PNX файлы", "*.pnx"), ("Все файлы", "*.*")]
+        )
+        if not file_path:
+            return
+        task = TaskWindow(tab.winfo_toplevel(), "Разделение", cancellable=False)
+        task.start(lambda: split_summary(split_into_categories(file_path)))
+
+    def on_report():
+        from background import TaskWindow
+        from batch import DEFAULT_WORKERS
+        from report import build_report, report_summary
+        folder = filedialog.askdirectory(title="Папка с файлами для сводки")
+        if not folder:
+            return
+        task = TaskWindow(tab.winfo_toplevel(), "Сводка", cancellable=False)
+
+        def work():
+            output, results = build_report(folder, workers=DEFAULT_WORKERS)
+            task.report([f"Ошибка при обработке {os.path.basename(r['path'])}: {r['error']}\n"
+                         for r in results if r["error"]], done=0)
+            return report_summary(results, output)[1]
+
+        task.start(work)
+
+    def on_partition():
+        from background import TaskWindow
+        from partition import LAST_FIELD, partition_files, partition_summary
+        file_paths = filedialog.askopenfilenames(
+            title="Файлы для разделения по категории и дате",
+            filetypes=[("PNX файлы", "*.pnx"), ("Все файлы", "*.*")]
+        )
+        if not file_paths:
+            return
+
+        dialog = tk.Toplevel(tab)
+        dialog.title("Разделить по категории и дате")
+        date_source = tk.StringVar(value="last")
+        field_number = tk.StringVar(value="")
+        tk.Label(dialog, text="Дата строки берётся:").grid(row=0, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        tk.Radiobutton(dialog, text="из последнего поля (добавлено «Добавить дату»)", variable=date_source,
+                       value="last").grid(row=1, column=0, columnspan=2, sticky="w", padx=5)
+        tk.Radiobutton(dialog, text="из имени исходного файла", variable=date_source,
+                       value="filename").grid(row=2, column=0, columnspan=2, sticky="w", padx=5)
+        tk.Radiobutton(dialog, text="из поля номер:", variable=date_source,
+                       value="field").grid(row=3, column=0, sticky="w", padx=5)
+        tk.Entry(dialog, textvariable=field_number, width=6).grid(row=3, column=1, sticky="w", padx=5)
+
+        def start():
+            source = date_source.get()
+            if source == "field":
+                number = field_number.get().strip()
+                if not (number.isdigit() and int(number) >= 1):
+                    messagebox.showwarning("Ошибка", "Номер поля — целое число от 1!")
+                    return
+                date_field = int(number)
+            else:
+                date_field = LAST_FIELD if source == "last" else None
+            output_folder = filedialog.askdirectory(title="Папка для результатов")
+            if not output_folder:
+                return
+            dialog.destroy()
+            task = TaskWindow(tab.winfo_toplevel(), "Разделение по датам", cancellable=False)
+            task.start(lambda: partition_summary(partition_files(file_paths, output_folder, date_field=date_field)))
+
+        tk.Button(dialog, text="Разделить", command=start).grid(row=4, column=0, columnspan=2, pady=10)
 
     tk.Button(btn_frame, text="Изменить", command=edit_rules).pack(side=tk.LEFT, padx=10)
     tk.Button(btn_frame, text="Сохранить", command=save_rules_button).pack(side=tk.LEFT, padx=10)
     tk.Button(btn_frame, text="Восстановить стандартные", command=restore_defaults).pack(side=tk.LEFT, padx=10)
     tk.Button(btn_frame, text="Разделить файл", command=on_split).pack(side=tk.RIGHT, padx=10)
+    tk.Button(btn_frame, text="По категории и дате", command=on_partition).pack(side=tk.RIGHT, padx=10)
+    tk.Button(btn_frame, text="Сводка по папке", command=on_report).pack(side=tk.RIGHT, padx=10)
+
+
+def undo_last_batch(root, operation):
+    """Отмена последней пачки операции operation ("replace" / "add_date") по журналу undo.py."""
+    from background import TaskWindow
+    from undo import iter_undo, journal_title, latest_journal, undo_log_lines, undo_summary
+
+    path = latest_journal(operation)
+    if path is None:
+        messagebox.showinfo("Отмена", "Нет изменений, которые можно отменить.")
+        return
+    if not messagebox.askyesno("Отмена", f"Вернуть файлы к состоянию до операции:\n{journal_title(path)}?"):
+        return
+    task = TaskWindow(root, "Отмена изменений")
+    task.run_results(lambda cancel: iter_undo(path, cancel=cancel), undo_log_lines, undo_summary)
 
 
 # ---------------------------
 # Вкладка 3: Замена текста
 # ---------------------------
-def create_replace_tab(notebook, root):
+def create_replace_tab(tab, root):
+    import re
     import tkinter as tk
     from tkinter import ttk, filedialog
-    from replace import load_replace_rules, save_replace_rules, apply_replacements_to_files, DEFAULT_REPLACE_RULES_FILE
-
-    tab = ttk.Frame(notebook)
-    notebook.add(tab, text="Замена текста")
+    from replace import (load_replace_rules, save_replace_rules, compile_replace_rules, compiled_replace_rules,
+                         iter_replacements, replace_log_lines, replace_summary, DEFAULT_REPLACE_RULES_FILE)
+    from background import TaskWindow
+    from batch import DEFAULT_WORKERS
+    from ledger import Ledger
+    from undo import UndoJournal
 
     replace_rules = load_replace_rules(DEFAULT_REPLACE_RULES_FILE)
 
-    columns = ("old", "new")
+    columns = ("old", "new", "column", "flags")
     tree = ttk.Treeview(tab, columns=columns, show="headings", height=15)
     tree.heading("old", text="Что заменить")
     tree.heading("new", text="На что заменить")
+    tree.heading("column", text="Столбец")
+    tree.heading("flags", text="Вид")
+    tree.column("column", width=70, anchor="center")
+    tree.column("flags", width=130, anchor="center")
     tree.pack(padx=10, pady=10, fill="both", expand=True)
 
+    # флаги правила в столбце "Вид": "выражение" — "regex", "слово" — "word"
+    flag_names = (("regex", "выражение"), ("word", "слово"))
+
+    def flags_text(rule):
+        return ", ".join(name for flag, name in flag_names if rule.get(flag))
+
     # --- заполняем таблицу ---
     for r in replace_rules:
-        tree.insert("", tk.END, values=(r["old"], r["new"]))
+        tree.insert("", tk.END, values=(r["old"], r["new"], r.get("column") or "", flags_text(r)))
+
+    def rules_from_tree():
+        """Правила из таблицы; столбец (номер поля с 1) и флаги — только если указаны."""
+        rules_list = []
+        for i in tree.get_children():
+            old, new, column, flags = tree.item(i, "values")
+            rule = {"old": old, "new": new}
+            if str(column).strip():
+                rule["column"] = int(column)
+            for flag, name in flag_names:
+                if name in flags:
+                    rule[flag] = True
+            rules_list.append(rule)
+        return rules_list
 
     # --- кнопки управления ---
     btn_frame = tk.Frame(tab)
@@ -181,21 +345,43 @@ def create_replace_tab(notebook, root):
         add_window.title("Добавить замену")
         tk.Label(add_window, text="Что заменить:").grid(row=0, column=0, padx=5, pady=5)
         tk.Label(add_window, text="На что заменить:").grid(row=1, column=0, padx=5, pady=5)
+        tk.Label(add_window, text="Только в столбце (пусто — вся строка):").grid(row=2, column=0, padx=5, pady=5)
         old_entry = tk.Entry(add_window, width=50)
         old_entry.grid(row=0, column=1, padx=5, pady=5)
         new_entry = tk.Entry(add_window, width=50)
         new_entry.grid(row=1, column=1, padx=5, pady=5)
+        column_entry = tk.Entry(add_window, width=6)
+        column_entry.grid(row=2, column=1, sticky="w", padx=5, pady=5)
+        regex_var = tk.BooleanVar(value=False)
+        word_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(add_window, text="Регулярное выражение (замена может ссылаться на группы: \\1)",
+                       variable=regex_var).grid(row=3, column=0, columnspan=2, sticky="w", padx=5)
+        tk.Checkbutton(add_window, text="Только целое слово", variable=word_var).grid(
+            row=4, column=0, columnspan=2, sticky="w", padx=5)
 
         def save_new():
             old = old_entry.get().strip()
             new = new_entry.get().strip()
+            column = column_entry.get().strip()
             if not old:
                 messagebox.showwarning("Ошибка", "Поле 'Что заменить' не может быть пустым!")
                 return
-            tree.insert("", tk.END, values=(old, new))
+            if column and not (column.isdigit() and int(column) >= 1):
+                messagebox.showwarning("Ошибка", "Номер столбца — целое число от 1!")
+                return
+            rule = {"old": old, "new": new, "regex": regex_var.get(), "word": word_var.get()}
+            try:
+                # выражение и шаблон замены проверяются сразу, а не при запуске замены
+                compile_replace_rules([rule]).apply("")
+                if rule["regex"]:
+                    re.compile(old).sub(new, "")
+            except (ValueError, re.error) as e:
+                messagebox.showwarning("Ошибка", str(e))
+                return
+            tree.insert("", tk.END, values=(old, new, column, flags_text(rule)))
             add_window.destroy()
 
-        tk.Button(add_window, text="Добавить", command=save_new).grid(row=2, column=0, columnspan=2, pady=10)
+        tk.Button(add_window, text="Добавить", command=save_new).grid(row=5, column=0, columnspan=2, pady=10)
 
     # --- Удаление выбранных ---
     def delete_selected():
@@ -210,19 +396,12 @@ def create_replace_tab(notebook, root):
 
     # --- Сохранение ---
     def save_all_rules():
-        rules_list = [
-            {"old": tree.item(i, "values")[0], "new": tree.item(i, "values")[1]}
-            for i in tree.get_children()
-        ]
-        save_replace_rules(rules_list, DEFAULT_REPLACE_RULES_FILE)
+        save_replace_rules(rules_from_tree(), DEFAULT_REPLACE_RULES_FILE)
         messagebox.showinfo("Сохранено", "Правила успешно сохранены.")
 
     # --- Применение ---
     def apply_replacement():
-        rules_list = [
-            {"old": tree.item(i, "values")[0], "new": tree.item(i, "values")[1]}
-            for i in tree.get_children()
-        ]
+        rules_list = rules_from_tree()
 
         file_paths = filedialog.askopenfilenames(
             title="Выберите файлы для замены",
@@ -231,29 +410,44 @@ def create_replace_tab(notebook, root):
         if not file_paths:
             return
 
-        log_window = tk.Toplevel(root)
-        log_window.title("Лог изменений")
-        log_text = tk.Text(log_window, width=100, height=30)
-        log_text.pack(padx=10, pady=10, fill="both", expand=True)
-
-        apply_replacements_to_files(rules_list, file_paths, log_text_widget=log_text)
+        # таблица совпадает с сохранёнными правилами — берём уже скомпилированный набор
+        saved = load_replace_rules(DEFAULT_REPLACE_RULES_FILE)
+        compiled = compiled_replace_rules() if rules_list == saved else compile_replace_rules(rules_list)
+        ledger = Ledger() if skip_done_var.get() else None
+        workers = workers_var.get()
+        executor = "async" if network_var.get() else "process"
+        journal = UndoJournal("replace")
+        task = TaskWindow(root, "Лог изменений", total=len(file_paths))
+        task.run_results(lambda cancel: iter_replacements(compiled, file_paths, ledger, workers=workers,
+                                                          executor=executor, cancel=cancel, journal=journal),
+                         replace_log_lines, replace_summary)
 
     # --- Кнопки ---
     tk.Button(btn_frame, text="Добавить", command=add_rule).pack(side=tk.LEFT, padx=5)
     tk.Button(btn_frame, text="Удалить выбранное", command=delete_selected).pack(side=tk.LEFT, padx=5)
     tk.Button(btn_frame, text="Сохранить правила", command=save_all_rules).pack(side=tk.LEFT, padx=5)
     tk.Button(btn_frame, text="Применить замену", command=apply_replacement).pack(side=tk.RIGHT, padx=5)
+    tk.Button(btn_frame, text="Отменить последнюю замену",
+              command=lambda: undo_last_batch(root, "replace")).pack(side=tk.RIGHT, padx=5)
+    workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+    tk.Spinbox(btn_frame, from_=1, to=64, width=4, textvariable=workers_var).pack(side=tk.RIGHT)
+    tk.Label(btn_frame, text="Процессов:").pack(side=tk.RIGHT, padx=(5, 2))
+    skip_done_var = tk.BooleanVar(value=True)
+    tk.Checkbutton(btn_frame, text="Пропускать обработанные", variable=skip_done_var).pack(side=tk.RIGHT, padx=5)
+    network_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(btn_frame, text="Сетевая папка", variable=network_var).pack(side=tk.RIGHT, padx=5)
 
 # ---------------------------
 # Вкладка 4: Добавление даты
 # ---------------------------
-def create_add_date_tab(notebook, root):
+def create_add_date_tab(tab, root):
     import tkinter as tk
     from tkinter import ttk, filedialog, messagebox
-    from add_date import append_date_to_files
-
-    tab = ttk.Frame(notebook)
-    notebook.add(tab, text="Добавить дату")
+    from add_date import DATE_RE, iter_add_date, add_date_log_lines, add_date_summary
+    from background import TaskWindow
+    from batch import DEFAULT_WORKERS
+    from ledger import Ledger
+    from undo import UndoJournal
 
     mode_var = tk.StringVar(value="from_filename")  # from_filename | manual
     manual_date_var = tk.StringVar(value="2025-12-19")
@@ -292,24 +486,245 @@ def create_add_date_tab(notebook, root):
         if not file_paths:
             return
 
-        log_window = tk.Toplevel(root)
-        log_window.title("Лог добавления даты")
-        log_text = tk.Text(log_window, width=100, height=30)
-        log_text.pack(padx=10, pady=10, fill="both", expand=True)
+        mode = mode_var.get()
+        manual_date = manual_date_var.get().strip()
+        if mode == "manual" and not DATE_RE.fullmatch(manual_date):
+            messagebox.showwarning("Ошибка", "Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
+            return
+
+        # журнал не даёт добавить ту же дату в файл второй раз
+        ledger = Ledger() if skip_done_var.get() else None
+        workers = workers_var.get()
+        executor = "async" if network_var.get() else "process"
+        journal = UndoJournal("add_date")
+        task = TaskWindow(root, "Лог добавления даты", total=len(file_paths))
+        task.run_results(lambda cancel: iter_add_date(file_paths, mode, manual_date, ledger, workers=workers,
+                                                      executor=executor, cancel=cancel, journal=journal),
+                         add_date_log_lines, add_date_summary)
+
+    run_frame = tk.Frame(tab)
+    run_frame.pack(fill="x", padx=10, pady=10)
+    tk.Button(run_frame, text="Выбрать файлы и добавить дату", command=run).pack(side=tk.RIGHT)
+    tk.Button(run_frame, text="Отменить последнее добавление",
+              command=lambda: undo_last_batch(root, "add_date")).pack(side=tk.RIGHT, padx=5)
+    workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+    tk.Spinbox(run_frame, from_=1, to=64, width=4, textvariable=workers_var).pack(side=tk.RIGHT, padx=(2, 10))
+    tk.Label(run_frame, text="Процессов:").pack(side=tk.RIGHT)
+    skip_done_var = tk.BooleanVar(value=True)
+    tk.Checkbutton(run_frame, text="Пропускать файлы, куда дата уже добавлена", variable=skip_done_var).pack(side=tk.LEFT)
+    network_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(run_frame, text="Сетевая папка", variable=network_var).pack(side=tk.LEFT, padx=5)
+
+
+# ---------------------------
+# Вкладка 5: Конвейер
+# ---------------------------
+def create_pipeline_tab(tab, root):
+    import tkinter as tk
+    from tkinter import filedialog
+    from pipeline import process_file, pipeline_log_lines, pipeline_summary
+    from add_date import DATE_RE
+    from background import TaskWindow
+    from batch import DEFAULT_WORKERS
+    from replace import compiled_replace_rules
+    from split import compile_rules
+
+    replace_var = tk.BooleanVar(value=True)
+    date_var = tk.BooleanVar(value=True)
+    split_var = tk.BooleanVar(value=True)
+    mode_var = tk.StringVar(value="from_filename")  # from_filename | manual
+    manual_date_var = tk.StringVar(value="2025-12-19")
+    output_folder = tk.StringVar()
 
-        append_date_to_files(
-            file_paths=file_paths,
-            mode=mode_var.get(),
-            manual_date=manual_date_var.get(),
-            log_text_widget=log_text
+    # --- этапы ---
+    stages_frame = tk.LabelFrame(tab, text="Этапы (каждый файл читается один раз)")
+    stages_frame.pack(fill="x", padx=10, pady=10)
+
+    tk.Checkbutton(stages_frame, text="Замена текста (сохранённые правила)", variable=replace_var).pack(anchor="w", padx=10, pady=3)
+    tk.Checkbutton(stages_frame, text="Добавить дату", variable=date_var).pack(anchor="w", padx=10, pady=3)
+
+    date_frame = tk.Frame(stages_frame)
+    date_frame.pack(fill="x", padx=30)
+    tk.Radiobutton(date_frame, text="Из имени файла", variable=mode_var, value="from_filename").pack(side=tk.LEFT)
+    tk.Radiobutton(date_frame, text="Вручную:", variable=mode_var, value="manual").pack(side=tk.LEFT, padx=(10, 0))
+    manual_entry = tk.Entry(date_frame, textvariable=manual_date_var, width=15)
+    manual_entry.pack(side=tk.LEFT, padx=8)
+
+    tk.Checkbutton(stages_frame, text="Разделение по категориям (исходные файлы не меняются)",
+                   variable=split_var).pack(anchor="w", padx=10, pady=3)
+
+    def refresh_manual_state(*_):
+        state = tk.NORMAL if date_var.get() and mode_var.get() == "manual" else tk.DISABLED
+        manual_entry.config(state=state)
+
+    mode_var.trace_add("write", refresh_manual_state)
+    date_var.trace_add("write", refresh_manual_state)
+    refresh_manual_state()
+
+    # --- папка для результатов разделения ---
+    out_frame = tk.Frame(tab)
+    out_frame.pack(fill="x", padx=10, pady=(0, 10))
+    tk.Label(out_frame, text="Папка для результатов (пусто — рядом с исходными):").pack(side=tk.LEFT)
+    tk.Entry(out_frame, textvariable=output_folder, width=30).pack(side=tk.LEFT, padx=5)
+    tk.Button(out_frame, text="Обзор", command=lambda: output_folder.set(filedialog.askdirectory())).pack(side=tk.LEFT)
+
+    # --- кнопка запуска ---
+    def run():
+        if not (replace_var.get() or date_var.get() or split_var.get()):
+            messagebox.showwarning("Внимание", "Выберите хотя бы один этап!")
+            return
+
+        file_paths = filedialog.askopenfilenames(
+            title="Выберите файлы для обработки",
+            filetypes=[("PNX файлы", "*.pnx"), ("Все файлы", "*.*")]
         )
+        if not file_paths:
+            return
+
+        date_mode = mode_var.get() if date_var.get() else None
+        manual_date = manual_date_var.get().strip()
+        if date_mode == "manual" and not DATE_RE.fullmatch(manual_date):
+            messagebox.showwarning("Ошибка", "Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
+            return
+
+        compiled_rules = compiled_replace_rules() if replace_var.get() else None
+        classifier = compile_rules() if split_var.get() else None
 
-    tk.Button(tab, text="Выбрать файлы и добавить дату", command=run).pack(padx=10, pady=10, anchor="e")
+        task = TaskWindow(root, "Лог конвейера", total=len(file_paths))
+        task.run_batch(process_file, file_paths,
+                       (compiled_rules, date_mode, manual_date, classifier, output_folder.get() or None),
+                       lambda result: pipeline_log_lines(result, date_mode),
+                       lambda results: pipeline_summary(results, classifier is not None),
+                       workers=workers_var.get())
+
+    run_frame = tk.Frame(tab)
+    run_frame.pack(fill="x", padx=10, pady=10)
+    tk.Button(run_frame, text="Выбрать файлы и запустить", command=run).pack(side=tk.RIGHT)
+    workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+    tk.Spinbox(run_frame, from_=1, to=64, width=4, textvariable=workers_var).pack(side=tk.RIGHT, padx=(2, 10))
+    tk.Label(run_frame, text="Процессов:").pack(side=tk.RIGHT)
+
+
+# ---------------------------
+# Вкладка 6: Наблюдение за папкой
+# ---------------------------
+def create_watch_tab(tab, root):
+    from add_date import DATE_RE
+    from background import TaskWindow
+    from replace import compiled_replace_rules
+    from split import compile_rules
+    from watch import WATCH_WORKERS, FolderWatch, watch_summary
+
+    watch_folder = tk.StringVar()
+    output_folder = tk.StringVar()
+    replace_var = tk.BooleanVar(value=False)
+    date_var = tk.BooleanVar(value=True)
+    split_var = tk.BooleanVar(value=True)
+
+    folders_frame = tk.Frame(tab)
+    folders_frame.pack(fill="x", padx=10, pady=10)
+    tk.Label(folders_frame, text="Папка, куда поступают файлы:").grid(row=0, column=0, sticky="w", pady=3)
+    tk.Entry(folders_frame, textvariable=watch_folder, width=40).grid(row=0, column=1, padx=5)
+    tk.Button(folders_frame, text="Обзор", command=lambda: watch_folder.set(filedialog.askdirectory())).grid(row=0, column=2)
+    tk.Label(folders_frame, text="Папка для результатов разделения:").grid(row=1, column=0, sticky="w", pady=3)
+    tk.Entry(folders_frame, textvariable=output_folder, width=40).grid(row=1, column=1, padx=5)
+    tk.Button(folders_frame, text="Обзор", command=lambda: output_folder.set(filedialog.askdirectory())).grid(row=1, column=2)
+
+    stages_frame = tk.LabelFrame(tab, text="Что делать с каждым новым файлом")
+    stages_frame.pack(fill="x", padx=10, pady=(0, 10))
+    tk.Checkbutton(stages_frame, text="Замена текста (сохранённые правила)", variable=replace_var).pack(anchor="w", padx=10, pady=3)
+    tk.Checkbutton(stages_frame, text="Добавить дату из имени файла", variable=date_var).pack(anchor="w", padx=10, pady=3)
+    tk.Checkbutton(stages_frame, text="Разделение по категориям", variable=split_var).pack(anchor="w", padx=10, pady=3)
+
+    def start():
+        folder = watch_folder.get()
+        if not folder or not os.path.isdir(folder):
+            messagebox.showwarning("Ошибка", "Выберите папку для наблюдения!")
+            return
+        if not (replace_var.get() or date_var.get() or split_var.get()):
+            messagebox.showwarning("Внимание", "Выберите хотя бы один этап!")
+            return
+        try:
+            watch = FolderWatch(
+                folder,
+                compiled_rules=compiled_replace_rules() if replace_var.get() else None,
+                date_mode="from_filename" if date_var.get() else None,
+                classifier=compile_rules() if split_var.get() else None,
+                output_folder=output_folder.get() or None,
+                workers=workers_var.get(),
+            )
+        except ValueError as e:
+            messagebox.showwarning("Ошибка", str(e))
+            return
+
+        # окно работает, пока его не остановят кнопкой "Отмена" или закрытием
+        task = TaskWindow(root, "Наблюдение за папкой")
+        watch.log = lambda line: task.report([line], done=0)
+        task.start(lambda: watch_summary(watch.run(task.cancel_event))[1])
+
+    run_frame = tk.Frame(tab)
+    run_frame.pack(fill="x", padx=10, pady=10)
+    tk.Button(run_frame, text="Начать наблюдение", command=start).pack(side=tk.RIGHT)
+    workers_var = tk.IntVar(value=WATCH_WORKERS)
+    tk.Spinbox(run_frame, from_=1, to=64, width=4, textvariable=workers_var).pack(side=tk.RIGHT, padx=(2, 10))
+    tk.Label(run_frame, text="Процессов:").pack(side=tk.RIGHT)
+
+
+# ---------------------------
+# Замеры (внизу окна, для всех вкладок)
+# ---------------------------
+def create_metrics_bar(root):
+    import metrics
+
+    settings = metrics.load_settings()
+    enabled_var = tk.BooleanVar(value=settings["enabled"])
+    profile_var = tk.BooleanVar(value=settings["profile"])
+
+    def save(*_):
+        metrics.save_settings(enabled_var.get(), profile_var.get())
+
+    bar = tk.Frame(root)
+    bar.pack(fill="x", padx=10, pady=(0, 5))
+    tk.Checkbutton(bar, text="Замеры по этапам в логе", variable=enabled_var, command=save).pack(side=tk.LEFT)
+    tk.Checkbutton(bar, text="Профиль cProfile", variable=profile_var, command=save).pack(side=tk.LEFT, padx=10)
+    startup_label = tk.Label(bar, fg="gray")
+    startup_label.pack(side=tk.RIGHT)
+    return startup_label
 
 
 # ---------------------------
 # Запуск GUI
 # ---------------------------
+def add_lazy_tabs(notebook, tabs):
+    """
+    Добавляет вкладки (название, build(frame)) пустыми; содержимое строится при первом
+    выборе вкладки — правила и модули обработки загружаются, только когда они нужны.
+    """
+    builders = {}
+    for text, build in tabs:
+        tab = ttk.Frame(notebook)
+        notebook.add(tab, text=text)
+        builders[str(tab)] = build
+
+    def on_tab_changed(_event=None):
+        selected = notebook.select()
+        build = builders.pop(selected, None)
+        if build is not None:
+            build(notebook.nametowidget(selected))
+
+    notebook.bind("<<NotebookTabChanged>>", on_tab_changed)
+    on_tab_changed()
+
+
+def report_startup(root, label, exit_after: bool = False):
+    """Время от запуска процесса (импорта main) до первого отрисованного окна."""
+    seconds = time.perf_counter() - STARTED
+    label.config(text=f"Запуск: {seconds:.2f} с")
+    if exit_after:
+        print(f"startup_seconds={seconds:.4f}")
+        root.destroy()
+
+
 def main():
     root = tk.Tk()
     root.title("PNX Tool")
@@ -318,14 +733,24 @@ def main():
     notebook = ttk.Notebook(root)
     notebook.pack(expand=True, fill="both")
 
-    create_combine_tab(notebook)
-    create_split_tab(notebook)
-    create_replace_tab(notebook, root)
-    create_add_date_tab(notebook, root)  # <-- добавили
-
+    add_lazy_tabs(notebook, [
+        ("Объединение", create_combine_tab),
+        ("Разделение", create_split_tab),
+        ("Замена текста", lambda tab: create_replace_tab(tab, root)),
+        ("Добавить дату", lambda tab: create_add_date_tab(tab, root)),
+        ("Конвейер", lambda tab: create_pipeline_tab(tab, root)),
+        ("Наблюдение", lambda tab: create_watch_tab(tab, root)),
+    ])
+    startup_label = create_metrics_bar(root)
+
+    # after_idle — после отрисовки окна; --startup-time — вывести время и выйти (bench.py)
+    exit_after = "--startup-time" in sys.argv[1:]
+    root.after_idle(lambda: root.after(0, report_startup, root, startup_label, exit_after))
     root.mainloop()
 
 
-
 if __name__ == "__main__":
+    # в собранном exe процессы пула запускаются тем же exe — иначе каждый открыл бы окно
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
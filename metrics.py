@@ -0,0 +1,235 @@
+# metrics.py
+# Необязательные замеры операций: время по этапам (чтение, определение кодировки,
+# нормализация, замены, разделение, запись), прочитанные и записанные байты, строки
+# и срабатывания правил. Пока сбор не включён (collect()), stage() и count() ничего
+# не делают, кроме проверки одной переменной.
+#
+# Активный сбор — в contextvars: у каждого потока (и задачи asyncio) свой, и сбор
+# в одном окне не смешивается с операцией, идущей параллельно в другом. Потоки,
+# которые операция запускает сама (чтение наперёд в combine, executor="thread", aio),
+# получают её сбор через bind() и пишут в тот же набор — время этапов в них
+# суммируется. Процессы пула собирают свои замеры отдельно, а batch.iter_files
+# складывает их в набор вызывающего.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+METRICS_VERSION = 1
+TOP_RULES = 10  # сколько самых частых правил показывать в логе
+
+_current = ContextVar("metrics", default=None)  # Metrics активного сбора (None — замеры выключены)
+_lock = threading.Lock()
+
+
+class Metrics:
+    """Замеры одной операции: stages[этап] = [секунды, вызовы], counters, rule_hits[правило]."""
+
+    def __init__(self, operation: str = ""):
+        self.operation = operation
+        self.started = time.time()
+        self.wall_seconds = 0.0
+        self.stages = {}
+        self.counters = {}
+        self.rule_hits = {}
+        self.profile_path = None
+
+    def add_time(self, name: str, seconds: float):
+        with _lock:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += 1
+
+    def count(self, name: str, n: int = 1):
+        with _lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def hits(self, labels_counts):
+        with _lock:
+            for label, n in labels_counts:
+                if n:
+                    self.rule_hits[label] = self.rule_hits.get(label, 0) + n
+
+    def merge(self, data: dict):
+        """Добавляет замеры из to_dict() другого набора (например, процесса пула)."""
+        with _lock:
+            for name, stage in data["stages"].items():
+                total = self.stages.setdefault(name, [0.0, 0])
+                total[0] += stage["seconds"]
+                total[1] += stage["calls"]
+            for table, other in ((self.counters, data["counters"]), (self.rule_hits, data["rule_hits"])):
+                for key, n in other.items():
+                    table[key] = table.get(key, 0) + n
+
+    def to_dict(self) -> dict:
+        with _lock:
+            data = {
+                "version": METRICS_VERSION,
+                "operation": self.operation,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": round(self.wall_seconds, 6),
+                "stages": {name: {"seconds": round(seconds, 6), "calls": calls}
+                           for name, (seconds, calls) in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "rule_hits": dict(sorted(self.rule_hits.items(), key=lambda item: -item[1])),
+            }
+        if self.profile_path:
+            data["profile"] = self.profile_path
+        return data
+
+    def summary_lines(self):
+        """Сводка для окна лога."""
+        lines = [f"--- Замеры: {self.wall_seconds:.2f} с ---\n"]
+        for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+            share = f" ({seconds / self.wall_seconds:.0%})" if self.wall_seconds else ""
+            lines.append(f"{name}: {seconds:.3f} с{share}, вызовов {calls}\n")
+        mb = {name: self.counters.get(name, 0) / 1024 ** 2 for name in ("bytes_read", "bytes_written")}
+        lines.append(f"Прочитано {mb['bytes_read']:.1f} МБ, записано {mb['bytes_written']:.1f} МБ, "
+                     f"строк {self.counters.get('lines', 0)}, файлов {self.counters.get('files', 0)}\n")
+        if self.wall_seconds and mb["bytes_read"]:
+            lines.append(f"Скорость чтения: {mb['bytes_read'] / self.wall_seconds:.1f} МБ/с\n")
+        top = sorted(self.rule_hits.items(), key=lambda item: -item[1])[:TOP_RULES]
+        if top:
+            lines.append("Срабатывания правил:\n")
+            lines += [f"  {label}: {n}\n" for label, n in top]
+        if self.profile_path:
+            lines.append(f"Профиль: {self.profile_path} (python -m pstats)\n")
+        return lines
+
+    def save(self, path=None):
+        """Пишет замеры в JSON (по умолчанию — в папку metrics настроек) и возвращает путь."""
+        if path is None:
+            path = default_path(self.operation, self.started)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def _app_data_dir():
+    # utils сам пишет замеры чтения — импорт здесь, а не в начале модуля
+    from utils import app_data_dir
+    return app_data_dir()
+
+
+def default_path(operation: str, started: float, ext: str = ".json"):
+    """Файл замеров в папке metrics настроек PNXTool: <операция>_<дата-время><ext>."""
+    name = "".join(ch if ch.isalnum() else "_" for ch in operation).strip("_") or "operation"
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+    return os.path.join(_app_data_dir(), "metrics", f"{name}_{stamp}{ext}")
+
+
+def active():
+    """Идёт ли сбор (чтобы не считать строки и т.п. впустую)."""
+    return _current.get() is not None
+
+
+def bind(func):
+    """
+    func для запуска в другом потоке с текущим сбором замеров (или без сбора, если
+    его нет). Только для потоков: для процессов пула результат не сериализуется.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return func
+
+    def bound(*args, **kwargs):
+        token = _current.set(metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return bound
+
+
+@contextmanager
+def collect(operation: str = "", profile=None):
+    """
+    Включает сбор на время блока и отдаёт Metrics. profile — путь для статистики
+    cProfile (True — рядом с JSON замеров); профилируется только текущий поток.
+    """
+    metrics = Metrics(operation)
+    token = _current.set(metrics)
+    profiler = None
+    if profile:
+        metrics.profile_path = default_path(operation, metrics.started, ".prof") if profile is True else profile
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_seconds = time.perf_counter() - started
+        _current.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(os.path.dirname(metrics.profile_path) or ".", exist_ok=True)
+            profiler.dump_stats(metrics.profile_path)
+
+
+@contextmanager
+def stage(name: str):
+    """Время блока добавляется к этапу name (если сбор включён)."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - started)
+
+
+def count(name: str, n: int = 1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(name, n)
+
+
+def rule_hits(rules, counts):
+    """Срабатывания правил замены: rules[i] — {"old", "new"[, "column", "regex", "word"]}, counts[i] — замен."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.hits((_rule_label(rule), n) for rule, n in zip(rules, counts))
+
+
+def _rule_label(rule) -> str:
+    label = f"{rule['old']} → {rule['new']}"
+    if rule.get("regex"):
+        label += " [выражение]"
+    if rule.get("word"):
+        label += " [слово]"
+    return f"{label} [столбец {rule['column']}]" if rule.get("column") else label
+
+
+def merge(data):
+    """Складывает замеры процесса пула в текущий сбор."""
+    metrics = _current.get()
+    if metrics is not None and data:
+        metrics.merge(data)
+
+
+# --- Настройки окна (переключатели внизу главного окна) ---
+def settings_path():
+    return os.path.join(_app_data_dir(), "metrics_settings.json")
+
+
+def load_settings():
+    try:
+        with open(settings_path(), "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        settings = {}
+    return {"enabled": bool(settings.get("enabled")), "profile": bool(settings.get("profile"))}
+
+
+def save_settings(enabled: bool, profile: bool):
+    path = settings_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"enabled": enabled, "profile": profile}, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,205 @@
+# partition.py
+# Разбиение по нескольким ключам за одно чтение: каждая строка попадает в файл
+# раздела (категория по правилам rules.json, дата) — "<дата> <категория><ext>".
+# Дата берётся из поля строки (например, последнего — его дописывает "Добавить дату")
+# или из имени исходного файла. Файлов-разделов может быть много, поэтому открытыми
+# держится не больше max_open: давно не использованный закрывается (LRU) и при
+# следующей записи открывается снова на дозапись.
+import argparse
+import os
+import sys
+from collections import OrderedDict
+import metrics
+from add_date import DATE_RE
+from split import FALLBACK_CATEGORY, WRITE_BUFFER_SIZE, compile_rules, extract_date_from_filename
+from utils import CP1251_WHITESPACE, EXTRA_LINE_BREAKS_RE, OUTPUT_LINESEP, detect_file_encoding, iter_line_blocks
+
+DEFAULT_MAX_OPEN = 64
+NO_DATE = "без даты"
+DATE_FROM_FILENAME = None  # date_field: None — из имени файла
+LAST_FIELD = "last"  # date_field: последнее непустое поле строки
+_BLANK = CP1251_WHITESPACE + b"\xa0"  # пустая строка — как для str.strip() после декодирования
+
+
+class WriterPool:
+    """
+    Файлы разделов с ограниченным числом открытых: при открытии max_open+1-го
+    закрывается тот, в который дольше всего не писали. Первое открытие файла
+    перезаписывает его, повторные — дописывают; строки разделяются OUTPUT_LINESEP.
+    """
+
+    def __init__(self, max_open: int = DEFAULT_MAX_OPEN):
+        self.max_open = max(1, max_open)
+        self.reopened = 0  # сколько раз файл пришлось открывать повторно
+        self._open = OrderedDict()
+        self._written = set()
+
+    def write(self, path, data: bytes):
+        writer = self._open.get(path)
+        if writer is None:
+            if len(self._open) >= self.max_open:
+                self._close(*self._open.popitem(last=False))
+            if path in self._written:
+                self.reopened += 1
+            writer = self._open[path] = open(path, "ab" if path in self._written else "wb",
+                                             buffering=WRITE_BUFFER_SIZE)
+        else:
+            self._open.move_to_end(path)
+        if path in self._written:
+            writer.write(OUTPUT_LINESEP)
+        else:
+            self._written.add(path)
+        writer.write(data)
+
+    @staticmethod
+    def _close(path, writer):
+        metrics.count("bytes_written", writer.tell())
+        writer.close()
+
+    def close(self):
+        while self._open:
+            self._close(*self._open.popitem(last=False))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _date_getter(date_field, sep):
+    """Функция строка → сырое поле с датой. date_field — номер поля с 1 или LAST_FIELD."""
+    if date_field == LAST_FIELD:
+        strip = sep + (b" \t" if isinstance(sep, bytes) else " \t")
+        return lambda line: line.rstrip(strip).rpartition(sep)[2]
+    index = int(date_field) - 1
+    if index < 0:
+        raise ValueError(f"Номер поля с датой должен быть от 1: {date_field}")
+
+    def getter(line):
+        fields = line.split(sep, index + 1)
+        return fields[index] if len(fields) > index else sep[:0]
+    return getter
+
+
+def partition_files(file_paths, output_folder=None, classifier=None, date_field=DATE_FROM_FILENAME,
+                    ext=None, max_open: int = DEFAULT_MAX_OPEN):
+    """
+    Раскладывает строки файлов по разделам (категория, дата) — файлы "<дата> <категория><ext>"
+    в output_folder (по умолчанию — папка первого файла), каждый входной файл читается один раз.
+    date_field: None — дата из имени файла, LAST_FIELD — из последнего непустого поля строки
+    (туда её дописывает add_date), число — из поля с этим номером (с 1). Строки без даты —
+    в раздел NO_DATE, пустые строки пропускаются. ext — расширение выходных файлов
+    (по умолчанию — как у первого файла).
+    Возвращает список {"path", "category", "date", "lines"} — по датам, внутри в порядке категорий.
+    """
+    file_paths = list(file_paths)
+    if not file_paths:
+        return []
+    if classifier is None:
+        classifier = compile_rules()
+    output_folder = output_folder or os.path.dirname(file_paths[0])
+    ext = os.path.splitext(file_paths[0])[1] if ext is None else ext
+    sources = {os.path.abspath(path) for path in file_paths}
+    counts = {}  # (категория, дата) → строк
+    paths = {}  # (категория, дата) → путь
+    dates = {}  # сырое поле → дата (поле повторяется тысячи раз)
+
+    def parse_date(raw):
+        date = dates.get(raw)
+        if date is None:
+            text = raw.decode("cp1251", errors="replace") if isinstance(raw, bytes) else raw
+            match = DATE_RE.search(text)
+            date = dates[raw] = match.group(0) if match else NO_DATE
+        return date
+
+    def partition_path(key):
+        path = paths.get(key)
+        if path is None:
+            category, date = key
+            path = os.path.join(output_folder, f"{date} {category}{ext}")
+            if os.path.abspath(path) in sources:
+                raise OSError(f"Не удалось записать {os.path.basename(path)}:\nимя совпадает с исходным файлом")
+            paths[key] = path
+        return path
+
+    os.makedirs(output_folder, exist_ok=True)
+    with WriterPool(max_open) as pool, metrics.stage("partition"):
+        for file_path in file_paths:
+            encoding = detect_file_encoding(file_path)
+            file_date = extract_date_from_filename(os.path.basename(file_path)) or NO_DATE
+            bytes_getter = str_getter = None
+            if date_field is not DATE_FROM_FILENAME:
+                bytes_getter, str_getter = _date_getter(date_field, b";"), _date_getter(date_field, ";")
+            with open(file_path, "rb") as f:
+                for block in iter_line_blocks(f):
+                    # \v, \f и \x1c-\x1e str.splitlines() тоже считает переводом строки — такие куски
+                    # идут через декодирование, чтобы строки делились одинаково в любой кодировке
+                    if (encoding == "cp1251" or block.isascii()) and not EXTRA_LINE_BREAKS_RE.search(block):
+                        # строки остаются байтами cp1251, декодируются только первое поле и поле даты
+                        lines = [line for line in block.splitlines() if line.strip(_BLANK)]
+                        classify, sep, date_of = classifier.classify_field_bytes, b";", bytes_getter
+                    else:
+                        text = block.decode(encoding).replace("\ufeff", "")
+                        lines = [line for line in text.splitlines() if line.strip()]
+                        classify, sep, date_of = classifier.classify_field, ";", str_getter
+                    first_fields = [line.partition(sep)[0] for line in lines]
+                    categories = {field: classify(field) for field in set(first_fields)}
+                    if date_of is None:
+                        keys = [(categories[field], file_date) for field in first_fields]
+                    else:
+                        keys = [(categories[field], parse_date(date_of(line)))
+                                for field, line in zip(first_fields, lines)]
+                    output = {}
+                    for key, line in zip(keys, lines):
+                        output.setdefault(key, []).append(line)
+                    for key, key_lines in output.items():
+                        if sep == ";":
+                            key_lines = [line.encode("cp1251", errors="replace") for line in key_lines]
+                        pool.write(partition_path(key), OUTPUT_LINESEP.join(key_lines))
+                        counts[key] = counts.get(key, 0) + len(key_lines)
+            if metrics.active():
+                metrics.count("files")
+                metrics.count("bytes_read", os.path.getsize(file_path))
+        if metrics.active():
+            metrics.count("lines", sum(counts.values()))
+            metrics.count("partition_reopened", pool.reopened)
+
+    order = {cat: i for i, cat in enumerate(list(classifier.categories) + [FALLBACK_CATEGORY])}
+    return [{"path": paths[key], "category": key[0], "date": key[1], "lines": counts[key]}
+            for key in sorted(counts, key=lambda key: (key[1] == NO_DATE, key[1], order.get(key[0], len(order))))]
+
+
+def partition_summary(results) -> str:
+    """Сообщение пользователю: строки по разделам, итог по каждой дате."""
+    if not results:
+        return "Ничего не создано — во входных файлах нет строк."
+    lines = [f"Создано {len(results)} файлов:"]
+    date = None
+    for result in results:
+        if result["date"] != date:
+            date = result["date"]
+            total = sum(r["lines"] for r in results if r["date"] == date)
+            lines.append(f"{date} — {total} строк:")
+        lines.append(f"  {result['category']} — {result['lines']} строк")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разбиение файлов PNX по категории и дате за одно чтение.")
+    parser.add_argument("paths", nargs="+", help="входные файлы")
+    parser.add_argument("-o", "--output-folder", help="папка для разделов (по умолчанию — папка первого файла)")
+    parser.add_argument("--date-field", default=None,
+                        help=f"номер поля с датой (с 1) или '{LAST_FIELD}'; без него — дата из имени файла")
+    parser.add_argument("--max-open", type=int, default=DEFAULT_MAX_OPEN, help="не больше стольких открытых файлов")
+    args = parser.parse_args(argv)
+    date_field = args.date_field
+    if date_field not in (None, LAST_FIELD):
+        date_field = int(date_field)
+    results = partition_files(args.paths, args.output_folder, date_field=date_field, max_open=args.max_open)
+    print(partition_summary(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# pipeline.py
+import os
+import re
+import metrics
+from add_date import append_date_to_content, extract_date_from_filename, normalized_content
+from batch import map_files
+from replace import compile_replace_rules, replace_content
+from split import compile_rules, output_prefix, split_bytes, write_split_outputs
+from utils import read_bytes, to_output_bytes, write_bytes
+
+
+def process_file(path, compiled_rules=None, date_mode=None, manual_date: str = "",
+                 classifier=None, output_folder=None):
+    """
+    Проводит один файл через включённые этапы за одно чтение:
+    нормализация → замена (compiled_rules) → дата (date_mode) → разделение (classifier).
+    С разделением исходный файл не меняется — строки пишутся сразу в файлы категорий
+    (в output_folder или рядом с исходным). Без разделения изменённый текст
+    записывается обратно в исходный файл один раз.
+    Возвращает словарь с результатом для лога (ошибка — в "error"), подходит для пула процессов.
+    """
+    result = {"path": path, "replacements": [], "date": None, "dated_lines": 0,
+              "created": [], "written": False, "error": None}
+    try:
+        _process_file(result, compiled_rules, date_mode, manual_date, classifier, output_folder)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def _process_file(result, compiled_rules, date_mode, manual_date, classifier, output_folder):
+    path = result["path"]
+    filename = os.path.basename(path)
+    data, encoding = read_bytes(path)
+    original = content = None
+
+    if compiled_rules is not None:
+        original, content, counts = replace_content(compiled_rules, data, encoding)
+        result["replacements"] = [(rule["old"], rule["new"], count)
+                                  for rule, count in zip(compiled_rules.rules, counts) if count > 0]
+
+    if date_mode:
+        date_str = extract_date_from_filename(filename) if date_mode == "from_filename" else manual_date
+        if date_str:
+            if content is None:
+                original = content = normalized_content(data, encoding)
+            with metrics.stage("add_date"):
+                content, result["dated_lines"] = append_date_to_content(content, date_str)
+            result["date"] = date_str
+
+    changed = content is not None and content != original
+    if changed:
+        if isinstance(content, str):
+            content = content.encode("cp1251", errors="replace")
+        # дальше работаем с тем, что записали бы промежуточные этапы
+        data, encoding = content, "cp1251"
+
+    if classifier is None:
+        if changed:
+            write_bytes(path, to_output_bytes(data))
+            result["written"] = True
+        return
+
+    base_name, ext = os.path.splitext(filename)
+    folder = output_folder or os.path.dirname(path)
+    result["created"] = write_split_outputs(split_bytes(data, encoding, classifier),
+                                            folder, output_prefix(base_name), ext)
+
+
+def pipeline_log_lines(result, date_mode):
+    """Строки лога по результату process_file — в том же виде, что на отдельных вкладках."""
+    filename = os.path.basename(result["path"])
+    if result["error"]:
+        return [f"Ошибка при обработке {filename}: {result['error']}\n"]
+    lines = [f"{filename}: '{old}' → '{new}' ({count} замен)\n" for old, new, count in result["replacements"]]
+    if result["date"]:
+        lines.append(f"{filename}: добавлена дата {result['date']} в {result['dated_lines']} строк\n")
+    elif date_mode == "from_filename":
+        lines.append(f"{filename}: дата YYYY-MM-DD не найдена в имени — пропущена\n")
+    for out_path, count in result["created"]:
+        lines.append(f"{filename}: {os.path.basename(out_path)} — {count} строк\n")
+    return lines
+
+
+def pipeline_summary(results, split_enabled: bool):
+    """Итог пачки: (количество обработанных файлов, текст итогового сообщения)."""
+    ok = [result for result in results if not result["error"]]
+    if split_enabled:
+        created = sum(len(result["created"]) for result in ok)
+        return len(ok), f"Обработано файлов: {len(ok)}. Создано файлов: {created}"
+    return len(ok), f"Обработано файлов: {len(ok)}"
+
+
+def run_pipeline(file_paths, replace_rules=None, date_mode=None, manual_date: str = "",
+                 split_rules=None, output_folder=None, log_text_widget=None,
+                 workers: int = 1, executor: str = "process"):
+    """
+    Конвейер "Замена текста" → "Добавить дату" → "Разделение" за один проход по файлу.
+    Этап выключен, если его параметр None: replace_rules — правила замены,
+    date_mode — "from_filename" | "manual", split_rules — правила разделения.
+    workers > 1 — файлы обрабатываются параллельно (см. batch.map_files).
+    Возвращает количество обработанных файлов.
+    """
+    from tkinter import messagebox
+
+    if not file_paths:
+        messagebox.showwarning("Внимание", "Файлы не выбраны!")
+        return 0
+
+    if date_mode == "manual":
+        manual_date = (manual_date or "").strip()
+        if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", manual_date):
+            messagebox.showwarning("Ошибка", "Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
+            return 0
+
+    compiled_rules = compile_replace_rules(replace_rules) if replace_rules is not None else None
+    classifier = compile_rules(split_rules) if split_rules is not None else None
+
+    results = map_files(process_file, file_paths, compiled_rules, date_mode, manual_date,
+                        classifier, output_folder, workers=workers, executor=executor)
+
+    if log_text_widget:
+        for result in results:
+            for line in pipeline_log_lines(result, date_mode):
+                log_text_widget.insert("end", line)
+
+    processed, message = pipeline_summary(results, classifier is not None)
+    messagebox.showinfo("Готово", message)
+    return processed
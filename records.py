@@ -0,0 +1,148 @@
+# records.py
+# Разбор PNX в столбцы: строка файла — запись, поля через ';' — столбцы.
+# Каждый столбец хранит словарь различных значений и массив кодов (array('I')),
+# поэтому повторяющиеся названия материалов лежат в памяти один раз, а операции
+# над столбцом (замена, классификация, суммы) выполняются по словарю, а не по строкам.
+# Обратная сборка восстанавливает текст без потерь (включая короткие строки и переводы строк).
+from array import array
+from collections import Counter
+from itertools import repeat, zip_longest
+from utils import decode_text, read_bytes
+
+FIELD_SEP = ";"
+ABSENT = 0  # код "поля нет" — строка короче столбца; пустое поле — это код значения ""
+
+
+class Column:
+    """Столбец: values[code] — значение (values[0] = None — поля нет), codes[row] — код строки."""
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+
+    @classmethod
+    def from_values(cls, values):
+        distinct = dict.fromkeys(values)
+        distinct.pop(None, None)
+        index = {None: ABSENT}
+        index.update(zip(distinct, range(1, len(distinct) + 1)))
+        return cls(list(index), array("I", map(index.__getitem__, values)))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def decoded(self):
+        """Значения по строкам (None — поля нет)."""
+        values = self.values
+        return [values[c] for c in self.codes]
+
+    def counts(self):
+        """Сколько строк у каждого кода: counts()[code]."""
+        counter = Counter(self.codes)
+        return [counter.get(code, 0) for code in range(len(self.values))]
+
+    def map_values(self, func):
+        """
+        Заменяет каждое различное значение на func(value) (отсутствующие поля не трогаются).
+        Совпавшие после замены значения объединяются в один код. Возвращает True, если что-то изменилось.
+        """
+        return self.set_values([None] + [func(v) for v in self.values[1:]])
+
+    def set_values(self, new_values):
+        """То же, но новые значения даны списком в порядке кодов (new_values[0] — None)."""
+        if new_values == self.values:
+            return False
+        index = {None: ABSENT}
+        remap = array("I", [index.setdefault(v, len(index)) for v in new_values])
+        self.codes = array("I", [remap[c] for c in self.codes])
+        self.values = list(index)
+        return True
+
+
+class PnxTable:
+    """
+    Файл PNX в виде столбцов. widths[row] — число полей в строке, newline — перевод
+    строк файла, final_newline — заканчивается ли файл переводом строки.
+    to_text() возвращает ровно тот текст, из которого таблица построена.
+    """
+
+    def __init__(self, columns, widths, newline: str = "\n", final_newline: bool = True, encoding=None):
+        self.columns = columns
+        self.widths = widths
+        self.newline = newline
+        self.final_newline = final_newline
+        self.encoding = encoding
+
+    @classmethod
+    def from_text(cls, text: str, encoding=None):
+        # \r\n — только если в файле нет одиночных \n, иначе \r остаётся частью последнего поля
+        newline = "\r\n" if "\r\n" in text and text.count("\n") == text.count("\r\n") else "\n"
+        final_newline = text.endswith(newline)
+        body = text[:-len(newline)] if final_newline else text
+        lines = body.split(newline) if body or final_newline else []
+        separators = set(map(str.count, lines, repeat(FIELD_SEP)))
+        if len(separators) == 1:
+            # обычный случай — во всех строках одинаковое число полей: режем текст целиком
+            width = separators.pop() + 1
+            fields = body.replace(newline, FIELD_SEP).split(FIELD_SEP)
+            widths = array("I", [width]) * len(lines)
+            columns = [Column.from_values(fields[j::width]) for j in range(width)]
+        else:
+            rows = [line.split(FIELD_SEP) for line in lines]
+            widths = array("I", map(len, rows))
+            columns = [Column.from_values(values) for values in zip_longest(*rows)]
+        return cls(columns, widths, newline, final_newline, encoding)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, encoding: str):
+        """Таблица из байт файла; переводы строк сохраняются как в файле."""
+        return cls.from_text(data.decode(encoding), encoding)
+
+    @classmethod
+    def read(cls, path):
+        """Читает файл (кодировка определяется как в utils.read_bytes)."""
+        return cls.from_bytes(*read_bytes(path))
+
+    @classmethod
+    def from_normalized(cls, data: bytes, encoding: str):
+        """Таблица из текста с нормализованными переводами строк — как его видят остальные инструменты."""
+        return cls.from_text(decode_text(data, encoding), encoding)
+
+    def __len__(self):
+        return len(self.widths)
+
+    @property
+    def n_columns(self) -> int:
+        return len(self.columns)
+
+    def column(self, index: int) -> Column:
+        """Столбец по номеру с нуля (пустой, если в файле нет такого поля)."""
+        if index < len(self.columns):
+            return self.columns[index]
+        return Column([None], array("I", [ABSENT]) * len(self))
+
+    def row(self, row: int):
+        return [column[row] for column in self.columns[:self.widths[row]]]
+
+    def rows(self):
+        """Поля строк — списками, по порядку."""
+        decoded = [column.decoded() for column in self.columns]
+        for width, fields in zip(self.widths, zip(*decoded)):
+            yield list(fields[:width])
+
+    def lines(self):
+        return [FIELD_SEP.join(fields) for fields in self.rows()]
+
+    def to_text(self) -> str:
+        text = self.newline.join(self.lines())
+        return text + self.newline if self.final_newline else text
+
+    def to_bytes(self, encoding=None) -> bytes:
+        return self.to_text().encode(encoding or self.encoding or "cp1251", errors="replace")
+
+    def write(self, path, encoding=None):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes(encoding))
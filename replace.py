@@ -1,27 +1,28 @@
 # replace.py
-import json
 import os
-from tkinter import messagebox
-from utils import read_file_safely
+import re
+from functools import lru_cache
+from itertools import groupby
+import metrics
+from batch import FileOperation, iter_files
+from ledger import content_hash, done_key, fingerprint
+from records import PnxTable
+from rules_store import REPLACE_RULES_FILE as DEFAULT_REPLACE_RULES_FILE, replace_rules
+from utils import decode_text, is_cp1251_bytes, normalize_newlines, to_output_bytes
 
-# --- Папка для хранения ---
-APPDATA_DIR = os.path.join(os.environ["APPDATA"], "PNXTool")
-os.makedirs(APPDATA_DIR, exist_ok=True)
 
-DEFAULT_REPLACE_RULES_FILE = os.path.join(APPDATA_DIR, "replace_rules.json")
-
-
-# ---------- Работа с правилами ----------
+# ---------- Работа с правилами (кэш и сохранение — rules_store) ----------
 def load_replace_rules(file_path: str = DEFAULT_REPLACE_RULES_FILE):
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    return replace_rules(file_path).load()
 
 
 def save_replace_rules(rules, file_path: str = DEFAULT_REPLACE_RULES_FILE):
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(rules, f, ensure_ascii=False, indent=4)
+    replace_rules(file_path).save(rules)
+
+
+def compiled_replace_rules(mode: str = "auto", file_path: str = DEFAULT_REPLACE_RULES_FILE):
+    """Сохранённые правила, скомпилированные один раз — до следующего изменения файла."""
+    return replace_rules(file_path).compiled(mode)
 
 
 # ---------- Вспомогательные функции ----------
@@ -35,55 +36,662 @@ def _normalize_text(s: str) -> str:
     return s
 
 
+# ---------- Компиляция правил ----------
+# Режимы применения правил:
+#   "sequential"  — как раньше: правило N видит результат правила N-1
+#                   (отдельный проход по тексту на каждое правило);
+#   "single_pass" — все правила ищутся за один проход по тексту, на каждой позиции
+#                   берётся самое длинное совпадение, замены друг друга не видят;
+#   "auto"        — по умолчанию: single_pass, но если правила могут видеть замены
+#                   друг друга или их совпадения в конкретном тексте перекрываются,
+#                   этот текст обрабатывается как sequential. Результат и счётчики
+#                   всегда совпадают с sequential.
+REPLACE_MODES = ("auto", "single_pass", "sequential")
+
+
+def _trie_node_pattern(node: dict) -> str:
+    branches = [re.escape(ch) + _trie_node_pattern(child)
+                for ch, child in sorted((k, v) for k, v in node.items() if k is not None)]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if None in node:
+        # слово может закончиться здесь — жадный "?" сначала пробует продолжение подлиннее
+        body = "(?:" + body + ")?"
+    return body
+
+
+def _trie_pattern(words):
+    """
+    Собирает из литералов регулярное выражение в форме префиксного дерева
+    (эквивалент автомата Ахо-Корасик для поиска слева направо): весь набор слов
+    ищется за один проход, на каждой позиции находится самое длинное слово.
+    Поддерживает и str, и bytes.
+    """
+    is_bytes = isinstance(words[0], bytes)
+    trie = {}
+    for word in words:
+        if is_bytes:
+            word = word.decode("latin-1")
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[None] = True
+    pattern = _trie_node_pattern(trie)
+    return re.compile(pattern.encode("latin-1") if is_bytes else pattern)
+
+
+def _rules_chain(rules) -> bool:
+    """
+    True, если правило может увидеть результат одного из предыдущих: замена
+    пустая (склеивает соседний текст) или содержит символы, из которых состоит
+    образец одного из следующих правил.
+    """
+    later_chars = set()
+    for rule in reversed(rules):
+        if later_chars and (not rule["new"] or later_chars.intersection(rule["new"])):
+            return True
+        later_chars.update(rule["old"])
+    return False
+
+
+def _overlap_offsets(olds):
+    """
+    Для каждого образца — смещения внутри него, с которых может начинаться другой
+    образец (перекрытие совпадений). Смещение 0 означает, что внутри есть более
+    короткий образец с тем же началом. Только по этим смещениям однопроходный
+    результат может разойтись с последовательным.
+    """
+    old_set = set(olds)
+    prefix_owners = {}
+    for old in old_set:
+        for k in range(1, len(old) + 1):
+            prefix_owners.setdefault(old[:k], set()).add(old)
+
+    offsets = {}
+    for old in old_set:
+        risky = []
+        if any(old[:m] in old_set for m in range(1, len(old))):
+            risky.append(0)
+        for k in range(1, len(old)):
+            tail = old[k:]
+            if prefix_owners.get(tail, {old}) - {old} or any(tail[:m] in old_set for m in range(1, len(tail) + 1)):
+                risky.append(k)
+        if risky:
+            offsets[old] = tuple(risky)
+    return offsets
+
+
+class CompiledReplaceRules:
+    """
+    Набор правил замены, подготовленный один раз для многих файлов.
+    apply() возвращает новый текст и список количеств замен по каждому правилу
+    (в порядке self.rules).
+    """
+
+    def __init__(self, rules, mode: str = "auto"):
+        if mode not in REPLACE_MODES:
+            raise ValueError(f"Неизвестный режим замены: {mode}")
+        rules = [{"old": (r.get("old") or "").strip(), "new": (r.get("new") or "").strip()}
+                 for r in rules if (r.get("old") or "").strip()]
+        # auto и sequential дают одинаковый результат — для журнала это одна операция
+        self.fingerprint = fingerprint("replace", rules, mode == "single_pass")
+        if mode == "auto" and _rules_chain(rules):
+            mode = "sequential"
+        self._build(rules, mode)
+
+    def _build(self, rules, mode):
+        self.rules = rules
+        self.mode = mode
+        self._encoded = {}
+        self._pattern = None
+        self._index = {}
+        self._offsets = {}
+        if self.rules and mode != "sequential":
+            for i, rule in enumerate(self.rules):
+                self._index.setdefault(rule["old"], i)
+            self._pattern = _trie_pattern(list(self._index))
+            if mode == "auto":
+                self._offsets = _overlap_offsets(list(self._index))
+
+    def encoded(self, encoding: str = "cp1251"):
+        """
+        Тот же набор правил для работы с байтами в этой кодировке (побайтная замена
+        без декодирования файла) или None, если какое-то правило в ней непредставимо.
+        """
+        if encoding not in self._encoded:
+            try:
+                rules = [{"old": r["old"].encode(encoding), "new": r["new"].encode(encoding)} for r in self.rules]
+            except UnicodeEncodeError:
+                self._encoded[encoding] = None
+            else:
+                copy = object.__new__(CompiledReplaceRules)
+                copy._build(rules, self.mode)
+                self._encoded[encoding] = copy
+        return self._encoded[encoding]
+
+    def _apply_sequential(self, content):
+        counts = [0] * len(self.rules)
+        for i, rule in enumerate(self.rules):
+            count = content.count(rule["old"])
+            if count > 0:
+                content = content.replace(rule["old"], rule["new"])
+                counts[i] = count
+        return content, counts
+
+    def apply(self, content):
+        """content — str или bytes (для набора из encoded())."""
+        if not self.rules:
+            return content, []
+        if self.mode == "sequential":
+            return self._apply_sequential(content)
+
+        rules, index, offsets = self.rules, self._index, self._offsets
+        counts = [0] * len(rules)
+        risky = []
+
+        def substitute(m):
+            old = m.group()
+            i = index[old]
+            counts[i] += 1
+            if old in offsets:
+                risky.append((m.start(), offsets[old]))
+            return rules[i]["new"]
+
+        result = self._pattern.sub(substitute, content)
+
+        # auto: если совпадения в этом тексте действительно перекрываются,
+        # порядок правил важен — повторяем последовательно
+        match = self._pattern.match
+        for start, risky_offsets in risky:
+            for k in risky_offsets:
+                if k == 0 or match(content, start + k):
+                    return self._apply_sequential(content)
+        return result, counts
+
+
+# ---------- Правила-шаблоны: регулярные выражения и целые слова ----------
+# "regex": true — old это регулярное выражение Python, new — шаблон замены re.sub (\\1, \\g<name>);
+# "word": true — совпадение только целым словом (литерал или выражение).
+# Выражения компилируются один раз (кэш на процесс). Подряд идущие правила-шаблоны
+# ищутся одним общим выражением-альтернативой, если это не меняет результата
+# (см. _mergeable_run), иначе — по очереди, каждое своим выражением.
+PATTERN_CACHE_SIZE = 1024
+_MAX_RANGE = 512  # диапазон [а-я] разворачивается в набор символов, если он не длиннее
+_WORD_RE = re.compile(r"\w")
+_TEMPLATE_REF_RE = re.compile(r"\\(?:\d|g<)")
+_GLOBAL_FLAGS_RE = re.compile(r"\(\?([aiLmsux]+)\)")
+_REPEAT_RE = re.compile(r"\{(?:\d+|\d*,\d*)\}")  # {n}, {m,n}, {,n}, {m,}; "{}" и прочее — литералы
+
+
+def _rule_flags(rule):
+    return bool(rule.get("regex")), bool(rule.get("word"))
+
+
+def _pattern_source(old: str, regex: bool, word: bool) -> str:
+    source = old if regex else re.escape(old)
+    if word:
+        source = rf"(?<!\w)(?:{_scoped_source(source)})(?!\w)"
+    return source
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _compile_pattern(source: str):
+    try:
+        return re.compile(source)
+    except re.error as e:
+        raise ValueError(f"Неверное регулярное выражение {source!r}: {e}") from e
+
+
+def _escaped_char(source: str, i: int):
+    """Символ после "\\" на позиции i или None: \\d, \\w, \\1, \\b и прочие буквенные — не литералы."""
+    if i + 1 >= len(source) or source[i + 1].isalnum():
+        return None
+    return source[i + 1]
+
+
+def _class_item(source: str, i: int):
+    ch = source[i]
+    if ch == "\\":
+        return _escaped_char(source, i), i + 2
+    if ch == "[":
+        return None, i
+    return ch, i + 1
+
+
+def _class_chars(source: str, i: int):
+    """
+    Набор [...] с позиции i (сразу после "["): (позиция после "]", его символы) или
+    (i, None) — отрицание, классы \\w/\\d, вложенные наборы, длинные диапазоны.
+    """
+    chars = set()
+    n = len(source)
+    if i < n and source[i] == "^":
+        return i, None
+    first = True
+    while i < n and (source[i] != "]" or first):  # "]" сразу после "[" — литерал
+        first = False
+        low, i = _class_item(source, i)
+        if low is None:
+            return i, None
+        if i + 1 < n and source[i] == "-" and source[i + 1] != "]":
+            high, i = _class_item(source, i + 1)
+            if high is None or not 0 <= ord(high) - ord(low) <= _MAX_RANGE:
+                return i, None
+            chars.update(map(chr, range(ord(low), ord(high) + 1)))
+        else:
+            chars.add(low)
+    if i >= n:
+        return i, None
+    return i + 1, chars
+
+
+def _match_chars(old: str, regex: bool):
+    """
+    Символы, из которых может состоять совпадение правила, или None — "неизвестно".
+    Разбираются только простые выражения: литералы, экранированные знаки, наборы [...]
+    без отрицания, группы (...) и (?:...), "|" и квантификаторы. Точка, якоря, классы
+    \\w/\\d, обратные ссылки, просмотр вперёд и назад, именованные группы и флаги (?i) —
+    None: такие правила применяются только по очереди.
+    """
+    if not regex:
+        return set(old) or None
+    chars = set()
+    i, n = 0, len(old)
+    while i < n:
+        ch = old[i]
+        if ch == "\\":
+            ch = _escaped_char(old, i)
+            if ch is None:
+                return None
+            chars.add(ch)
+            i += 2
+        elif ch == "[":
+            i, class_chars = _class_chars(old, i + 1)
+            if class_chars is None:
+                return None
+            chars |= class_chars
+        elif ch == "(":
+            if old.startswith("(?", i):
+                if not old.startswith("(?:", i):
+                    return None
+                i += 3
+            else:
+                i += 1
+        elif ch in ")|*+?":
+            i += 1
+        elif ch == "{" and _REPEAT_RE.match(old, i):
+            i = _REPEAT_RE.match(old, i).end()
+        elif ch in ".^$":
+            return None
+        else:
+            chars.add(ch)
+            i += 1
+    return chars or None
+
+
+def _replacement_chars(rule, chars):
+    """Символы, которые может дать замена правила с совпадениями из chars."""
+    new = rule["new"]
+    if rule.get("regex") and _TEMPLATE_REF_RE.search(new):
+        return set(new) | chars
+    return set(new)
+
+
+def _same_word_class(chars) -> bool:
+    """Все символы — буквенно-цифровые или все не такие: границы слов вокруг замены не сдвигаются."""
+    kinds = {bool(_WORD_RE.match(ch)) for ch in chars}
+    return len(kinds) <= 1
+
+
+def _mergeable_run(rules, patterns) -> bool:
+    """
+    Можно ли искать правила одним выражением так, чтобы результат и счётчики совпали
+    с поочерёдным применением. Достаточное условие: все выражения простые (_match_chars),
+    не дают пустых совпадений, совпадения разных правил не делят символов
+    (не перекрываются), замена правила не содержит символов, из которых состоят
+    совпадения следующих, и не пустая; для правил "word" замены не меняют
+    "буквенность" соседних символов.
+    """
+    char_sets = [_match_chars(rule["old"], rule.get("regex", False)) for rule in rules]
+    if any(chars is None for chars in char_sets) or any(p.fullmatch("") for p in patterns):
+        return False
+    for j in range(1, len(rules)):
+        for i in range(j):
+            produced = _replacement_chars(rules[i], char_sets[i])
+            if not produced or char_sets[i] & char_sets[j] or produced & char_sets[j]:
+                return False
+            if rules[j].get("word") and not _same_word_class(char_sets[i] | produced):
+                return False
+    return True
+
+
+def _scoped_source(source: str) -> str:
+    """(?i)выражение → (?i:выражение): глобальные флаги нельзя ставить внутри альтернативы."""
+    match = _GLOBAL_FLAGS_RE.match(source)
+    if match:
+        return f"(?{match.group(1)}:{source[match.end():]})"
+    return source
+
+
+class PatternReplaceRules:
+    """
+    Правила-шаблоны одной области (вся строка или один столбец), apply() — как у
+    CompiledReplaceRules. mode: "sequential" — каждое правило своим проходом;
+    "single_pass" — все одним выражением (замены друг друга не видят, на каждой позиции
+    срабатывает первое по порядку правило); "auto" — одним выражением, только если
+    результат совпадает с поочерёдным (_mergeable_run).
+    """
+
+    def __init__(self, rules, mode: str = "auto"):
+        self.rules = rules
+        self.mode = mode
+        self._patterns = [_compile_pattern(_pattern_source(r["old"], *_rule_flags(r))) for r in rules]
+        self._templates = [r.get("regex", False) and "\\" in r["new"] for r in rules]
+        self._merged = None
+        if len(rules) > 1 and mode != "sequential":
+            self._merged = self._merge(mode)
+
+    def _merge(self, mode):
+        if mode == "auto":
+            if not _mergeable_run(self.rules, self._patterns):
+                return None
+        groups = {}
+        parts = []
+        group = 1
+        for i, pattern in enumerate(self._patterns):
+            if "(?P=" in pattern.pattern or re.search(r"\\\d", pattern.pattern):
+                return None  # обратные ссылки ломаются при сдвиге номеров групп
+            groups[group] = i
+            parts.append(f"({_scoped_source(pattern.pattern)})")
+            group += pattern.groups + 1
+        try:
+            merged = _compile_pattern("|".join(parts))
+        except ValueError:
+            return None
+        return merged, groups
+
+    def encoded(self, encoding: str = "cp1251"):
+        # \w и границы слов в байтах работают иначе — только по тексту
+        return None
+
+    def _replacement(self, i, match):
+        if not self._templates[i]:
+            return self.rules[i]["new"]
+        return match.expand(self.rules[i]["new"])
+
+    def apply(self, content: str):
+        counts = [0] * len(self.rules)
+        if self._merged is None:
+            for i, pattern in enumerate(self._patterns):
+                content, counts[i] = pattern.subn(lambda m, i=i: self._replacement(i, m), content)
+            return content, counts
+
+        merged, groups = self._merged
+        patterns = self._patterns
+
+        def substitute(m):
+            # внешняя группа правила закрывается последней — lastindex указывает на неё
+            i = groups[m.lastindex]
+            counts[i] += 1
+            if not self._templates[i]:
+                return self.rules[i]["new"]
+            # шаблон \1 — по группам самого правила: то же совпадение его собственным выражением
+            return patterns[i].match(m.string, m.start()).expand(self.rules[i]["new"])
+
+        return merged.sub(substitute, content), counts
+
+
+def _rule_column(rule):
+    """Номер столбца правила (с 1) или None — правило для всей строки."""
+    column = rule.get("column")
+    if column in (None, ""):
+        return None
+    column = int(column)
+    if column < 1:
+        raise ValueError(f"Номер столбца должен быть от 1: {rule}")
+    return column
+
+
+def _apply_to_column(compiled, column):
+    """Применяет правила к каждому различному значению столбца; счётчики — по строкам."""
+    counts = [0] * len(compiled.rules)
+    frequency = column.counts()
+    new_values = [None]
+    for code, value in enumerate(column.values[1:], 1):
+        new_value, value_counts = compiled.apply(value)
+        for i, count in enumerate(value_counts):
+            counts[i] += count * frequency[code]
+        new_values.append(new_value)
+    column.set_values(new_values)
+    return counts
+
+
+def _normalize_rule(rule):
+    """{"old", "new", "column"} и флаги "regex"/"word" — только если они включены."""
+    normalized = {"old": (rule.get("old") or "").strip(), "new": (rule.get("new") or "").strip(),
+                  "column": _rule_column(rule)}
+    regex, word = _rule_flags(rule)
+    if regex:
+        normalized["regex"] = True
+    if word:
+        normalized["word"] = True
+    return normalized
+
+
+def _is_pattern_rule(rule) -> bool:
+    return bool(rule.get("regex") or rule.get("word"))
+
+
+class ScopedReplaceRules:
+    """
+    Правила, часть которых ограничена столбцом ("column" — номер поля строки с 1)
+    или задана шаблоном ("regex", "word" — см. PatternReplaceRules).
+    Подряд идущие правила с одной областью и одного вида применяются вместе: литералы —
+    как CompiledReplaceRules, шаблоны — как PatternReplaceRules; для столбца — к каждому
+    различному значению столбца один раз (records.PnxTable), счётчики умножаются на число
+    строк с этим значением. Группы применяются по порядку — следующая видит результат предыдущей.
+    """
+
+    def __init__(self, rules, mode: str = "auto"):
+        if mode not in REPLACE_MODES:
+            raise ValueError(f"Неизвестный режим замены: {mode}")
+        self.rules = [_normalize_rule(r) for r in rules if (r.get("old") or "").strip()]
+        self.mode = mode
+        self.fingerprint = fingerprint("replace", self.rules, mode == "single_pass")
+        self._groups = []  # (столбец или None, индекс первого правила, скомпилированная группа)
+        start = 0
+        for (column, pattern), group in groupby(self.rules, key=lambda rule: (rule["column"], _is_pattern_rule(rule))):
+            group = list(group)
+            compiled = PatternReplaceRules(group, mode) if pattern else CompiledReplaceRules(group, mode)
+            self._groups.append((column, start, compiled))
+            start += len(group)
+
+    def encoded(self, encoding: str = "cp1251"):
+        # столбцы разбираются по тексту — побайтного пути нет
+        return None
+
+    def apply(self, content: str):
+        counts = [0] * len(self.rules)
+        table = None
+        for column, start, compiled in self._groups:
+            if column is None:
+                if table is not None:
+                    content, table = table.to_text(), None
+                content, group_counts = compiled.apply(content)
+            else:
+                if table is None:
+                    table = PnxTable.from_text(content)
+                group_counts = _apply_to_column(compiled, table.column(column - 1))
+            for i, count in enumerate(group_counts):
+                counts[start + i] += count
+        if table is not None:
+            content = table.to_text()
+        return content, counts
+
+
+def compile_replace_rules(rules, mode: str = "auto"):
+    """
+    Готовит правила к применению; уже скомпилированный набор возвращается как есть.
+    Если хотя бы у одного правила задан "column", "regex" или "word" — ScopedReplaceRules,
+    иначе CompiledReplaceRules. Неверное регулярное выражение — ValueError.
+    """
+    if isinstance(rules, (CompiledReplaceRules, ScopedReplaceRules)):
+        return rules
+    if any(_rule_column(rule) is not None or _is_pattern_rule(rule) for rule in rules):
+        return ScopedReplaceRules(rules, mode)
+    return CompiledReplaceRules(rules, mode)
+
+
 # ---------- Применение замен ----------
-def apply_replacements_to_files(rules, file_paths, log_text_widget=None):
+def replace_content(compiled, data: bytes, encoding: str):
+    """
+    Нормализует прочитанный файл и применяет правила. Возвращает
+    (исходное содержимое, новое содержимое, счётчики по правилам): bytes cp1251
+    на быстром пути, str — если файл или правила требуют декодирования.
+    """
+    byte_rules = compiled.encoded("cp1251")
+    if byte_rules is not None and is_cp1251_bytes(data, encoding):
+        # быстрый путь: файл уже в cp1251 — заменяем байты без декодирования
+        with metrics.stage("normalize"):
+            content = normalize_newlines(data).replace(b"\xa0", b" ")
+        apply = byte_rules.apply
+    else:
+        content = decode_text(data, encoding)
+        with metrics.stage("normalize"):
+            content = _normalize_text(content)
+        apply = compiled.apply
+    with metrics.stage("replace"):
+        new_content, counts = apply(content)
+    metrics.rule_hits(compiled.rules, counts)
+    return content, new_content, counts
+
+
+def _replace_result(path, skipped: bool = False):
+    return {"path": path, "replacements": [], "written": False, "skipped": skipped, "state": None,
+            "source_hash": None, "error": None}
+
+
+def replace_skipped(path):
+    """Результат для файла, который журнал пропустил без чтения."""
+    return _replace_result(path, skipped=True)
+
+
+def _replace_start(path, compiled, done=frozenset()):
+    """Результат до чтения; файл читается всегда."""
+    return _replace_result(path), True
+
+
+def _replace_transform(result, data, encoding, compiled, done=frozenset()):
+    """Вычислительная часть replace_in_file: (result, новые байты или None, хэш итогового содержимого)."""
+    digest = result["source_hash"] = content_hash(data)
+    if done_key(compiled.fingerprint, digest) in done:
+        result["skipped"] = True
+        return result, None, digest
+
+    original_content, content, counts = replace_content(compiled, data, encoding)
+    result["replacements"] = [(rule["old"], rule["new"], count)
+                              for rule, count in zip(compiled.rules, counts) if count > 0]
+    if content == original_content:
+        return result, None, digest
+    if isinstance(content, str):
+        content = content.encode("cp1251", errors="replace")
+    content = to_output_bytes(content)
+    return result, content, content_hash(content)
+
+
+# чтение и запись отдельно от замен — для executor="async" (см. batch.FileOperation)
+REPLACE_OPERATION = FileOperation(_replace_start, _replace_transform)
+
+
+def replace_in_file(path, compiled, done=frozenset()):
+    """
+    Применяет скомпилированные правила к одному файлу. Возвращает словарь для лога:
+    path, replacements [(old, new, count)], written, skipped, state (для журнала
+    ledger.Ledger), error — подходит для пула процессов.
+    done — ключи уже обработанного содержимого: такой файл не меняется (skipped).
+    """
+    return REPLACE_OPERATION(path, compiled, done)
+
+
+def iter_replacements(compiled, file_paths, ledger=None, workers: int = 1, executor: str = "process", cancel=None,
+                      journal=None):
     """
-    Применяет правила к выбранным файлам сразу, без резервных копий.
+    Результаты replace_in_file по пачке (см. batch.iter_files, executor="async" — сетевые папки).
+    С журналом ledger файлы, уже обработанные этими правилами, пропускаются, а обработанные —
+    записываются в него. journal — undo.UndoJournal: изменения записываются для отмены.
+    """
+    undo = {} if journal is None else {"undo": True}
+    if ledger is None:
+        results = iter_files(REPLACE_OPERATION, file_paths, compiled, workers=workers, executor=executor,
+                             cancel=cancel, **undo)
+    else:
+        results = ledger.iter_files(REPLACE_OPERATION, file_paths, compiled,
+                                    fingerprint_of=lambda path: compiled.fingerprint, skipped_result=replace_skipped,
+                                    workers=workers, executor=executor, cancel=cancel, **undo)
+    return results if journal is None else journal.record_all(results)
+
+
+def apply_replacements_to_files(rules, file_paths, log_text_widget=None, mode: str = "auto",
+                                workers: int = 1, executor: str = "process", ledger=None, journal=None):
+    """
+    Применяет правила к выбранным файлам сразу; вместо резервных копий — журнал отмены journal
+    (undo.UndoJournal, по умолчанию новый).
     Выводит количество замен в лог и итоговое сообщение.
+    rules — список {"old", "new"[, "column", "regex", "word"]} или скомпилированный набор; mode — см. REPLACE_MODES
+    (правила компилируются один раз на всю пачку файлов).
+    workers > 1 — файлы обрабатываются параллельно (см. batch.iter_files),
+    лог и итог собираются в порядке file_paths.
+    ledger — ledger.Ledger: уже обработанные этими правилами файлы пропускаются.
     """
+    from tkinter import messagebox
+
     if not file_paths:
         messagebox.showwarning("Внимание", "Файлы не выбраны!")
         return 0
 
-    norm_rules = [{"old": (r.get("old") or "").strip(), "new": (r.get("new") or "").strip()}
-                  for r in rules if (r.get("old") or "").strip()]
+    compiled = compile_replace_rules(rules, mode)
+    if journal is None:
+        from undo import UndoJournal
+        journal = UndoJournal("replace")
+    results = list(iter_replacements(compiled, file_paths, ledger, workers=workers, executor=executor,
+                                     journal=journal))
+
+    if log_text_widget:
+        for result in results:
+            for line in replace_log_lines(result):
+                log_text_widget.insert("end", line)
+
+    applied_count, message = replace_summary(results)
+    messagebox.showinfo("Готово", message)
+    return applied_count
+
+
+def replace_log_lines(result):
+    """Строки лога по результату replace_in_file."""
+    filename = os.path.basename(result["path"])
+    if result.get("skipped"):
+        return [f"{filename}: уже обработан этими правилами — пропущен\n"]
+    lines = [f"{filename}: '{old}' → '{new}' ({count} замен)\n" for old, new, count in result["replacements"]]
+    if result["error"]:
+        lines.append(f"Ошибка при обработке {filename}: {result['error']}\n")
+    return lines
+
 
+def replace_summary(results):
+    """Итог пачки: (количество изменённых файлов, текст итогового сообщения)."""
     total_replacements = 0
     applied_count = 0
-
-    for path in file_paths:
-        filename = os.path.basename(path)
-        try:
-            raw = read_file_safely(path)
-            content = _normalize_text(raw)
-            original_content = content
-            file_replacements = 0
-
-            for rule in norm_rules:
-                count = content.count(rule["old"])
-                if count > 0:
-                    content = content.replace(rule["old"], rule["new"])
-                    file_replacements += count
-                    if log_text_widget:
-                        log_text_widget.insert(
-                            "end",
-                            f"{filename}: '{rule['old']}' → '{rule['new']}' ({count} замен)\n"
-                        )
-
-            if content != original_content:
-                with open(path, "w", encoding="cp1251", errors="replace") as f:
-                    f.write(content)
-                total_replacements += file_replacements
-                applied_count += 1
-
-        except Exception as e:
-            if log_text_widget:
-                log_text_widget.insert("end", f"Ошибка при обработке {filename}: {e}\n")
-            continue
+    for result in results:
+        if result["written"]:
+            total_replacements += sum(count for _, _, count in result["replacements"])
+            applied_count += 1
 
     if total_replacements == 0:
-        messagebox.showinfo("Готово", "Совпадений не найдено, файлы не изменялись.")
+        message = "Совпадений не найдено, файлы не изменялись."
     else:
-        messagebox.showinfo("Готово", f"Замены применены к {applied_count} файлам. Всего замен: {total_replacements}")
-
-    return applied_count
+        message = f"Замены применены к {applied_count} файлам. Всего замен: {total_replacements}"
+    skipped = sum(1 for result in results if result.get("skipped"))
+    if skipped:
+        message += f"\nПропущено уже обработанных файлов: {skipped}"
+    return applied_count, message
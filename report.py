@@ -0,0 +1,462 @@
+# report.py
+# Сводка по раскроям: суммы числовых столбцов PNX по категории (правила разделения),
+# материалу (первое поле) и дате (из имени файла) по всей папке.
+# Файл разбирается в records.PnxTable: число из каждого различного значения столбца
+# получается один раз, а суммы по материалам — одним проходом по массивам кодов
+# (numpy.bincount, если numpy установлен, иначе обычный цикл).
+# С numpy файл с одинаковым числом полей в строках разбирается сразу по байтам
+# (см. aggregate_bytes): строки Python создаются только для различных значений.
+import argparse
+import os
+import sys
+from array import array
+from batch import map_files
+from combine import COMBINED_PREFIX
+from records import Column, PnxTable
+from split import FALLBACK_CATEGORY, compile_rules, extract_date_from_filename
+from utils import normalize_newlines, read_bytes
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен — считаем на чистом Python
+    np = None
+
+REPORT_ENCODING = "cp1251"  # открывается в Excel без мастера импорта
+REPORT_SEP = ";"
+BULK_MAX_DIGITS = 15  # длиннее — число разбирается через float(), как без numpy (точность double)
+_NUMBER_BYTES = b"0123456789,.-"
+
+
+def parse_number(value):
+    """Число из поля PNX (допускается десятичная запятая) или None."""
+    if value is None:
+        return None
+    value = value.strip().replace(",", ".")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def column_numbers(column):
+    """
+    Числа по кодам столбца (0.0 для пустых и отсутствующих полей) и признак,
+    что все непустые значения — числа (такой столбец считается числовым).
+    """
+    numbers = [0.0]
+    numeric = False
+    for value in column.values[1:]:
+        number = parse_number(value)
+        if number is None:
+            if value.strip():
+                return None, False
+            number = 0.0
+        else:
+            numeric = True
+        numbers.append(number)
+    return numbers, numeric
+
+
+def _group_sums(group_codes, n_groups, column, numbers, use_numpy):
+    """Сумма столбца по группам: group_codes[row] — группа строки."""
+    if use_numpy:
+        weights = np.asarray(numbers)[np.frombuffer(column.codes, dtype=np.uintc)]
+        return np.bincount(group_codes, weights=weights, minlength=n_groups).tolist()
+    sums = [0.0] * n_groups
+    for group, code in zip(group_codes, column.codes):
+        sums[group] += numbers[code]
+    return sums
+
+
+def _group_area(group_codes, n_groups, table, area_columns, use_numpy):
+    """Площадь в м² (длина × ширина × количество, размеры в мм) по группам."""
+    factors = []
+    for index in area_columns:
+        column = table.column(index - 1)
+        numbers, _ = column_numbers(column)
+        if numbers is None:
+            return None
+        factors.append((column, numbers))
+    if use_numpy:
+        area = np.ones(len(table))
+        for column, numbers in factors:
+            area *= np.asarray(numbers)[np.frombuffer(column.codes, dtype=np.uintc)]
+        return (np.bincount(group_codes, weights=area, minlength=n_groups) / 1e6).tolist()
+    sums = [0.0] * n_groups
+    columns = [column.codes for column, _ in factors]
+    numbers = [numbers for _, numbers in factors]
+    for group, *codes in zip(group_codes, *columns):
+        area = 1.0
+        for n, code in zip(numbers, codes):
+            area *= n[code]
+        sums[group] += area
+    return [s / 1e6 for s in sums]
+
+
+def aggregate_table(table, classifier, date, columns=None, area_columns=None, use_numpy=None):
+    """
+    Сводка одной таблицы: {(категория, материал, дата): {"rows": n, "sums": {столбец: сумма}, "area": м²}}.
+    columns — номера столбцов с 1 (None — все числовые, кроме первого);
+    area_columns — (длина, ширина, количество) для площади или None.
+    Пустые строки не учитываются.
+    """
+    use_numpy = np is not None if use_numpy is None else use_numpy
+    if not len(table):
+        return {}
+    first = table.column(0)
+    n_groups = len(first.values)
+    group_codes = np.frombuffer(first.codes, dtype=np.uintc) if use_numpy else first.codes
+
+    if columns is None:
+        columns = [j + 1 for j in range(1, table.n_columns) if column_numbers(table.columns[j])[1]]
+    sums = {}
+    for index in columns:
+        column = table.column(index - 1)
+        numbers, _ = column_numbers(column)
+        if numbers is not None:
+            sums[index] = _group_sums(group_codes, n_groups, column, numbers, use_numpy)
+    area = _group_area(group_codes, n_groups, table, area_columns, use_numpy) if area_columns else None
+
+    return _collect_groups(first, first.counts(), sums, area, classifier, date)
+
+
+def _collect_groups(first, rows, sums, area, classifier, date):
+    """Суммы по кодам первого столбца → группы (категория, материал, дата)."""
+    n_groups = len(first.values)
+    categories = classifier.classify_column(first)
+    groups = {}
+    for code in range(1, n_groups):
+        material = first.values[code].replace("\ufeff", "").strip()
+        if not material or not rows[code]:
+            continue
+        key = (categories[code], material, date or "")
+        group = groups.setdefault(key, {"rows": 0, "sums": {}, "area": 0.0})
+        group["rows"] += rows[code]
+        for index, column_sums in sums.items():
+            group["sums"][index] = group["sums"].get(index, 0.0) + column_sums[code]
+        if area is not None:
+            group["area"] += area[code]
+    return groups
+
+
+class _NotBulk(Exception):
+    """Файл не разобрать по байтам (совпали хэши разных значений) — нужен PnxTable."""
+
+
+def _field_bounds(buf):
+    """
+    Начала и концы полей (строка за строкой) и число полей в строке — или None,
+    если в строках разное число полей (такой файл разбирается через PnxTable).
+    """
+    body = buf[:-1] if buf[-1] == 0x0A else buf
+    ends = np.flatnonzero((body == 0x3B) | (body == 0x0A))
+    newline = body[ends] == 0x0A
+    n_lines = int(np.count_nonzero(newline)) + 1
+    width, extra = divmod(len(ends) + 1, n_lines)
+    if extra or not newline[width - 1::width].all():
+        return None
+    starts = np.empty(len(ends) + 1, dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends + 1
+    stops = np.empty_like(starts)
+    stops[:-1] = ends
+    stops[-1] = len(body)
+    return starts, stops, width
+
+
+def _field_words(words, starts, lengths):
+    """
+    Поля по 8 байт: для каждого смещения 0, 8, 16... — массив слов (байты поля в порядке
+    little-endian, после конца поля — нули). words[i] — 8 байт файла с позиции i.
+    """
+    masks = np.array([(1 << 8 * n) - 1 for n in range(9)], dtype=np.uint64)  # младшие n байт слова
+    for offset in range(0, int(lengths.max()), 8):
+        # индексами, а не np.take: take сначала скопировал бы невыровненные слова в отдельный массив
+        yield words[np.minimum(starts + offset, len(words) - 1)] & masks[np.clip(lengths - offset, 0, 8)]
+
+
+def _intern_fields(data, words, starts, lengths, encoding):
+    """
+    Column из полей: различные значения ищутся по хэшу байт поля (совпадение байт
+    проверяется), декодируются только они. При совпадении хэшей разных полей — _NotBulk.
+    """
+    with np.errstate(over="ignore"):
+        hashes = lengths.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        for word in _field_words(words, starts, lengths):
+            hashes = (hashes ^ word) * np.uint64(0xBF58476D1CE4E5B9)
+            hashes ^= hashes >> np.uint64(29)
+    _, first_rows, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    representative = first_rows[inverse]
+    if not np.array_equal(lengths[representative], lengths):
+        raise _NotBulk
+    for word, expected in zip(_field_words(words, starts, lengths),
+                              _field_words(words, starts[representative], lengths)):
+        if not np.array_equal(word, expected):
+            raise _NotBulk
+    values = [None] + [data[start:start + length].decode(encoding)
+                       for start, length in zip(starts[first_rows].tolist(), lengths[first_rows].tolist())]
+    codes = array("I")
+    codes.frombytes((inverse + 1).astype(np.uintc).tobytes())
+    return Column(values, codes)
+
+
+def _parse_numbers(words, starts, lengths):
+    """
+    Числа полей, в которых только цифры, ',', '.' и '-' (не длиннее BULK_MAX_DIGITS):
+    (числа, 0.0 для пустых; есть ли непустые) или (None, False), если не все непустые — числа.
+    Значения те же, что у parse_number: целая мантисса / 10**k округляется так же, как float().
+    None — в полях есть другие байты или они длиннее (тогда числа — через parse_number).
+    """
+    size = int(lengths.max())
+    if size > BULK_MAX_DIGITS:
+        return None
+    # после конца поля — нулевые байты: в числах они ничего не меняют (нулей в файле нет)
+    allowed = np.zeros(256, dtype=bool)
+    allowed[np.frombuffer(b"\0" + _NUMBER_BYTES, dtype=np.uint8)] = True
+    mantissa = np.zeros(len(starts), dtype=np.int64)
+    point_at = np.full(len(starts), -1)
+    bad = np.zeros(len(starts), dtype=bool)  # '-' не в начале или вторая запятая
+    digits = np.zeros(len(starts), dtype=bool)
+    negative = None
+    for offset, word in zip(range(0, size, 8), _field_words(words, starts, lengths)):
+        for shift in range(min(8, size - offset)):
+            byte = (word >> np.uint64(8 * shift)).astype(np.uint8)
+            if not allowed[byte].all():
+                return None
+            digit = (byte - np.uint8(0x30)) < 10
+            mantissa = np.where(digit, mantissa * 10 + (byte - np.uint8(0x30)), mantissa)
+            digits |= digit
+            point = (byte == 0x2C) | (byte == 0x2E)
+            minus = byte == 0x2D
+            if offset + shift == 0:
+                negative = minus
+            else:
+                bad |= minus | point & (point_at >= 0)
+            point_at[point] = offset + shift
+    empty = lengths == 0
+    if not (digits & ~bad | empty).all():
+        return None, False
+    decimals = np.where(point_at >= 0, lengths - point_at - 1, 0)
+    numbers = mantissa / np.power(10.0, decimals)
+    numbers[negative] *= -1
+    return numbers, bool(not empty.all())
+
+
+def _bulk_numbers(data, words, starts, lengths, encoding):
+    """Числа столбца по строкам и признак числового столбца — как column_numbers."""
+    if not lengths.any():
+        return np.zeros(len(starts)), False
+    parsed = _parse_numbers(words, starts, lengths)
+    if parsed is not None:
+        return parsed
+    # пробелы, экспонента, длинные числа — различные значения через parse_number;
+    # текстовый столбец обычно виден по первому же значению
+    first = data[starts[0]:starts[0] + lengths[0]].decode(encoding)
+    if first.strip() and parse_number(first) is None:
+        return None, False
+    column = _intern_fields(data, words, starts, lengths, encoding)
+    by_code, numeric = column_numbers(column)
+    if by_code is None:
+        return None, False
+    return np.asarray(by_code)[np.frombuffer(column.codes, dtype=np.uintc)], numeric
+
+
+def aggregate_bytes(data: bytes, encoding: str, classifier, date, columns=None, area_columns=None):
+    """
+    То же, что aggregate_table(PnxTable.from_normalized(data, encoding), ...), но numpy
+    разбирает файл прямо по байтам: границы полей, хэши значений и числа считаются
+    массивами, строки Python создаются только для различных значений.
+    None — так не разобрать (нет numpy, в строках разное число полей, в файле есть нулевые
+    байты); тогда нужен aggregate_table.
+    """
+    if np is None:
+        return None
+    data = normalize_newlines(data)
+    if data in (b"", b"\n"):
+        return {}
+    if b"\0" in data:
+        return None
+    padded = np.frombuffer(data + bytes(8), dtype=np.uint8)
+    bounds = _field_bounds(padded[:len(data)])
+    if bounds is None:
+        return None
+    # words[i] — 8 байт файла с позиции i (невыровненные слова поверх тех же байт)
+    words = np.ndarray((len(data) + 1,), dtype="<u8", buffer=padded, strides=(1,))
+    starts, stops, width = bounds
+    # по столбцам, непрерывными массивами: starts[j] — начала полей столбца j
+    lengths = np.ascontiguousarray((stops - starts).reshape(-1, width).T)
+    starts = np.ascontiguousarray(starts.reshape(-1, width).T)
+    parsed = {}
+
+    def numbers_of(index):
+        if index not in parsed:
+            if index > width:
+                parsed[index] = np.zeros(len(group_codes)), False  # поля нет ни в одной строке
+            else:
+                j = index - 1
+                parsed[index] = _bulk_numbers(data, words, starts[j], lengths[j], encoding)
+        return parsed[index]
+
+    try:
+        first = _intern_fields(data, words, starts[0], lengths[0], encoding)
+        group_codes = np.frombuffer(first.codes, dtype=np.uintc)
+        n_groups = len(first.values)
+        if columns is None:
+            columns = [index for index in range(2, width + 1) if numbers_of(index)[1]]
+        sums = {}
+        for index in columns:
+            numbers, _ = numbers_of(index)
+            if numbers is not None:
+                sums[index] = np.bincount(group_codes, weights=numbers, minlength=n_groups).tolist()
+        area = None
+        if area_columns:
+            factors = [numbers_of(index)[0] for index in area_columns]
+            if all(factor is not None for factor in factors):
+                product = np.ones(len(group_codes))
+                for factor in factors:
+                    product *= factor
+                area = (np.bincount(group_codes, weights=product, minlength=n_groups) / 1e6).tolist()
+    except _NotBulk:
+        return None
+    rows = np.bincount(group_codes, minlength=n_groups).tolist()
+    return _collect_groups(first, rows, sums, area, classifier, date)
+
+
+def _line_count(data: bytes) -> int:
+    """Строк в файле — как len(PnxTable) после нормализации переводов строк."""
+    if not data:
+        return 0
+    lines = data.count(b"\n") + data.count(b"\r") - data.count(b"\r\n")
+    return lines if data.endswith((b"\n", b"\r")) else lines + 1
+
+
+def aggregate_file(path, classifier, columns=None, area_columns=None):
+    """Сводка одного файла (для пула процессов): {"path", "groups", "rows", "error"}."""
+    result = {"path": path, "groups": {}, "rows": 0, "error": None}
+    try:
+        # переводы строк приводятся как в остальных инструментах (файл только с \r — тоже по строкам)
+        data, encoding = read_bytes(path)
+        date = extract_date_from_filename(os.path.basename(path))
+        groups = aggregate_bytes(data, encoding, classifier, date, columns, area_columns)
+        if groups is None:
+            table = PnxTable.from_normalized(data, encoding)
+            result["rows"] = len(table)
+            groups = aggregate_table(table, classifier, date, columns, area_columns)
+        else:
+            result["rows"] = _line_count(data)
+        result["groups"] = groups
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def merge_groups(results):
+    """Складывает сводки файлов в одну."""
+    total = {}
+    for result in results:
+        for key, group in result["groups"].items():
+            merged = total.setdefault(key, {"rows": 0, "sums": {}, "area": 0.0})
+            merged["rows"] += group["rows"]
+            merged["area"] += group["area"]
+            for index, value in group["sums"].items():
+                merged["sums"][index] = merged["sums"].get(index, 0.0) + value
+    return total
+
+
+def _format_number(value: float) -> str:
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return text.replace(".", ",")  # десятичная запятая — как в русском Excel
+
+
+def write_report(path, groups, categories=(), with_area: bool = False):
+    """
+    Пишет сводку в CSV (';', cp1251): дата, категория, материал, строк, суммы столбцов[, площадь].
+    Порядок: дата, категории как в правилах (прочее последней), материал.
+    """
+    columns = sorted({index for group in groups.values() for index in group["sums"]})
+    order = {cat: i for i, cat in enumerate(list(categories) + [FALLBACK_CATEGORY])}
+    header = ["Дата", "Категория", "Материал", "Строк"] + [f"Столбец {index}" for index in columns]
+    if with_area:
+        header.append("Площадь, кв. м")
+    lines = [REPORT_SEP.join(header)]
+    for (category, material, date), group in sorted(
+            groups.items(), key=lambda item: (item[0][2], order.get(item[0][0], len(order)), item[0][1])):
+        fields = [date, category, material, str(group["rows"])]
+        fields += [_format_number(group["sums"].get(index, 0.0)) for index in columns]
+        if with_area:
+            fields.append(_format_number(group["area"]))
+        lines.append(REPORT_SEP.join(fields))
+    with open(path, "w", encoding=REPORT_ENCODING, errors="replace", newline="") as f:
+        f.write("\r\n".join(lines) + "\r\n")
+
+
+def report_output_path(folder):
+    return os.path.join(folder, "сводка.csv")
+
+
+def report_inputs(folder, file_ext, categories):
+    """
+    Раскрои папки для сводки: файлы с расширением file_ext, кроме результатов самого PNXTool —
+    объединённого файла и файлов категорий после разделения ("<префикс> <категория><ext>",
+    так же названы разделы partition), иначе их строки посчитались бы повторно.
+    """
+    suffixes = tuple(f" {category}{file_ext}" for category in list(categories) + [FALLBACK_CATEGORY])
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+            if f.endswith(file_ext) and not f.startswith(COMBINED_PREFIX) and not f.endswith(suffixes)]
+
+
+def build_report(folder, file_ext: str = ".pnx", output=None, split_rules=None, columns=None,
+                 area_columns=None, workers: int = 1, executor: str = "process"):
+    """
+    Сводка по раскроям папки с расширением file_ext (см. report_inputs). split_rules — правила
+    разделения (None — сохранённые). Возвращает (путь к сводке, результаты по файлам).
+    """
+    if area_columns and len(area_columns) != 3:
+        raise ValueError("area_columns: нужны три столбца — длина, ширина, количество")
+    classifier = compile_rules(split_rules)
+    file_paths = report_inputs(folder, file_ext, classifier.categories)
+    results = map_files(aggregate_file, file_paths, classifier, columns, area_columns,
+                        workers=workers, executor=executor)
+    output = output or report_output_path(folder)
+    write_report(output, merge_groups(results), classifier.categories, with_area=bool(area_columns))
+    return output, results
+
+
+def report_summary(results, output):
+    """Итог: (количество файлов в сводке, текст итогового сообщения)."""
+    ok = [result for result in results if not result["error"]]
+    rows = sum(result["rows"] for result in ok)
+    return len(ok), f"Сводка по {len(ok)} файлам ({rows} строк) записана в {output}"
+
+
+def _column_list(text):
+    return [int(part) for part in text.split(",") if part.strip()] if text else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сводка по раскроям: суммы по категории, материалу и дате.")
+    parser.add_argument("folder")
+    parser.add_argument("--ext", default=".pnx")
+    parser.add_argument("-o", "--output", help="файл сводки (по умолчанию сводка.csv в папке)")
+    parser.add_argument("--columns", help="номера суммируемых столбцов через запятую (по умолчанию все числовые)")
+    parser.add_argument("--area", help="столбцы длины, ширины и количества через запятую — для площади в м²")
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    area_columns = _column_list(args.area)
+    if area_columns is not None and len(area_columns) != 3:
+        parser.error("--area: нужны три столбца — длина, ширина, количество")
+    output, results = build_report(args.folder, args.ext, args.output, columns=_column_list(args.columns),
+                                   area_columns=area_columns, workers=args.workers)
+    for result in results:
+        if result["error"]:
+            print(f"Ошибка при обработке {os.path.basename(result['path'])}: {result['error']}")
+    print(report_summary(results, output)[1])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# rules_store.py
+# Единое хранилище правил: правила разделения (rules.json) и замены (replace_rules.json)
+# читаются один раз и держатся в памяти вместе со скомпилированным вариантом.
+# Файл перечитывается (и правила компилируются заново), только если изменились
+# его mtime или размер, — например, правила поправили в другом окне или руками.
+# Сохранение через хранилище сразу обновляет кэш.
+import copy
+import json
+import os
+import threading
+from utils import app_data_dir
+
+SPLIT_RULES_FILE = os.path.join(app_data_dir(), "rules.json")
+REPLACE_RULES_FILE = os.path.join(app_data_dir(), "replace_rules.json")
+
+# стандартные правила разделения — те же, что показывает и восстанавливает вкладка "Разделение"
+DEFAULT_SPLIT_RULES = {
+    "тим": ["тимбер", "вуд", "лдсп"],
+    "без тим": ["синкрон", "пост"],
+    "agt": ["evosoft", "evogloss", "agt"]
+}
+DEFAULT_REPLACE_RULES = []
+
+_lock = threading.Lock()
+
+
+class RulesFile:
+    """
+    JSON-файл правил с кэшем. load() отдаёт копию правил (её можно менять),
+    compiled(key) — скомпилированный compile_func(rules) набор; для каждого key
+    (например, режима замены) он строится один раз до следующего изменения файла.
+    Если файла нет или он испорчен — действуют правила по умолчанию.
+    """
+
+    def __init__(self, path, default, compile_func=None):
+        self.path = path
+        self.default = default
+        self.compile_func = compile_func
+        self._stamp = False  # (mtime_ns, размер) прочитанного файла; None — файла нет
+        self._rules = None
+        self._compiled = {}
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        rules = self.default
+        if stamp is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    rules = json.load(f)
+            except (OSError, ValueError):
+                # если файл кривой — стандартные правила
+                pass
+        self._stamp, self._rules, self._compiled = stamp, rules, {}
+
+    def load(self):
+        with _lock:
+            self._refresh()
+            return copy.deepcopy(self._rules)
+
+    def compiled(self, *key):
+        with _lock:
+            self._refresh()
+            compiled = self._compiled.get(key)
+            if compiled is None:
+                compiled = self._compiled[key] = self.compile_func(self._rules, *key)
+            return compiled
+
+    def save(self, rules):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(rules, f, ensure_ascii=False, indent=4)
+        with _lock:
+            os.replace(tmp_file, self.path)
+            self._stamp, self._rules, self._compiled = self._file_stamp(), copy.deepcopy(rules), {}
+
+    def invalidate(self):
+        """Забыть кэш — следующее обращение перечитает файл."""
+        with _lock:
+            self._stamp, self._rules, self._compiled = False, None, {}
+
+
+def _compile_split(rules):
+    from split import CategoryClassifier
+    return CategoryClassifier(rules)
+
+
+def _compile_replace(rules, mode="auto"):
+    from replace import compile_replace_rules
+    return compile_replace_rules(rules, mode)
+
+
+_files = {}
+
+
+def rules_file(path, default, compile_func) -> RulesFile:
+    """Хранилище для файла path (одно на путь на весь процесс)."""
+    path = os.path.abspath(path)
+    with _lock:
+        store = _files.get(path)
+        if store is None:
+            store = _files[path] = RulesFile(path, default, compile_func)
+        return store
+
+
+def split_rules(path=SPLIT_RULES_FILE) -> RulesFile:
+    return rules_file(path, DEFAULT_SPLIT_RULES, _compile_split)
+
+
+def replace_rules(path=REPLACE_RULES_FILE) -> RulesFile:
+    return rules_file(path, DEFAULT_REPLACE_RULES, _compile_replace)
@@ -1,25 +1,13 @@
-import json
-import os
 import tkinter as tk
 from tkinter import simpledialog, messagebox
+from rules_store import split_rules
 
-RULES_FILE = "rules.json"  # файл для хранения категорий
 
 def load_rules():
-    if os.path.exists(RULES_FILE):
-        with open(RULES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    else:
-        # пример стандартных категорий
-        return {
-            "тимбер": ["тимбер", "вуд", "лдсп"],
-            "без тим": ["синкрон", "пост"],
-            "agt": ["evosoft", "evogloss", "agt"]
-        }
+    return split_rules().load()
 
 def save_rules(rules):
-    with open(RULES_FILE, "w", encoding="utf-8") as f:
-        json.dump(rules, f, indent=4, ensure_ascii=False)
+    split_rules().save(rules)
 
 def show_rules():
     rules = load_rules()
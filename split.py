@@ -1,34 +1,33 @@
 # split.py
+import mmap
 import os
 import re
-from tkinter import filedialog, messagebox
-from utils import read_file_safely
+import metrics
+# RULES_FILE — путь к rules.json под прежним именем split.RULES_FILE (для внешних скриптов)
+from rules_store import SPLIT_RULES_FILE as RULES_FILE, split_rules
+from utils import (EXTRA_LINE_BREAKS_RE, OUTPUT_LINESEP, decode_text, detect_file_encoding, is_cp1251_bytes,
+                   iter_line_blocks, read_bytes, write_bytes)
+
+# файлы больше этого размера разделяются потоково (память не растёт с размером файла)
+STREAMING_THRESHOLD = 64 * 1024 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
 
-APPDATA_FOLDER = os.path.join(os.getenv("APPDATA"), "PNXTool")
-os.makedirs(APPDATA_FOLDER, exist_ok=True)
-RULES_FILE = os.path.join(APPDATA_FOLDER, "rules.json")
 
 def load_rules():
-    """Загрузить правила из rules.json или вернуть стандартные, если файла нет."""
-    if os.path.exists(RULES_FILE):
-        try:
-            import json
-            with open(RULES_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            # если файл кривой — вернуть стандартные правила
-            pass
-    return {
-        "тим": ["тимбер", "вуд", "лосп"],
-        "без_тим": ["синкрон", "пост"],
-        "agt": ["evosoft", "evogloss", "agt"]
-    }
+    """Правила из rules.json (стандартные, если файла нет или он испорчен) — через rules_store."""
+    return split_rules().load()
+
+
+def save_rules(rules):
+    split_rules().save(rules)
+
 
 def extract_date_from_filename(filename):
     """Ищем первую дату в формате YYYY-MM-DD в имени файла. Возвращаем строку даты или None."""
     match = re.search(r"\d{4}-\d{2}-\d{2}", filename)
     return match.group(0) if match else None
 
+
 def _sanitize_part(s: str) -> str:
     """Преобразует часть имени в безопасную для файла строку (заменяет пробелы/спецсимволы)."""
     if not s:
@@ -38,6 +37,7 @@ def _sanitize_part(s: str) -> str:
     # обрезаем слишком длинные имена
     return sanitized[:120]
 
+
 def _normalize(s: str) -> str:
     """Удаляем BOM/zero-width, приводим к lower и убираем лишние пробелы."""
     if s is None:
@@ -45,88 +45,199 @@ def _normalize(s: str) -> str:
     s = s.replace("\ufeff", "").replace("\u200b", "")
     return s.strip().lower()
 
-def _first_token(s: str) -> str:
+
+# первый токен первого поля — до любого символа кроме буквы/цифры/дефиса/подчёркивания,
+# например 'timber-Galif' -> 'timber-galif', 'evosoft something' -> 'evosoft'
+_TOKEN_SPLIT_RE = re.compile(r'[^0-9a-zа-яё\-_]+', re.IGNORECASE)
+
+FALLBACK_CATEGORY = "прочее"
+
+
+class CategoryClassifier:
     """
-    Выделяем первый токен из строки (до первого разделителя, но оставляем '-' и '_'),
-    например 'timber-Galif' -> 'timber-galif', 'evosoft something' -> 'evosoft'.
+    Правила разделения, скомпилированные один раз: одиночные ключи — в префиксное
+    дерево по первому токену, фразы (ключи с пробелом) — в отдельный список.
+    Результат тот же, что у перебора категорий по порядку: побеждает первая
+    подходящая категория, иначе FALLBACK_CATEGORY. Результаты запоминаются
+    по первому полю строки — названия материалов в раскрое повторяются тысячи раз.
     """
-    s = s.strip().lower()
-    if not s:
-        return ""
-    # разделяем по любым символам кроме буквы/цифры/дефиса/подчёркивания
-    parts = re.split(r'[^0-9a-zа-яё\-_]+', s, flags=re.IGNORECASE)
-    return parts[0] if parts else s
 
-def split_file():
-    """Диалог выбора файла и разделение по категориям — имена файлов: <дата или исходное>_<категория>.pnx"""
-    file_path = filedialog.askopenfilename(
-        title="Выберите файл для разделения",
-        filetypes=[("PNX файлы", "*.pnx"), ("Все файлы", "*.*")]
-    )
-    if not file_path:
-        return
+    def __init__(self, raw_categories, cache_size: int = 65536):
+        self.categories = list(raw_categories)
+        self._trie = {}
+        self._phrases = []
+        for idx, (cat, kws) in enumerate(raw_categories.items()):
+            # поддерживаем либо строку, либо список
+            kws_list = [kws] if isinstance(kws, str) else kws
+            for k in kws_list:
+                nk = _normalize(k)
+                if not nk:
+                    continue
+                if " " in nk:
+                    self._phrases.append((idx, nk))
+                    continue
+                node = self._trie
+                for ch in nk:
+                    node = node.setdefault(ch, {})
+                # в узле храним самую раннюю категорию, чей ключ здесь заканчивается
+                node[None] = min(node.get(None, idx), idx)
+        self._phrases.sort(key=lambda item: item[0])
+        self._cache = {}
+        self._cache_size = cache_size
 
-    # Загружаем и нормализуем правила: превратить каждую keywords в список нормализованных строк
-    raw_categories = load_rules()
-    categories = {}
-    for cat, kws in raw_categories.items():
-        # поддерживаем либо строку, либо список
-        if isinstance(kws, str):
-            kws_list = [kws]
-        else:
-            kws_list = kws
-        norm = []
-        for k in kws_list:
-            nk = _normalize(k)
-            if nk:
-                norm.append(nk)
-        categories[cat] = norm
-
-    lines = read_file_safely(file_path).splitlines()
-    output = {key: [] for key in categories}
-    output["прочее"] = []
-
-    for line in lines:
-        # Берём только первое поле (до первого ;)
-        first_field_raw = (line.split(";", 1)[0] if ";" in line else line)
-        first_field = _normalize(first_field_raw)
-        token = _first_token(first_field)
-
-        found = False
-        for cat, keywords in categories.items():
-            for kw in keywords:
-                # если ключ содержит пробел (фраза) — ищем её в первом поле
-                if " " in kw:
-                    if kw in first_field:
-                        output[cat].append(line)
-                        found = True
-                        break
-                else:
-                    # отдельное слово/токен: сравниваем с первым токеном
-                    # допускаем точное совпадение или совпадение по началу (startswith)
-                    if token == kw or token.startswith(kw):
-                        output[cat].append(line)
-                        found = True
-                        break
-            if found:
+    def _classify_index(self, first_field: str) -> int:
+        best = len(self.categories)
+        # совпадение с первым токеном: точное или по началу (startswith)
+        node = self._trie
+        for ch in _TOKEN_SPLIT_RE.split(first_field, 1)[0]:
+            node = node.get(ch)
+            if node is None:
+                break
+            idx = node.get(None)
+            if idx is not None and idx < best:
+                best = idx
+        # фразу ищем во всём первом поле, но только среди более ранних категорий
+        for idx, phrase in self._phrases:
+            if idx >= best:
                 break
+            if phrase in first_field:
+                return idx
+        return best
 
-        if not found:
-            output["прочее"].append(line)
+    def classify_field(self, first_field_raw: str) -> str:
+        """Категория по первому полю строки (тексту до первого ';')."""
+        cat = self._cache.get(first_field_raw)
+        if cat is None:
+            idx = self._classify_index(_normalize(first_field_raw))
+            cat = self.categories[idx] if idx < len(self.categories) else FALLBACK_CATEGORY
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[first_field_raw] = cat
+        return cat
 
-    base_name, ext = os.path.splitext(os.path.basename(file_path))
-    folder = os.path.dirname(file_path)
+    def classify_field_bytes(self, first_field_raw: bytes) -> str:
+        """То же для первого поля в байтах cp1251 — декодируется только это поле, и то один раз."""
+        cat = self._cache.get(first_field_raw)
+        if cat is None:
+            cat = self.classify_field(first_field_raw.decode("cp1251"))
+            self._cache[first_field_raw] = cat
+        return cat
 
-    # ищем дату
-    date_part = extract_date_from_filename(base_name)
+    def classify(self, line: str) -> str:
+        """Категория строки PNX — берём только первое поле (до первого ;)."""
+        return self.classify_field(line.split(";", 1)[0])
+
+    def classify_column(self, column):
+        """
+        Категории для первого столбца records.PnxTable: список по кодам столбца
+        (categories[column.codes[row]] — категория строки), каждое значение классифицируется один раз.
+        """
+        return [self.classify_field(value or "") for value in column.values]
 
+
+def compile_rules(raw_categories=None) -> CategoryClassifier:
+    """
+    Компилирует правила разделения. None — сохранённые правила: скомпилированный набор
+    берётся из rules_store и пересобирается, только когда rules.json меняется.
+    Уже скомпилированный набор возвращается как есть.
+    """
+    if raw_categories is None:
+        return split_rules().compiled()
+    if isinstance(raw_categories, CategoryClassifier):
+        return raw_categories
+    return CategoryClassifier(raw_categories)
+
+
+def output_prefix(base_name: str) -> str:
+    """Префикс имён выходных файлов: дата и всё после неё или безопасное исходное имя."""
+    date_part = extract_date_from_filename(base_name)
     if date_part:
         # сохраняем всё после даты, включая пробелы/символы
         rest = base_name.split(date_part, 1)[1].lstrip("_ ")  # убираем подчеркивание или пробел после даты
-        prefix = f"{date_part}_{rest}" if rest else date_part
+        return f"{date_part}_{rest}" if rest else date_part
+    return _sanitize_part(base_name)
+
+
+def split_into_categories(file_path, classifier=None, streaming=None, dedup=None):
+    """
+    Разделяет файл по категориям без диалогов — имена файлов: "<prefix> <category><ext>"
+    рядом с исходным. Возвращает список (out_path, count_lines) созданных файлов.
+    streaming: True — не читать файл целиком: отображение в память (_split_mmap), если
+    строки можно копировать байтами, иначе построчное чтение; False — целиком в памяти;
+    None — отображение в память, если возможно, иначе выбор по размеру (STREAMING_THRESHOLD).
+    dedup — dedup.Deduplicator в режиме "lines" (общий для пачки файлов): строки, уже
+    бывшие в предыдущих файлах, не попадают в результат (выброшено — в dedup.dropped
+    под именем файла).
+    """
+    if classifier is None:
+        classifier = compile_rules()
+
+    base_name, ext = os.path.splitext(os.path.basename(file_path))
+    folder = os.path.dirname(file_path)
+    prefix = output_prefix(base_name)
+
+    if streaming is not False:
+        with metrics.stage("split_mmap"):
+            created = _split_mmap(file_path, classifier, folder, prefix, ext, dedup)
+        if created is not None:
+            return created
+    if streaming is None:
+        streaming = os.path.getsize(file_path) >= STREAMING_THRESHOLD
+
+    if streaming:
+        with metrics.stage("split_streaming"):
+            return _split_streaming(file_path, classifier, folder, prefix, ext, dedup)
+
+    data, encoding = read_bytes(file_path)
+    return write_split_outputs(split_bytes(data, encoding, classifier, dedup, os.path.basename(file_path)),
+                               folder, prefix, ext)
+
+
+def split_bytes(data: bytes, encoding: str, classifier, dedup=None, name=None):
+    """
+    Раскладывает строки прочитанного файла по категориям в памяти:
+    {категория: [строки в cp1251]} в порядке категорий, "прочее" последней.
+    dedup — dedup.Deduplicator: строки из предыдущих файлов выбрасываются (name — имя файла для отчёта).
+    """
+    output = {key: [] for key in classifier.categories}
+    output[FALLBACK_CATEGORY] = []
+
+    if is_cp1251_bytes(data, encoding) and not EXTRA_LINE_BREAKS_RE.search(data):
+        # быстрый путь: строки остаются байтами cp1251, декодируется только первое поле
+        classify = classifier.classify_field_bytes
+        lines = data.splitlines()
+        if dedup is not None:
+            lines = dedup.unique_lines(name, lines)
+        with metrics.stage("classify"):
+            for line in lines:
+                output[classify(line.split(b";", 1)[0])].append(line)
     else:
-        prefix = _sanitize_part(base_name)
+        classify = classifier.classify
+        text_lines = decode_text(data, encoding).splitlines()
+        lines = [line.encode("cp1251", errors="replace") for line in text_lines]
+        if dedup is not None:
+            # повтор — по байтам cp1251, как на быстром пути; строки текста — те же по порядку
+            kept = dedup.unique_lines(name, lines)
+            if len(kept) != len(lines):
+                text_lines = list(_kept_texts(text_lines, lines, kept))
+            lines = kept
+        with metrics.stage("classify"):
+            for text, line in zip(text_lines, lines):
+                output[classify(text)].append(line)
+    return output
 
+
+def _kept_texts(text_lines, lines, kept):
+    """Строки текста, чьи байты остались в kept (kept — подпоследовательность lines)."""
+    i = 0
+    for text, line in zip(text_lines, lines):
+        if i < len(kept) and kept[i] is line:
+            i += 1
+            yield text
+
+
+def write_split_outputs(output, folder, prefix, ext):
+    """Пишет непустые категории в "<prefix> <category><ext>"; возвращает [(out_path, count_lines)]."""
     created = []  # список (out_path, count_lines)
     for cat, cat_lines in output.items():
         if not cat_lines:
@@ -135,17 +246,197 @@ def split_file():
         out_name = f"{prefix} {cat}{ext}"
         out_path = os.path.join(folder, out_name)
         try:
-            with open(out_path, "w", encoding="cp1251", errors="replace") as f:
-                f.write("\n".join(cat_lines))
-            created.append((out_path, len(cat_lines)))
+            write_bytes(out_path, OUTPUT_LINESEP.join(cat_lines))
         except Exception as e:
-            messagebox.showerror("Ошибка записи", f"Не удалось записать {out_name}:\n{e}")
-            return
+            raise OSError(f"Не удалось записать {out_name}:\n{e}") from e
+        created.append((out_path, len(cat_lines)))
+    return created
 
-    if not created:
-        messagebox.showinfo("Результат", "Ничего не создано — нет строк, соответствующих категориям.")
+
+def _split_streaming(file_path, classifier, folder, prefix, ext, dedup=None):
+    """
+    Потоковый вариант: файл читается кусками по целым строкам (utils.iter_line_blocks),
+    каждая строка сразу дописывается в буферизованный файл своей категории. Куски
+    в cp1251 (и ASCII) копируются байтами, остальные декодируются целиком. Результат тот же, что у варианта в памяти.
+    """
+    name = os.path.basename(file_path)
+    counts = {key: 0 for key in classifier.categories}
+    counts[FALLBACK_CATEGORY] = 0
+    writers = {}
+    source = os.path.abspath(file_path)
+    encoding = detect_file_encoding(file_path)
+
+    def open_writer(cat):
+        out_name = f"{prefix} {cat}{ext}"
+        out_path = os.path.join(folder, out_name)
+        if os.path.abspath(out_path) == source:
+            raise OSError(f"Не удалось записать {out_name}:\nимя совпадает с исходным файлом")
+        try:
+            return open(out_path, "wb", buffering=WRITE_BUFFER_SIZE)
+        except Exception as e:
+            raise OSError(f"Не удалось записать {out_name}:\n{e}") from e
+
+    def write(cat, line):
+        writer = writers.get(cat)
+        if writer is None:
+            writer = writers[cat] = open_writer(cat)
+            writer.write(line)
+        else:
+            writer.write(OUTPUT_LINESEP + line)
+        counts[cat] += 1
+
+    try:
+        with open(file_path, "rb") as src:
+            # кусками по целым строкам: и файл с одними \r в конце строк не читается целиком
+            for block in iter_line_blocks(src):
+                if (encoding == "cp1251" or block.isascii()) and not EXTRA_LINE_BREAKS_RE.search(block):
+                    lines = block.splitlines()
+                    if dedup is not None:
+                        lines = dedup.unique_lines(name, lines)
+                    for line in lines:
+                        write(classifier.classify_field_bytes(line.split(b";", 1)[0]), line)
+                else:
+                    # splitlines() делит и по \v, \f и т. п. — как в варианте в памяти
+                    for line in block.decode(encoding).splitlines():
+                        encoded = line.encode("cp1251", errors="replace")
+                        if dedup is None or dedup.unique_lines(name, [encoded]):
+                            write(classifier.classify(line), encoded)
+    finally:
+        for writer in writers.values():
+            metrics.count("bytes_written", writer.tell())
+            writer.close()
+    if metrics.active():
+        metrics.count("files")
+        metrics.count("bytes_read", os.path.getsize(file_path))
+        metrics.count("lines", sum(counts.values()))
+
+    return [(os.path.join(folder, f"{prefix} {cat}{ext}"), cnt) for cat, cnt in counts.items() if cnt]
+
+
+MMAP_CHUNK_SIZE = 8 * 1024 * 1024  # сколько байт отображённого файла разбирается за раз
+_EXTRA_LINE_BREAKS = (b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e")  # как EXTRA_LINE_BREAKS_RE
+
+
+def _copyable_as_bytes(mm, encoding: str, size: int) -> bool:
+    """
+    Строки файла можно копировать байтами: он в cp1251 или чистый ASCII, и в нём нет
+    разрывов строк, которые str.splitlines() понимает, а bytes.splitlines() — нет.
+    Проверки — поиском отдельных байтов (memchr), это быстрее регулярного выражения.
+    """
+    if any(mm.find(ch) >= 0 for ch in _EXTRA_LINE_BREAKS):
+        return False
+    if encoding != "cp1251":
+        return all(mm[start:start + MMAP_CHUNK_SIZE].isascii() for start in range(0, size, MMAP_CHUNK_SIZE))
+    return True
+
+
+def _chunk_end(mm, start: int, size: int) -> int:
+    """Конец куска с start: сразу после последнего перевода строки в пределах MMAP_CHUNK_SIZE."""
+    limit = start + MMAP_CHUNK_SIZE
+    if limit >= size:
+        return size
+    pos = max(mm.rfind(b"\n", start, limit), mm.rfind(b"\r", start, limit))
+    if pos < 0:
+        # строка длиннее куска — до её конца
+        found = [p for p in (mm.find(b"\n", limit), mm.find(b"\r", limit)) if p >= 0]
+        if not found:
+            return size
+        pos = min(found)
+    if mm[pos] == 0x0D and pos + 1 < size and mm[pos + 1] == 0x0A:
+        pos += 1  # \r\n не разрываем
+    return pos + 1
+
+
+def _split_mmap(file_path, classifier, folder, prefix, ext, dedup=None):
+    """
+    Разделение по отображению файла в память, кусками по MMAP_CHUNK_SIZE (на границе
+    строк): память не растёт с размером файла. Строки не декодируются — из каждой
+    берётся только первое поле (до ';'), и классифицируется (декодируется и приводится
+    к нижнему регистру) только каждое различное первое поле, один раз на кусок.
+    Строки копируются в файлы категорий как есть, байтами, одной записью на категорию
+    в куске.
+    Возвращает None, если строки нельзя копировать байтами (не cp1251/ASCII или
+    есть редкие разрывы строк \v, \f...) — тогда работает другой вариант.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    encoding = detect_file_encoding(file_path)
+    source = os.path.abspath(file_path)
+    counts = {key: 0 for key in classifier.categories}
+    counts[FALLBACK_CATEGORY] = 0
+    writers = {}
+
+    def write(cat, data, lines):
+        writer = writers.get(cat)
+        if writer is None:
+            out_name = f"{prefix} {cat}{ext}"
+            out_path = os.path.join(folder, out_name)
+            if os.path.abspath(out_path) == source:
+                raise OSError(f"Не удалось записать {out_name}:\nимя совпадает с исходным файлом")
+            try:
+                writer = writers[cat] = open(out_path, "wb", buffering=WRITE_BUFFER_SIZE)
+            except Exception as e:
+                raise OSError(f"Не удалось записать {out_name}:\n{e}") from e
+        else:
+            writer.write(OUTPUT_LINESEP)
+        writer.write(data)
+        counts[cat] += lines
+
+    with open(file_path, "rb") as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if not _copyable_as_bytes(mm, encoding, size):
+            return None
+        try:
+            start = 0
+            while start < size:
+                end = _chunk_end(mm, start, size)
+                lines = mm[start:end].splitlines()
+                start = end
+                if dedup is not None:
+                    lines = dedup.unique_lines(os.path.basename(file_path), lines)
+                first_fields = [line.partition(b";")[0] for line in lines]
+                field_categories = {field: classifier.classify_field_bytes(field) for field in set(first_fields)}
+                output = {cat: [] for cat in counts}
+                for line, cat in zip(lines, map(field_categories.__getitem__, first_fields)):
+                    output[cat].append(line)
+                for cat, cat_lines in output.items():
+                    if cat_lines:
+                        write(cat, OUTPUT_LINESEP.join(cat_lines), len(cat_lines))
+        finally:
+            for writer in writers.values():
+                metrics.count("bytes_written", writer.tell())
+                writer.close()
+    if metrics.active():
+        metrics.count("files")
+        metrics.count("bytes_read", size)
+        metrics.count("lines", sum(counts.values()))
+
+    return [(os.path.join(folder, f"{prefix} {cat}{ext}"), cnt) for cat, cnt in counts.items() if cnt]
+
+
+def split_file():
+    """Диалог выбора файла и разделение по категориям — имена файлов: <дата или исходное>_<категория>.pnx"""
+    from tkinter import filedialog, messagebox
+
+    file_path = filedialog.askopenfilename(
+        title="Выберите файл для разделения",
+        filetypes=[("PNX файлы", "*.pnx"), ("Все файлы", "*.*")]
+    )
+    if not file_path:
+        return
+
+    try:
+        created = split_into_categories(file_path)
+    except OSError as e:
+        messagebox.showerror("Ошибка записи", str(e))
         return
 
-    # Сообщение пользователю: список созданных файлов и кол-во строк
+    messagebox.showinfo("Готово" if created else "Результат", split_summary(created))
+
+
+def split_summary(created) -> str:
+    """Сообщение пользователю: список созданных файлов и кол-во строк."""
+    if not created:
+        return "Ничего не создано — нет строк, соответствующих категориям."
     lines_info = "\n".join([f"{os.path.basename(p)} — {cnt} строк" for p, cnt in created])
-    messagebox.showinfo("Готово", f"Создано {len(created)} файлов:\n{lines_info}")
+    return f"Создано {len(created)} файлов:\n{lines_info}"
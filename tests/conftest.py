@@ -0,0 +1,10 @@
+# conftest.py
+# Модули PNXTool лежат в корне репозитория; настройки (PNXTool в %APPDATA%) на время
+# тестов — во временной папке, чтобы не трогать настоящие правила и журналы.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="pnx_tests_appdata_")
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import pytest
+from add_date import iter_add_date
+from aio import iter_pipeline
+from replace import compile_replace_rules, iter_replacements
+
+LINES = ["ЛДСП белый 16;600;400;2", "ХДФ 3;800;300;4", "", "МДФ 16;100;100;1"]
+REPLACE_RULES = [{"old": "ЛДСП", "new": "ДСП"}, {"old": "МДФ 16", "new": "MDF 16"}]
+
+
+class _InFlight:
+    """Считает одновременные вызовы read и начатые элементы."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = self.started = 0
+
+    def read(self, item):
+        with self.lock:
+            self.started += 1
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(0.005)
+        with self.lock:
+            self.current -= 1
+        return item
+
+
+@pytest.mark.parametrize("io_concurrency", [1, 3])
+def test_reads_bounded_and_ordered(io_concurrency):
+    counter = _InFlight()
+    results = list(iter_pipeline(range(40), counter.read, lambda x: x * 2, io_concurrency=io_concurrency))
+    assert results == [x * 2 for x in range(40)]
+    assert counter.peak <= io_concurrency
+
+
+def test_slow_consumer_holds_back_reads():
+    counter, window = _InFlight(), 4
+    consumed = 0
+    for _ in iter_pipeline(range(30), counter.read, io_concurrency=2, window=window):
+        consumed += 1
+        time.sleep(0.01)
+        with counter.lock:
+            assert counter.started <= consumed + window
+    assert consumed == 30
+
+
+def test_error_raised_in_place():
+    def read(item):
+        if item == 3:
+            raise ValueError("плохой файл")
+        return item
+
+    results = iter_pipeline(range(6), read)
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(ValueError):
+        next(results)
+
+
+def _make_files(folder, encoding):
+    folder.mkdir()
+    for i in range(12):
+        path = folder / f"cutlist_{i}_2025-03-{i + 1:02d}.pnx"
+        lines = LINES[i % 4:] + LINES[:i % 4]
+        path.write_bytes("\r\n".join(lines).encode(encoding) + b"\r\n")
+    (folder / "без_даты.pnx").write_bytes("ЛДСП;1\n".encode(encoding))
+
+
+def _run(operation, folder, **kwargs):
+    paths = sorted(os.path.join(folder, name) for name in os.listdir(folder))
+    if operation == "replace":
+        results = list(iter_replacements(compile_replace_rules(REPLACE_RULES), paths, **kwargs))
+    else:
+        results = list(iter_add_date(paths, "from_filename", **kwargs))
+    for result in results:
+        result["path"] = os.path.basename(result["path"])
+        result.pop("state")  # размер и время изменения — у копий в разных папках свои
+    files = {name: (folder / name).read_bytes() for name in sorted(os.listdir(folder))}
+    return results, files
+
+
+@pytest.mark.parametrize("operation", ["replace", "add_date"])
+@pytest.mark.parametrize("encoding", ["cp1251", "utf-8"])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_async_same_as_sequential(tmp_path, operation, encoding, workers):
+    _make_files(tmp_path / "seq", encoding)
+    _make_files(tmp_path / "async", encoding)
+    expected = _run(operation, tmp_path / "seq")
+    assert _run(operation, tmp_path / "async", workers=workers, executor="async") == expected
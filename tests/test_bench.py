@@ -0,0 +1,27 @@
+import os
+import bench
+from bench import run_benchmarks
+
+
+def test_user_workdir_survives(tmp_path):
+    keep = tmp_path / "мои_файлы.txt"
+    keep.write_text("не удалять", encoding="utf-8")
+    (tmp_path / "своя_папка").mkdir()
+    report = run_benchmarks([4096], cases=["read_file_safely"], workdir=str(tmp_path), log=lambda *_: None)
+    assert report["cases"]["read_file_safely"]["error"] is None
+    assert keep.read_text(encoding="utf-8") == "не удалять"
+    assert (tmp_path / "своя_папка").is_dir()
+    # созданное бенчмарком убрано
+    assert sorted(os.listdir(tmp_path)) == ["мои_файлы.txt", "своя_папка"]
+
+
+def _die(name, source, work, workers, results):
+    os._exit(3)
+
+
+def test_dead_child_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(bench, "_run_case", _die)
+    monkeypatch.setattr(bench, "RESULT_POLL_SECONDS", 0.1)
+    result = bench.run_case("read_file_safely", str(tmp_path), str(tmp_path / "work"))
+    assert result["seconds"] is None
+    assert "3" in result["error"]
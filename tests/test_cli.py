@@ -0,0 +1,9 @@
+import io
+from cli import iter_jobs
+
+
+def test_non_object_jobs_are_bad_lines():
+    jobs = list(iter_jobs(io.StringIO('[]\n"x"\n{bad\n\n# комментарий\n{"op": "undo"}\n')))
+    assert [job["id"] for job in jobs] == [1, 2, 3, 6]
+    assert [job["op"] for job in jobs] == [None, None, None, "undo"]
+    assert all(job["_error"].startswith(f"строка {job['id']}:") for job in jobs[:3])
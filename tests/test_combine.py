@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import pytest
+from batch import Cancelled
+from combine import combine_incremental, combine_to_file, manifest_path
+
+FILES = {
+    "заказ_1.pnx": ("ЛДСП белый;600;400;2\r\nХДФ 3;800;300;4\r\n\r\n", "cp1251"),
+    "заказ_2.pnx": ("МДФ 16;100;100;1\nЛДСП дуб;1000;500;1", "utf-8"),
+    "заказ_3.pnx": ("Фанера 18;300;200;2\r", "cp1251"),
+    "заказ_4.pnx": ("ХДФ 3;700;300;1\r\n", "utf-8"),
+}
+
+
+def _write(folder, names):
+    for name in names:
+        text, encoding = FILES[name]
+        (folder / name).write_bytes(text.encode(encoding))
+
+
+def _full(tmp_path, names):
+    """Объединение тех же файлов заново, по одному — в порядке names."""
+    chunks = []
+    for n, name in enumerate(names):
+        folder = tmp_path / f"full_{n}"
+        folder.mkdir()
+        _write(folder, [name])
+        output, _ = combine_to_file(str(folder), "заказ", ".pnx")
+        with open(output, "rb") as f:
+            chunks.append(f.read())
+    return b"".join(chunks)
+
+
+def _names(output):
+    with open(manifest_path(output), encoding="utf-8") as f:
+        return [entry["name"] for entry in json.load(f)["files"]]
+
+
+def test_appended_files_same_as_full_combine(tmp_path):
+    folder = tmp_path / "src"
+    folder.mkdir()
+    _write(folder, ["заказ_1.pnx", "заказ_2.pnx"])
+    output, _, new_files, rebuilt = combine_incremental(str(folder), "заказ", ".pnx")
+    assert rebuilt and sorted(new_files) == ["заказ_1.pnx", "заказ_2.pnx"]
+
+    _write(folder, ["заказ_3.pnx", "заказ_4.pnx"])
+    output, all_files, new_files, rebuilt = combine_incremental(str(folder), "заказ", ".pnx")
+    assert not rebuilt and sorted(new_files) == ["заказ_3.pnx", "заказ_4.pnx"]
+    assert all_files == _names(output)
+    with open(output, "rb") as f:
+        assert f.read() == _full(tmp_path, all_files)
+
+
+def test_manifest_decides_rebuild(tmp_path):
+    _write(tmp_path, ["заказ_1.pnx", "заказ_2.pnx"])
+    output, *_ = combine_incremental(str(tmp_path), "заказ", ".pnx")
+    assert combine_incremental(str(tmp_path), "заказ", ".pnx")[2:] == ([], False)
+    # тот же файл записан заново (другой mtime) — сверяется по хэшу, пересборки нет
+    path = tmp_path / "заказ_1.pnx"
+    path.write_bytes(path.read_bytes())
+    os.utime(path, ns=(1, 1))
+    assert combine_incremental(str(tmp_path), "заказ", ".pnx")[2:] == ([], False)
+    # изменённый файл — полная пересборка
+    path.write_bytes("ЛДСП серый;600;400;2\r\n".encode("cp1251"))
+    output, _, _, rebuilt = combine_incremental(str(tmp_path), "заказ", ".pnx")
+    assert rebuilt
+    with open(output, "rb") as f:
+        data = f.read()
+    assert "ЛДСП серый".encode("cp1251") in data and "ЛДСП белый".encode("cp1251") not in data
+
+
+def test_cancel_truncates_appended(tmp_path):
+    _write(tmp_path, ["заказ_1.pnx", "заказ_2.pnx"])
+    output, *_ = combine_incremental(str(tmp_path), "заказ", ".pnx")
+    with open(output, "rb") as f:
+        before = f.read()
+    with open(manifest_path(output), encoding="utf-8") as f:
+        manifest = json.load(f)["files"]
+
+    _write(tmp_path, ["заказ_3.pnx", "заказ_4.pnx"])
+    cancel = threading.Event()
+    with pytest.raises(Cancelled):
+        # отмена после первого дописанного файла
+        combine_incremental(str(tmp_path), "заказ", ".pnx", workers=1, progress=lambda name: cancel.set(),
+                            cancel=cancel)
+    with open(output, "rb") as f:
+        assert f.read() == before
+    with open(manifest_path(output), encoding="utf-8") as f:
+        assert json.load(f)["files"] == manifest
+    # следующий запуск дописывает оба файла без пересборки
+    _, _, new_files, rebuilt = combine_incremental(str(tmp_path), "заказ", ".pnx")
+    assert not rebuilt and sorted(new_files) == ["заказ_3.pnx", "заказ_4.pnx"]
@@ -0,0 +1,36 @@
+import random
+import pytest
+from dedup import Deduplicator, LineSet
+
+
+def test_default_mode_is_files():
+    assert Deduplicator().mode == "files"
+
+
+@pytest.mark.parametrize("max_lines", [1_000_000, 1])
+def test_lines_keeps_repeats_inside_one_file(max_lines):
+    with Deduplicator("lines", max_lines=max_lines) as dedup:
+        assert dedup.unique_lines("a.pnx", [b"x;1", b"x;1", b"", b"y;2"]) == [b"x;1", b"x;1", b"", b"y;2"]
+        # строки одного файла несколькими вызовами — тоже один файл
+        assert dedup.unique_lines("a.pnx", [b"y;2", b"z;3"]) == [b"y;2", b"z;3"]
+        assert dedup.unique_lines("b.pnx", [b"x;1", b"w;4", b"w;4", b"", b"z;3"]) == [b"w;4", b"w;4", b""]
+        assert dedup.dropped == {"b.pnx": 2}
+
+
+def test_spilled_matches_memory():
+    rnd = random.Random(1)
+    files = [[f"{rnd.randint(0, 3000)}".encode() for _ in range(1000)] for _ in range(8)]
+    results = []
+    for max_lines in (1_000_000, 100):
+        with Deduplicator("lines", max_lines=max_lines) as dedup:
+            results.append([dedup.unique_lines(f"{n}.pnx", lines[i:i + 250])
+                            for n, lines in enumerate(files) for i in range(0, len(lines), 250)])
+            spilled = dedup._lines.spilled
+    assert spilled
+    assert results[0] == results[1]
+
+
+def test_lineset_stores_fixed_size_digests():
+    lines = LineSet()
+    lines.add_new([b"a" * 10_000], 1)
+    assert [len(key) for key in lines._seen] == [16]
@@ -0,0 +1,91 @@
+import threading
+import ledger as ledger_module
+from ledger import Ledger, content_hash, file_state
+
+
+def _touch(path, done=frozenset()):
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = content_hash(data)
+    return {"path": path, "error": None, "state": file_state(path, digest), "source_hash": digest}
+
+
+def _run(ledger, paths, **kwargs):
+    results = ledger.iter_files(_touch, paths, fingerprint_of=lambda path: "fp",
+                                skipped_result=lambda path: {"path": path, "skipped": True}, **kwargs)
+    return [(result["path"], result.get("skipped", False)) for result in results]
+
+
+def test_results_in_input_order(tmp_path):
+    paths = []
+    for n in range(6):
+        path = tmp_path / f"{n}.pnx"
+        path.write_bytes(b"x;%d\n" % n)
+        paths.append(str(path))
+    ledger = Ledger(str(tmp_path / "processed.json"))
+    _run(ledger, paths[1::2])  # 1, 3, 5 уже обработаны
+    assert _run(ledger, paths) == [(path, n % 2 == 1) for n, path in enumerate(paths)]
+
+
+def test_cancel_stops_at_first_unprocessed(tmp_path):
+    paths = []
+    for n in range(4):
+        path = tmp_path / f"{n}.pnx"
+        path.write_bytes(b"x;%d\n" % n)
+        paths.append(str(path))
+    ledger = Ledger(str(tmp_path / "processed.json"))
+    _run(ledger, paths[2:])
+    cancel = threading.Event()
+    cancel.set()
+    assert _run(ledger, paths, cancel=cancel) == []
+
+
+def test_done_keys_limited_to_batch_sizes(tmp_path):
+    ledger = Ledger(str(tmp_path / "processed.json"))
+    paths = []
+    for n, data in enumerate([b"a;1\n", b"bb;22\n"]):
+        path = tmp_path / f"{n}.pnx"
+        path.write_bytes(data)
+        paths.append(str(path))
+    _run(ledger, paths)
+    small, large = (content_hash(path.read_bytes()) for path in (tmp_path / "0.pnx", tmp_path / "1.pnx"))
+    assert ledger.done_keys({"fp"}) == {f"fp:{small}", f"fp:{large}"}
+    assert ledger.done_keys({"fp"}, sizes={4}) == {f"fp:{small}"}
+    assert ledger.done_keys({"другая"}, sizes={4, 6}) == frozenset()
+    # размер сохраняется в журнале вместе с ключами
+    assert Ledger(ledger.path).done_keys({"fp"}, sizes={6}) == {f"fp:{large}"}
+
+
+def test_copy_of_processed_file_checked_by_hash(tmp_path):
+    ledger = Ledger(str(tmp_path / "processed.json"))
+    original = tmp_path / "0.pnx"
+    original.write_bytes(b"x;1\n")
+    _run(ledger, [str(original)])
+    copy = tmp_path / "копия.pnx"
+    copy.write_bytes(original.read_bytes())
+    seen = []
+
+    def check(path, done=frozenset()):
+        seen.append(done)
+        return _touch(path, done)
+
+    list(ledger.iter_files(check, [str(copy)], fingerprint_of=lambda path: "fp", skipped_result=dict,
+                           executor="thread"))
+    # копию не пропустить по stat, но её хэш найдётся среди переданных ключей
+    assert seen == [{f"fp:{content_hash(original.read_bytes())}"}]
+
+
+def test_eviction_by_last_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger_module, "LEDGER_MAX_ENTRIES", 2)
+    ledger = Ledger(str(tmp_path / "processed.json"))
+    paths = []
+    for n in range(3):
+        path = tmp_path / f"{n}.pnx"
+        path.write_bytes(b"x;%d\n" % n)
+        paths.append(str(path))
+    _run(ledger, paths[:2])
+    assert _run(ledger, paths[:1]) == [(paths[0], True)]  # 0 использован позже 1
+    _run(ledger, paths[2:])
+    ledger = Ledger(ledger.path)
+    assert sorted(ledger.files) == sorted([paths[0], paths[2]])
+    assert len(ledger.done) == len(ledger.sizes) == 2
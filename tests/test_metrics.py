@@ -0,0 +1,35 @@
+import threading
+import metrics
+from batch import map_files
+
+
+def _counted(path):
+    metrics.count("files")
+    return {"path": path, "error": None}
+
+
+def test_collections_in_threads_are_separate():
+    barrier = threading.Barrier(2)
+    totals = {}
+
+    def run(name, n):
+        with metrics.collect(name) as collected:
+            barrier.wait()
+            for _ in range(n):
+                metrics.count("files")
+            barrier.wait()
+        totals[name] = collected.counters["files"]
+
+    threads = [threading.Thread(target=run, args=(name, n)) for name, n in (("a", 3), ("b", 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert totals == {"a": 3, "b": 5}
+    assert not metrics.active()
+
+
+def test_thread_pool_counts_into_caller():
+    with metrics.collect("pool") as collected:
+        map_files(_counted, [f"{n}.pnx" for n in range(8)], workers=4, executor="thread")
+    assert collected.counters["files"] == 8
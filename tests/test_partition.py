@@ -0,0 +1,67 @@
+import os
+from partition import WriterPool, partition_files
+from split import compile_rules, split_into_categories
+from utils import OUTPUT_LINESEP
+
+RULES = {"ЛДСП": ["лдсп"], "ХДФ": ["хдф"]}
+
+
+def _outputs(folder):
+    result = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), "rb") as f:
+            result[name] = f.read().decode("cp1251")
+    return result
+
+
+def test_line_breaks_same_in_any_encoding(tmp_path):
+    text = "ЛДСП белый;600;2025-03-01\r\nХДФ 3;800\x0cЛДСП;1;2025-03-02\r\n\xa0\r\nпрочее\x1d;1\r\n"
+    results = {}
+    for encoding in ("cp1251", "utf-8"):
+        source = tmp_path / encoding
+        source.mkdir()
+        path = source / "cutlist_2025-03-14.pnx"
+        path.write_bytes(text.encode(encoding))
+        out = tmp_path / f"out_{encoding}"
+        partition_files([str(path)], str(out), compile_rules(RULES), date_field="last")
+        results[encoding] = _outputs(out)
+    assert results["cp1251"] == results["utf-8"]
+    assert results["cp1251"]["2025-03-02 ЛДСП.pnx"] == "ЛДСП;1;2025-03-02"
+
+
+def test_writer_pool_evicts_least_recently_used(tmp_path):
+    paths = {name: str(tmp_path / name) for name in "abc"}
+    with WriterPool(max_open=2) as pool:
+        for name in "abac":  # c вытесняет b (a использован позже)
+            pool.write(paths[name], name.encode())
+        assert list(pool._open) == [paths["a"], paths["c"]]
+        assert pool.reopened == 0
+        pool.write(paths["b"], b"b")  # b открывается на дозапись, вытесняется a
+        pool.write(paths["c"], b"c")
+        assert pool.reopened == 1
+        assert list(pool._open) == [paths["b"], paths["c"]]
+    assert not pool._open
+    expected = {"a": [b"a", b"a"], "b": [b"b", b"b"], "c": [b"c", b"c"]}
+    for name, parts in expected.items():
+        with open(paths[name], "rb") as f:
+            assert f.read() == OUTPUT_LINESEP.join(parts)
+
+
+def test_few_open_files_same_result(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    paths = []
+    for day in (1, 2, 3):
+        path = source / f"cutlist_2025-03-0{day}.pnx"
+        path.write_bytes("\r\n".join(["ЛДСП белый;600", "ХДФ 3;800", "МДФ;1", f"ЛДСП дуб;{day}"]).encode("cp1251"))
+        paths.append(str(path))
+    results = {}
+    for max_open in (1, 2, 64):
+        out = tmp_path / f"out_{max_open}"
+        partition_files(paths, str(out), compile_rules(RULES), max_open=max_open)
+        results[max_open] = _outputs(out)
+    assert results[1] == results[2] == results[64]
+    # раздел одного дня — то же, что разделение файла этого дня
+    split_into_categories(paths[0], compile_rules(RULES), streaming=False)
+    with open(os.path.join(source, "2025-03-01 ЛДСП.pnx"), "rb") as f:
+        assert results[1]["2025-03-01 ЛДСП.pnx"] == f.read().decode("cp1251")
@@ -0,0 +1,51 @@
+import os
+import pytest
+from add_date import add_date_to_file
+from pipeline import process_file
+from replace import compile_replace_rules, replace_in_file
+from split import compile_rules, split_into_categories
+
+LINES = ["ЛДСП белый 16;600;400;2", "ХДФ 3;800;300;4", "", "МДФ 16;100;100;1", "ЛДСП дуб 16;1000;500;1"]
+REPLACE_RULES = [{"old": "ЛДСП", "new": "ДСП"}, {"old": "МДФ 16", "new": "MDF 16"}]
+SPLIT_RULES = {"ДСП": ["дсп"], "ХДФ": ["хдф"]}
+NAME = "cutlist_2025-03-14.pnx"
+
+
+def _write(folder, encoding, newline):
+    path = folder / NAME
+    path.write_bytes(newline.join(LINES).encode(encoding) + newline.encode())
+    return str(path)
+
+
+def _files(folder):
+    return {name: (folder / name).read_bytes() for name in sorted(os.listdir(folder))}
+
+
+@pytest.mark.parametrize("encoding", ["cp1251", "utf-8"])
+@pytest.mark.parametrize("newline", ["\r\n", "\n"])
+@pytest.mark.parametrize("stages", ["replace", "date", "split", "replace+date+split", "replace+date"])
+def test_fused_same_as_separate_steps(tmp_path, encoding, newline, stages):
+    compiled = compile_replace_rules(REPLACE_RULES) if "replace" in stages else None
+    date_mode = "from_filename" if "date" in stages else None
+    classifier = compile_rules(SPLIT_RULES) if "split" in stages else None
+
+    separate = tmp_path / "separate"
+    separate.mkdir()
+    path = _write(separate, encoding, newline)
+    if compiled is not None:
+        assert replace_in_file(path, compiled)["error"] is None
+    if date_mode:
+        assert add_date_to_file(path, date_mode)["error"] is None
+    if classifier is not None:
+        split_into_categories(path, classifier)
+        os.remove(path)  # с разделением исходный файл в конвейере не меняется
+
+    fused = tmp_path / "fused"
+    fused.mkdir()
+    path = _write(fused, encoding, newline)
+    result = process_file(path, compiled, date_mode, "", classifier, str(fused))
+    assert result["error"] is None
+    if classifier is not None:
+        assert (fused / NAME).read_bytes() == (newline.join(LINES) + newline).encode(encoding)
+        os.remove(path)
+    assert _files(fused) == _files(separate)
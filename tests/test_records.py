@@ -0,0 +1,77 @@
+import random
+from records import PnxTable
+from replace import CompiledReplaceRules, compile_replace_rules
+
+TEXTS = [
+    "",
+    "\n",
+    "ЛДСП;600;400;2\nХДФ;800;300;4\n",
+    "ЛДСП;600;400;2\r\nХДФ;800;300;4\r\n",
+    "ЛДСП;600;400;2\r\nХДФ;800\nМДФ\r\n",  # \r\n вперемешку с \n — \r остаётся в поле
+    "ЛДСП;600;;2;\n;;\n\nХДФ",  # пустые поля, пустая строка, нет перевода строки в конце
+]
+
+
+def _random_texts(seed=0):
+    rnd = random.Random(seed)
+    fields = ["ЛДСП", "ХДФ 3", "", "600", " 16 ", "дуб"]
+    for _ in range(200):
+        newline = rnd.choice(["\n", "\r\n"])
+        lines = [";".join(rnd.choice(fields) for _ in range(rnd.randint(1, 5))) for _ in range(rnd.randint(0, 8))]
+        yield newline.join(lines) + rnd.choice(["", newline])
+
+
+def test_round_trip():
+    for text in TEXTS + list(_random_texts()):
+        table = PnxTable.from_text(text)
+        assert table.to_text() == text
+        newline = table.newline
+        body = text[:-len(newline)] if text.endswith(newline) else text
+        assert list(table.rows()) == ([line.split(";") for line in body.split(newline)] if text else [])
+        assert PnxTable.from_bytes(text.encode("cp1251"), "cp1251").to_bytes() == text.encode("cp1251")
+
+
+def test_set_values_merges_codes():
+    table = PnxTable.from_text("ЛДСП 16;1\nЛДСП16;2\nХДФ;3\n")
+    column = table.column(0)
+    assert column.map_values(lambda value: value.replace(" ", ""))
+    assert column.values == [None, "ЛДСП16", "ХДФ"]
+    assert column.counts() == [0, 2, 1]
+    assert not column.map_values(lambda value: value)
+    assert table.to_text() == "ЛДСП16;1\nЛДСП16;2\nХДФ;3\n"
+    assert table.column(5).decoded() == [None, None, None]
+
+
+RULES = [
+    {"old": "ЛДСП", "new": "ДСП", "column": 1},
+    {"old": "16", "new": "18", "column": 3},
+    {"old": "ДСП", "new": "DSP"},  # для всей строки — видит результат правила для столбца
+    {"old": "дуб", "new": "oak", "column": 5},
+]
+
+
+def _by_lines(text):
+    """То же построчно: каждое правило — по отдельности, к своему полю (или строке) каждой строки."""
+    counts = [0] * len(RULES)
+    newline = "\r\n" if "\r\n" in text else "\n"
+    lines = text.split(newline)
+    for i, rule in enumerate(RULES):
+        compiled = CompiledReplaceRules([rule], "sequential")
+        for n, line in enumerate(lines):
+            if rule.get("column") is None:
+                lines[n], (count,) = compiled.apply(line)
+            else:
+                fields = line.split(";")
+                j = rule["column"] - 1
+                if j >= len(fields):
+                    continue
+                fields[j], (count,) = compiled.apply(fields[j])
+                lines[n] = ";".join(fields)
+            counts[i] += count
+    return newline.join(lines), counts
+
+
+def test_column_rules_same_as_per_line():
+    compiled = compile_replace_rules(RULES)
+    for text in list(_random_texts(1)) + ["ЛДСП 16;ЛДСП;16 16;x;дуб\nЛДСП;16\n"]:
+        assert compiled.apply(text) == _by_lines(text), text
@@ -0,0 +1,75 @@
+import random
+import pytest
+from replace import CompiledReplaceRules, PatternReplaceRules
+
+MERGEABLE = [
+    [{"old": "ЛДСП", "new": "LDSP", "regex": True}, {"old": r"МФ ?[0-9]+", "new": "MF", "regex": True}],
+    [{"old": "(тимбер|timber)", "new": r"<\1>", "regex": True}, {"old": "[А-Я]{2,}", "new": "_", "regex": True}],
+    [{"old": "лдсп", "new": "LDSP", "word": True}, {"old": "хвоя", "new": "pine", "word": True}],
+    [{"old": "a", "new": "b", "word": True}, {"old": r"(?:c|d)+", "new": "e", "regex": True, "word": True}],
+]
+NOT_MERGED = [
+    [{"old": r"(?i)лдсп", "new": "x", "regex": True}, {"old": "мдф", "new": "y"}],
+    [{"old": r"(?<=;)лдсп", "new": "x", "regex": True}, {"old": "мдф", "new": "y"}],
+    [{"old": r"(л)\1", "new": "x", "regex": True}, {"old": "мдф", "new": "y"}],
+    [{"old": r"л.п", "new": "x", "regex": True}, {"old": "мдф", "new": "y"}],
+    [{"old": r"\w+", "new": "x", "regex": True}, {"old": ";", "new": ","}],
+    [{"old": "[^;]", "new": "x", "regex": True}, {"old": ";", "new": ","}],
+    [{"old": "a*", "new": "x", "regex": True}, {"old": ";", "new": ","}],
+    [{"old": "ab", "new": "b"}, {"old": "b", "new": "c"}],  # замена даёт символы следующего
+]
+
+
+def _texts(alphabet, seed=0):
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40))) for _ in range(300)]
+
+
+@pytest.mark.parametrize("rules", MERGEABLE + NOT_MERGED)
+def test_auto_matches_sequential(rules):
+    auto = PatternReplaceRules(rules, "auto")
+    sequential = PatternReplaceRules(rules, "sequential")
+    alphabet = "ЛДСПМФлдспхвоямдфтимберabcdeАЯ0123456789 ;\\1<>_-"
+    for text in _texts(list(alphabet) + ["ЛДСП", "лдсп", "хвоя", "МФ 16", "тимбер", "timber"]):
+        assert auto.apply(text) == sequential.apply(text), text
+
+
+@pytest.mark.parametrize("rules", MERGEABLE)
+def test_simple_rules_are_merged(rules):
+    assert PatternReplaceRules(rules, "auto")._merged is not None
+
+
+@pytest.mark.parametrize("rules", NOT_MERGED)
+def test_complex_rules_are_not_merged(rules):
+    assert PatternReplaceRules(rules, "auto")._merged is None
+
+
+OVERLAPPING = [
+    [{"old": "bc", "new": "Y"}, {"old": "ab", "new": "X"}],  # "abc": sequential — "aY", один проход — "Xc"
+    [{"old": "ЛДСП", "new": "Q"}, {"old": "ЛДСП 16", "new": "Z"}, {"old": "16 бел", "new": "W"}],
+    [{"old": "a", "new": "1"}, {"old": "aa", "new": "2"}, {"old": "ba", "new": "3"}],
+]
+
+
+@pytest.mark.parametrize("rules", OVERLAPPING)
+def test_literal_auto_falls_back_to_sequential(rules):
+    auto = CompiledReplaceRules(rules, "auto")
+    single_pass = CompiledReplaceRules(rules, "single_pass")
+    sequential = CompiledReplaceRules(rules, "sequential")
+    assert auto.mode == "auto"  # правила не цепочка — остаётся однопроходный поиск
+    differs = 0
+    for text in _texts(["a", "b", "c", "ЛДСП", " ", "16", "бел", ";"], seed=1):
+        expected = sequential.apply(text)
+        assert auto.apply(text) == expected, text
+        differs += single_pass.apply(text) != expected
+        encoded = text.encode("cp1251")
+        assert auto.encoded("cp1251").apply(encoded) == sequential.encoded("cp1251").apply(encoded)
+    assert differs  # без возврата к sequential результат разошёлся бы
+
+
+def test_chained_rules_compile_sequential():
+    rules = [{"old": "a", "new": "b"}, {"old": "b", "new": "c"}]
+    compiled = CompiledReplaceRules(rules, "auto")
+    assert compiled.mode == "sequential"
+    assert compiled.apply("ab") == ("cc", [1, 2])
+    assert compiled.fingerprint == CompiledReplaceRules(rules, "sequential").fingerprint
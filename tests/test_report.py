@@ -0,0 +1,85 @@
+import os
+import pytest
+from records import PnxTable
+from report import aggregate_bytes, aggregate_file, aggregate_table, build_report
+from split import compile_rules
+
+ROWS = ["ЛДСП белый;600;400;2", "ЛДСП белый;1000;500;1", "ХДФ 3;800;300;4"]
+RULES = {"ЛДСП": ["лдсп"], "ХДФ": ["хдф"]}
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+def test_newlines_give_same_rows(tmp_path, newline):
+    path = tmp_path / "cutlist_2025-03-14.pnx"
+    path.write_bytes(newline.join(ROWS).encode("cp1251") + newline.encode())
+    result = aggregate_file(str(path), compile_rules(RULES), area_columns=[2, 3, 4])
+    assert result["error"] is None
+    assert result["rows"] == 3
+    groups = result["groups"]
+    assert sorted(groups) == [("ЛДСП", "ЛДСП белый", "2025-03-14"), ("ХДФ", "ХДФ 3", "2025-03-14")]
+    ldsp = groups[("ЛДСП", "ЛДСП белый", "2025-03-14")]
+    assert ldsp["rows"] == 2
+    assert ldsp["sums"] == {2: 1600.0, 3: 900.0, 4: 3.0}
+    assert ldsp["area"] == pytest.approx(0.98)
+
+
+@pytest.mark.parametrize("area_columns", [[2, 3], [2, 3, 4], [2, 3, 4, 4]])
+def test_area_without_numpy_any_length(area_columns):
+    table = PnxTable.from_text("\n".join(ROWS) + "\n")
+    expected = aggregate_table(table, compile_rules(RULES), "", [], area_columns, use_numpy=False)
+    area = {key: group["area"] for key, group in expected.items()}
+    rows = [row.split(";") for row in ROWS]
+    for (_, material, _), value in area.items():
+        total = 0.0
+        for row in rows:
+            if row[0] == material:
+                product = 1.0
+                for index in area_columns:
+                    product *= float(row[index - 1])
+                total += product
+        assert value == pytest.approx(total / 1e6)
+
+
+def test_build_report_rejects_bad_area_columns(tmp_path):
+    with pytest.raises(ValueError, match="три столбца"):
+        build_report(str(tmp_path), area_columns=[2, 3])
+
+
+def _groups(groups):
+    return {key: (group["rows"], {index: pytest.approx(value) for index, value in group["sums"].items()},
+                  pytest.approx(group["area"])) for key, group in groups.items()}
+
+
+@pytest.mark.parametrize("rows", [
+    ROWS,
+    ["ЛДСП белый;600,5;-400;2", "ЛДСП белый;.5;400.;", "ХДФ 3;007;0,001;4"],
+    ["ЛДСП белый; 600 ;1e3;2", "ХДФ 3;+800;123456789012345678;4"],  # через parse_number
+    ["ЛДСП белый;600;abc;2", "ХДФ 3;800;1.2.3;-"],  # нечисловые столбцы
+    ["﻿ЛДСП белый;600;400;2", ";1;2;3", "ХДФ 3;800;300;4"],
+])
+@pytest.mark.parametrize("columns", [None, [2, 4, 7]])
+def test_bulk_same_as_table(rows, columns):
+    pytest.importorskip("numpy")
+    data = "\r\n".join(rows).encode("utf-8")
+    classifier = compile_rules(RULES)
+    expected = aggregate_table(PnxTable.from_normalized(data, "utf-8"), classifier, "2025-03-14",
+                               columns, [2, 3, 4])
+    groups = aggregate_bytes(data, "utf-8", classifier, "2025-03-14", columns, [2, 3, 4])
+    assert _groups(groups) == _groups(expected)
+
+
+def test_bulk_needs_same_field_count():
+    pytest.importorskip("numpy")
+    data = "\n".join(ROWS + ["ХДФ 3;800"]).encode("cp1251")
+    assert aggregate_bytes(data, "cp1251", compile_rules(RULES), "") is None
+
+
+def test_build_report_skips_own_outputs(tmp_path):
+    data = ("\r\n".join(ROWS) + "\r\n").encode("cp1251")
+    (tmp_path / "cutlist_2025-03-14.pnx").write_bytes(data)
+    # результаты разделения, разбиения по датам и объединения — те же строки ещё раз
+    for name in ["2025-03-14_cutlist ЛДСП.pnx", "2025-03-14 прочее.pnx", "объединено_cutlist.pnx"]:
+        (tmp_path / name).write_bytes(data)
+    output, results = build_report(str(tmp_path), split_rules=RULES)
+    assert [os.path.basename(result["path"]) for result in results] == ["cutlist_2025-03-14.pnx"]
+    assert sum(result["rows"] for result in results) == 3
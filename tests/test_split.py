@@ -0,0 +1,81 @@
+import io
+import os
+import pytest
+import split
+from split import compile_rules, output_prefix, split_into_categories
+from utils import iter_line_blocks
+
+RULES = {"ЛДСП": ["лдсп"], "ХДФ": ["хдф"], "Фанера": ["фанера 18"]}
+LINES = ["ЛДСП белый;600;400;2", "ХДФ 3;800;300;4", "", "Фанера 18 мм;1;1;1", "МДФ;5;5;5", "лдсп-Galif;1;2;3"]
+
+
+def _write(folder, text, encoding, newline):
+    folder.mkdir()
+    path = folder / "cutlist_2025-03-14.pnx"
+    path.write_bytes(newline.join(text).encode(encoding) + newline.encode())
+    return str(path)
+
+
+def _outputs(folder):
+    result = {}
+    for name in sorted(os.listdir(folder)):
+        if not name.startswith("cutlist"):
+            with open(os.path.join(folder, name), "rb") as f:
+                result[name] = f.read()
+    return result
+
+
+def _streaming(path, classifier):
+    base_name, ext = os.path.splitext(os.path.basename(path))
+    return split._split_streaming(path, classifier, os.path.dirname(path), output_prefix(base_name), ext)
+
+
+@pytest.mark.parametrize("encoding", ["cp1251", "utf-8"])
+@pytest.mark.parametrize("newline", ["\r\n", "\n", "\r"])
+@pytest.mark.parametrize("extra", ["", "\x0c"])
+def test_streaming_matches_in_memory(tmp_path, encoding, newline, extra):
+    classifier = compile_rules(RULES)
+    text = LINES + [f"ХДФ 4{extra}ЛДСП;1"]
+    memory = split_into_categories(_write(tmp_path / "memory", text, encoding, newline), classifier, streaming=False)
+    streamed = _streaming(_write(tmp_path / "stream", text, encoding, newline), classifier)
+    assert [(os.path.basename(p), n) for p, n in memory] == [(os.path.basename(p), n) for p, n in streamed]
+    assert _outputs(tmp_path / "memory") == _outputs(tmp_path / "stream")
+
+
+def test_line_blocks_bounded_for_cr_only_files():
+    data = b"\r".join(b"%d;x" % n for n in range(10_000)) + b"\r"
+    blocks = list(iter_line_blocks(io.BytesIO(data), block_size=1024))
+    assert b"".join(blocks) == data
+    assert max(map(len, blocks)) <= 1024 + 16
+    assert all(block.endswith(b"\r") for block in blocks)
+
+
+def test_line_blocks_keep_crlf_together():
+    data = b"a\r\nb\r\nc"
+    for size in range(1, len(data) + 1):
+        blocks = list(iter_line_blocks(io.BytesIO(data), block_size=size))
+        assert b"".join(blocks) == data
+        assert not any(block.startswith(b"\n") for block in blocks)
+
+
+@pytest.mark.parametrize("encoding", ["cp1251", "utf-8"])
+@pytest.mark.parametrize("newline", ["\r\n", "\n", "\r"])
+@pytest.mark.parametrize("chunk_size", [7, 64, split.MMAP_CHUNK_SIZE])
+def test_mmap_matches_in_memory(tmp_path, monkeypatch, encoding, newline, chunk_size):
+    monkeypatch.setattr(split, "MMAP_CHUNK_SIZE", chunk_size)  # границы кусков посреди строк и \r\n
+    classifier = compile_rules(RULES)
+    # файл в utf-8 копируется байтами, только если он чистый ASCII
+    text = (LINES if encoding == "cp1251" else ["MDF 16;5;5;5", "", "HDF;1;1;1"]) * 20
+    memory = split_into_categories(_write(tmp_path / "memory", text, encoding, newline), classifier, streaming=False)
+    path = _write(tmp_path / "mmap", text, encoding, newline)
+    base_name, ext = os.path.splitext(os.path.basename(path))
+    mapped = split._split_mmap(path, classifier, os.path.dirname(path), output_prefix(base_name), ext)
+    assert mapped is not None
+    assert [(os.path.basename(p), n) for p, n in memory] == [(os.path.basename(p), n) for p, n in mapped]
+    assert _outputs(tmp_path / "memory") == _outputs(tmp_path / "mmap")
+
+
+def test_mmap_declines_non_cp1251(tmp_path):
+    path = _write(tmp_path / "utf8", LINES, "utf-8", "\n")
+    base_name, ext = os.path.splitext(os.path.basename(path))
+    assert split._split_mmap(path, compile_rules(RULES), os.path.dirname(path), output_prefix(base_name), ext) is None
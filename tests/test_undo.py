@@ -0,0 +1,82 @@
+import os
+import pytest
+from add_date import iter_add_date
+from replace import compile_replace_rules, iter_replacements
+from undo import UndoJournal, apply_delta, iter_undo, make_delta, read_journal
+
+LINES = ["ЛДСП белый 16;600;400;2", "ХДФ 3;800;300;4", "", "МДФ 16;100;100;1", "ЛДСП дуб 16;1000;500;1"]
+REPLACE_RULES = [{"old": "ЛДСП", "new": "ДСП"}, {"old": "МДФ 16", "new": "MDF 16"}]
+
+
+@pytest.mark.parametrize("original, output", [
+    (b"a;1\r\nb;2\r\n", b"a;1;x;\r\nb;2;x;\r\n"),  # дописан хвост
+    (b"a;1\nbcd;2\n\n", b"a;1\nbXd;2\n\n"),  # изменена середина строки
+    (b"a;1\nb;2", b"a;1\r\nb;2"),  # сменились переводы строк
+    (b"a\r\nb\nc\r", b"a\nb\nc\n"),  # смешанные переводы строк
+    (b"x" * 500 + b"\n", b"y" * 500 + b"\n"),
+    (b"", b"a\n"),
+])
+def test_delta_round_trip(original, output):
+    assert apply_delta(output, make_delta(original, output)) == original
+
+
+def _make_files(folder, encoding):
+    for i in range(4):
+        lines = LINES[i:] + LINES[:i]
+        (folder / f"cutlist_{i}_2025-03-{i + 1:02d}.pnx").write_bytes(
+            "\r\n".join(lines).encode(encoding) + b"\r\n")
+    (folder / "без_изменений.pnx").write_bytes("ХДФ;1\n".encode(encoding))
+
+
+def _files(folder):
+    return {name: (folder / name).read_bytes() for name in sorted(os.listdir(folder))}
+
+
+def _apply(operation, folder, journal, **kwargs):
+    paths = sorted(str(folder / name) for name in os.listdir(folder))
+    if operation == "replace":
+        results = iter_replacements(compile_replace_rules(REPLACE_RULES), paths, journal=journal, **kwargs)
+    else:
+        results = iter_add_date(paths, "manual", "2025-04-01", journal=journal, **kwargs)
+    return list(results)
+
+
+@pytest.mark.parametrize("operation", ["replace", "add_date"])
+@pytest.mark.parametrize("encoding", ["cp1251", "utf-8"])
+@pytest.mark.parametrize("executor", ["process", "async"])
+def test_undo_restores_original(tmp_path, operation, encoding, executor):
+    folder = tmp_path / "files"
+    folder.mkdir()
+    _make_files(folder, encoding)
+    before = _files(folder)
+    journal = UndoJournal(operation, folder=str(tmp_path / "undo"))
+    results = _apply(operation, folder, journal, workers=2, executor=executor)
+    written = sum(result["written"] for result in results)
+    assert written and _files(folder) != before
+    assert len(read_journal(journal.path)[1]) == journal.files == written
+
+    assert all(result["restored"] for result in iter_undo(journal.path))
+    assert _files(folder) == before
+    assert not os.path.exists(journal.path)
+
+
+def test_file_changed_after_operation_is_kept(tmp_path):
+    folder = tmp_path / "files"
+    folder.mkdir()
+    _make_files(folder, "cp1251")
+    before = _files(folder)
+    journal = UndoJournal("replace", folder=str(tmp_path / "undo"))
+    _apply("replace", folder, journal)
+    changed = folder / "cutlist_0_2025-03-01.pnx"
+    changed.write_bytes(b"\xcd\xee\xe2\xee\xe5\r\n")
+
+    results = {os.path.basename(result["path"]): result for result in iter_undo(journal.path)}
+    assert results["cutlist_0_2025-03-01.pnx"]["error"]
+    assert changed.read_bytes() == b"\xcd\xee\xe2\xee\xe5\r\n"
+    after = _files(folder)
+    assert {name: data for name, data in after.items() if name != changed.name} == \
+        {name: data for name, data in before.items() if name != changed.name}
+    # журнал остаётся; повторная отмена не трогает уже восстановленные файлы
+    assert os.path.exists(journal.path)
+    again = list(iter_undo(journal.path))
+    assert sum(result["restored"] for result in again) == len(again) - 1
@@ -0,0 +1,30 @@
+import pytest
+import utils
+from utils import detect_file_encoding, read_bytes, read_text
+
+SAMPLES = {
+    "ascii": (b"plain;1;2\r\n", "utf-8"),
+    "empty": (b"", "utf-8"),
+    "utf-8": ("ЛДСП белый;600\r\n".encode("utf-8") * 50, "utf-8"),
+    "utf-8-sig": ("﻿ХДФ;1\n".encode("utf-8"), "utf-8"),
+    "cp1251": ("ЛДСП белый;600\r\n".encode("cp1251") * 50, "cp1251"),
+    "latin-1": (b"abc\x98def;\xe9\n", "latin-1"),
+    "cut utf-8": ("ЛДСП".encode("utf-8")[:-1], "cp1251"),
+}
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+def test_all_readers_agree_on_encoding(tmp_path, name, chunk_size):
+    data, expected = SAMPLES[name]
+    path = tmp_path / "file.pnx"
+    path.write_bytes(data)
+    found = []
+    for read in (lambda: read_text(str(path))[1], lambda: read_bytes(str(path))[1],
+                 lambda: detect_file_encoding(str(path), chunk_size)):
+        utils._encoding_cache.clear()
+        found.append(read())
+    assert found == [expected] * 3
+    utils._encoding_cache.clear()
+    text, _ = read_text(str(path))
+    assert text == data.decode(expected).replace("\r\n", "\n").replace("\r", "\n")
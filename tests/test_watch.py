@@ -0,0 +1,61 @@
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+import watch
+from watch import IN_Q_OVERFLOW, FolderWatch, InotifyWatcher
+
+
+def _run_until(folder_watch, count, seconds=10):
+    stop = threading.Event()
+    thread = threading.Thread(target=folder_watch.run, args=(stop,))
+    thread.start()
+    deadline = time.monotonic() + seconds
+    while len(folder_watch.results) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stop.set()
+    thread.join()
+    return folder_watch.results
+
+
+@pytest.mark.parametrize("error", [RuntimeError("сбой"), BrokenProcessPool("процесс пула умер")])
+def test_failed_file_is_logged_and_watch_goes_on(tmp_path, monkeypatch, error):
+    real = watch.process_file
+
+    def process_file(path, *stages):
+        if path.endswith("плохой.pnx"):
+            raise error
+        return real(path, *stages)
+
+    monkeypatch.setattr(watch, "process_file", process_file)
+    (tmp_path / "плохой.pnx").write_bytes(b"A;1\r\n")
+    log = []
+    folder_watch = FolderWatch(str(tmp_path), settle=0, executor="thread", process_existing=True,
+                               use_inotify=False, log=log.append)
+    assert len(_run_until(folder_watch, 1)) == 1
+    # после сбоя (и замены сломанного пула) следующий файл обрабатывается
+    (tmp_path / "хороший.pnx").write_bytes(b"B;2\r\n")
+    results = _run_until(folder_watch, 2)
+    errors = {os.path.basename(result["path"]): result["error"] for result in results}
+    assert str(error) in errors["плохой.pnx"]
+    assert errors["хороший.pnx"] is None
+    assert any("плохой.pnx" in line and "Ошибка" in line for line in log)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify только в Linux")
+def test_queue_overflow_rescans_folder(tmp_path):
+    (tmp_path / "a.pnx").write_bytes(b"")
+    (tmp_path / "b.pnx").write_bytes(b"")
+    watcher = InotifyWatcher(str(tmp_path))
+    os.close(watcher._fd)
+    read_fd, write_fd = os.pipe()
+    watcher._fd = read_fd
+    os.write(write_fd, struct.pack("iIII", -1, IN_Q_OVERFLOW, 0, 0))
+    try:
+        assert watcher.changes(1) == {"a.pnx", "b.pnx"}
+    finally:
+        watcher.close()
+        os.close(write_fd)
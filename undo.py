@@ -0,0 +1,305 @@
+# undo.py
+# Отмена пачки правок на месте ("Замена текста", "Добавить дату"). Вместо резервных
+# копий на каждую пачку пишется журнал в папке PNXTool\undo — JSONL, по строке на
+# изменённый файл: путь, sha1 до и после правки и компактная разница:
+#   по строкам — для строк, к которым только дописан хвост (добавленная дата), —
+#   диапазоны [первая, после последней, длина хвоста]; для остальных изменённых —
+#   [номер, общее начало, общий конец, исходная середина];
+#   "zlib" — сжатое исходное содержимое, если разница по строкам не короче
+#   (сменились переводы строк, кодировка и т.п.).
+# Отмена проходит журнал один раз с конца: файл восстанавливается, только если его
+# содержимое совпадает с записанным после правки, результат сверяется с хэшем "до".
+# Байты в JSON — строки latin-1 (без потерь и без base64).
+import argparse
+import base64
+import json
+import os
+import sys
+import zlib
+from datetime import datetime
+from itertools import groupby
+from ledger import content_hash
+from utils import app_data_dir, write_bytes
+
+UNDO_FOLDER = os.path.join(app_data_dir(), "undo")
+UNDO_VERSION = 1
+UNDO_KEEP = 20  # журналов каждой операции; более старые удаляются
+OPERATIONS = ("replace", "add_date")
+# если разница по строкам больше этой доли файла — пробуем сжатое исходное содержимое
+ZLIB_MIN_RATIO = 8
+
+
+def _line_sep(data: bytes):
+    """Перевод строки файла: b"\\r\\n" или b"\\n"; None — смешанные или одиночные \\r."""
+    if b"\r" not in data:
+        return b"\n"
+    crlf = data.count(b"\r\n")
+    if crlf == data.count(b"\r") == data.count(b"\n"):
+        return b"\r\n"
+    return None
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _common_suffix(a: bytes, b: bytes, limit: int) -> int:
+    i = 0
+    while i < limit and a[-1 - i] == b[-1 - i]:
+        i += 1
+    return i
+
+
+def _line_delta(original: bytes, output: bytes):
+    """Разница по строкам или None, если строки не сопоставляются одна к одной."""
+    old_sep, new_sep = _line_sep(original), _line_sep(output)
+    if old_sep is None or new_sep is None:
+        return None
+    old_lines, new_lines = original.split(old_sep), output.split(new_sep)
+    if len(old_lines) != len(new_lines):
+        return None
+    # длина дописанного хвоста каждой строки (0 — не изменилась, -1 — изменена иначе);
+    # подряд идущие строки с одинаковым хвостом — один диапазон
+    tails = [len(new) - len(old) if new.startswith(old) else -1 for old, new in zip(old_lines, new_lines)]
+    append, spans = [], []
+    start = 0
+    for n, run in groupby(tails):
+        end = start + len(list(run))
+        if n > 0:
+            append.append([start, end, n])
+        elif n < 0:
+            for i in range(start, end):
+                old, new = old_lines[i], new_lines[i]
+                p = _common_prefix(old, new)
+                s = _common_suffix(old, new, min(len(old), len(new)) - p)
+                spans.append([i, p, s, old[p:len(old) - s].decode("latin-1")])
+        start = end
+    return {"lines": len(new_lines), "old_sep": old_sep.decode("ascii"), "new_sep": new_sep.decode("ascii"),
+            "append": append, "spans": spans}
+
+
+def _delta_size(delta) -> int:
+    """Примерный размер разницы в журнале (без сериализации)."""
+    return 16 * len(delta["append"]) + sum(24 + len(span[3]) for span in delta["spans"])
+
+
+def make_delta(original: bytes, output: bytes) -> dict:
+    """Запись для отмены правки original → output: разница по строкам или сжатый оригинал."""
+    delta = _line_delta(original, output)
+    if delta is not None and _delta_size(delta) * ZLIB_MIN_RATIO <= len(original):
+        return delta
+    packed = zlib.compress(original, 6)
+    if delta is not None and _delta_size(delta) <= len(packed):
+        return delta
+    return {"zlib": base64.b64encode(packed).decode("ascii")}
+
+
+def apply_delta(current: bytes, delta: dict) -> bytes:
+    """Исходное содержимое по текущему (после правки) и записи make_delta."""
+    if "zlib" in delta:
+        return zlib.decompress(base64.b64decode(delta["zlib"]))
+    lines = current.split(delta["new_sep"].encode("ascii"))
+    if len(lines) != delta["lines"]:
+        raise ValueError("число строк не совпадает с журналом")
+    for start, end, n in delta["append"]:
+        lines[start:end] = [line[:-n] for line in lines[start:end]]
+    for i, p, s, middle in delta["spans"]:
+        line = lines[i]
+        lines[i] = line[:p] + middle.encode("latin-1") + line[len(line) - s:]
+    return delta["old_sep"].encode("ascii").join(lines)
+
+
+def journal_files(operation=None, folder: str = UNDO_FOLDER):
+    """Журналы отмены (операции operation или всех), новые первыми."""
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    suffix = f"-{operation}.jsonl" if operation else ".jsonl"
+    return [os.path.join(folder, name) for name in sorted(names, reverse=True) if name.endswith(suffix)]
+
+
+def latest_journal(operation=None, folder: str = UNDO_FOLDER):
+    files = journal_files(operation, folder)
+    return files[0] if files else None
+
+
+class UndoJournal:
+    """
+    Журнал отмены одной пачки. Обработчику передаётся undo=True (см. batch.FileOperation),
+    и result["undo"] каждого записанного файла переносится сюда через record().
+    Файл журнала создаётся при первой записи и дописывается построчно — после сбоя
+    посреди пачки уже изменённые файлы всё равно можно вернуть.
+    """
+
+    def __init__(self, operation: str, folder: str = UNDO_FOLDER):
+        self.operation = operation
+        self.folder = folder
+        self.path = None
+        self.files = 0
+        self._file = None
+
+    def _open(self):
+        os.makedirs(self.folder, exist_ok=True)
+        for old in journal_files(self.operation, self.folder)[UNDO_KEEP - 1:]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        now = datetime.now()
+        self.path = os.path.join(self.folder, f"{now:%Y%m%d-%H%M%S-%f}-{self.operation}.jsonl")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write({"version": UNDO_VERSION, "operation": self.operation,
+                     "created": now.isoformat(timespec="seconds")})
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def record(self, result):
+        """Переносит result["undo"] (если файл был записан) в журнал."""
+        entry = result.pop("undo", None)
+        if entry is None or not result.get("written"):
+            return
+        if self._file is None:
+            self._open()
+        self._write({"path": os.path.abspath(result["path"]), **entry})
+        self.files += 1
+
+    def record_all(self, results):
+        """Результаты пачки как есть, с записью каждого в журнал; журнал закрывается в конце."""
+        try:
+            for result in results:
+                self.record(result)
+                yield result
+        finally:
+            self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def undo_entry(original: bytes, output: bytes, before: str, after: str) -> dict:
+    """Содержимое result["undo"]: хэши до и после правки и разница (make_delta)."""
+    return {"before": before, "after": after, "delta": make_delta(original, output)}
+
+
+def read_journal(path):
+    """(заголовок, записи по файлам) журнала; недописанная последняя строка пропускается."""
+    header, entries = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if "path" in entry:
+                entries.append(entry)
+            else:
+                header = entry
+    return header, entries
+
+
+def _undo_result(path):
+    return {"path": path, "restored": False, "error": None}
+
+
+def undo_file(entry):
+    """
+    Возвращает один файл к содержимому до правки. Файл, изменённый после неё,
+    не трогается (ошибка); уже возвращённый считается восстановленным.
+    """
+    result = _undo_result(entry["path"])
+    try:
+        with open(entry["path"], "rb") as f:
+            current = f.read()
+        digest = content_hash(current)
+        if digest == entry["before"]:
+            result["restored"] = True
+            return result
+        if digest != entry["after"]:
+            raise ValueError("файл изменён после операции — не восстановлен")
+        original = apply_delta(current, entry["delta"])
+        if content_hash(original) != entry["before"]:
+            raise ValueError("восстановленное содержимое не совпадает с исходным")
+        write_bytes(entry["path"], original)
+        result["restored"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def iter_undo(path, cancel=None):
+    """
+    Результаты undo_file по журналу path, с последнего файла. Если все файлы
+    восстановлены, журнал удаляется; иначе остаётся — отмену можно повторить.
+    """
+    _, entries = read_journal(path)
+    complete = True
+    for entry in reversed(entries):
+        if cancel is not None and cancel.is_set():
+            complete = False
+            break
+        result = undo_file(entry)
+        complete = complete and result["restored"]
+        yield result
+    if complete:
+        os.remove(path)
+
+
+def undo_log_lines(result):
+    filename = os.path.basename(result["path"])
+    if result["error"]:
+        return [f"{filename}: {result['error']}\n"]
+    return [f"{filename}: восстановлен\n"]
+
+
+def undo_summary(results):
+    """Итог отмены: (количество восстановленных файлов, текст итогового сообщения)."""
+    restored = sum(1 for result in results if result["restored"])
+    message = f"Восстановлено файлов: {restored}"
+    failed = len(results) - restored
+    if failed:
+        message += f"\nНе восстановлено: {failed} (журнал сохранён, отмену можно повторить)"
+    return restored, message
+
+
+def journal_title(path) -> str:
+    """Описание журнала для подтверждения: операция, время, число файлов."""
+    header, entries = read_journal(path)
+    names = {"replace": "замена текста", "add_date": "добавление даты"}
+    created = header.get("created", "").replace("T", " ")
+    return f"{names.get(header.get('operation'), header.get('operation'))} {created}, файлов: {len(entries)}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отмена последней пачки замены текста или добавления даты.")
+    parser.add_argument("journal", nargs="?", help="файл журнала (по умолчанию — последний)")
+    parser.add_argument("--operation", choices=OPERATIONS, help="последний журнал этой операции")
+    parser.add_argument("--list", action="store_true", help="показать журналы и выйти")
+    args = parser.parse_args(argv)
+    if args.list:
+        for path in journal_files(args.operation):
+            print(f"{path}\t{journal_title(path)}")
+        return 0
+    path = args.journal or latest_journal(args.operation)
+    if path is None:
+        print("Нет журналов для отмены.")
+        return 1
+    results = []
+    for result in iter_undo(path):
+        results.append(result)
+        sys.stdout.write("".join(undo_log_lines(result)))
+    restored, message = undo_summary(results)
+    print(message)
+    return 0 if restored == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
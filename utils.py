@@ -1,11 +1,227 @@
-def read_file_safely(path):
-    """Пробует открыть файл в разных кодировках, возвращает текст"""
-    for enc in ("utf-8", "cp1251", "latin-1"):
+import codecs
+import os
+import re
+import stat
+import threading
+from functools import lru_cache, partial
+import metrics
+
+READ_CHUNK_SIZE = 1024 * 1024
+READ_BLOCK_SIZE = 8 * 1024 * 1024  # iter_line_blocks: файл читается кусками по целым строкам
+
+
+@lru_cache(maxsize=None)
+def app_data_dir() -> str:
+    """
+    Папка настроек PNXTool: %APPDATA%\\PNXTool в Windows, иначе $XDG_CONFIG_HOME/PNXTool (~/.config).
+    Определяется один раз за запуск и не создаётся — это делает ensure_app_data_dir() перед записью.
+    """
+    base = (os.environ.get("APPDATA") or os.environ.get("XDG_CONFIG_HOME")
+            or os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(base, "PNXTool")
+
+
+def ensure_app_data_dir() -> str:
+    """Создаёт папку настроек (если её ещё нет) и возвращает путь к ней."""
+    folder = app_data_dir()
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+# кэш определённых кодировок: (путь, размер, mtime) -> кодировка
+ENCODING_CACHE_SIZE = 4096
+_encoding_cache = {}
+
+
+def _cache_key(path, st):
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def _remember_encoding(key, encoding):
+    if len(_encoding_cache) >= ENCODING_CACHE_SIZE:
+        _encoding_cache.clear()
+    _encoding_cache[key] = encoding
+
+
+def _detect_encoding(chunks, decoded=None) -> str:
+    """
+    Кодировка по байтам файла (кусками — память не зависит от размера): utf-8, если
+    всё декодируется, иначе cp1251, если нет байта 0x98 (в cp1251 не определён только он),
+    иначе latin-1. Единственный определитель: им пользуются read_text/read_file_safely,
+    read_bytes (и быстрый путь по байтам cp1251) и detect_file_encoding, так что все
+    пути видят у файла одну и ту же кодировку.
+    decoded — список: в него складывается текст utf-8 (чтобы не декодировать файл дважды).
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    utf8_ok = cp1251_ok = True
+    for chunk in chunks:
+        if utf8_ok and (decoded is not None or not chunk.isascii() or utf8.getstate()[0]):
+            try:
+                text = utf8.decode(chunk)
+                if decoded is not None:
+                    decoded.append(text)
+            except UnicodeDecodeError:
+                utf8_ok = False
+        if cp1251_ok and b"\x98" in chunk:
+            cp1251_ok = False
+        if not (utf8_ok or cp1251_ok):
+            break
+    if utf8_ok:
         try:
-            with open(path, "r", encoding=enc) as f:
-                return f.read()
+            utf8.decode(b"", final=True)  # файл не должен обрываться посреди символа
+            return "utf-8"
         except UnicodeDecodeError:
+            pass
+    return "cp1251" if cp1251_ok else "latin-1"
+
+
+def _cached_encoding(key, data: bytes) -> str:
+    """Кодировка из кэша или определённая по data (и запомненная)."""
+    encoding = _encoding_cache.get(key)
+    if encoding is None:
+        with metrics.stage("detect_encoding"):
+            encoding = _detect_encoding((data,))
+        _remember_encoding(key, encoding)
+    return encoding
+
+
+def _read_raw(path):
+    """Ключ кэша кодировок и байты файла (с замером чтения)."""
+    with metrics.stage("read"), open(path, "rb") as f:
+        key = _cache_key(path, os.fstat(f.fileno()))
+        data = f.read()
+    if metrics.active():
+        metrics.count("files")
+        metrics.count("bytes_read", len(data))
+        metrics.count("lines", data.count(b"\n"))
+    return key, data
+
+
+def read_text(path):
+    """
+    Читает файл один раз и возвращает (текст, кодировка). Кодировка определяется
+    как раньше (utf-8, затем cp1251, затем latin-1) и запоминается по пути, размеру
+    и времени изменения — повторное чтение того же файла сразу декодирует его.
+    Переводы строк приводятся к "\\n", как при чтении в текстовом режиме.
+    """
+    key, data = _read_raw(path)
+    encoding = _encoding_cache.get(key)
+    if encoding is not None:
+        return decode_text(data, encoding), encoding
+    decoded = []
+    with metrics.stage("detect_encoding"):
+        encoding = _detect_encoding((data,), decoded)
+    _remember_encoding(key, encoding)
+    if encoding != "utf-8":
+        return decode_text(data, encoding), encoding
+    text = "".join(decoded)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, encoding
+
+
+# ---------- Быстрый путь для cp1251: работа с байтами без декодирования ----------
+# байты cp1251, которые str.splitlines() тоже считает концом строки (кроме \r и \n)
+EXTRA_LINE_BREAKS_RE = re.compile(rb"[\x0b\x0c\x1c\x1d\x1e]")
+# байты cp1251, которые str.strip() считает пробельными (0xA0 заменяется на пробел раньше)
+CP1251_WHITESPACE = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+OUTPUT_LINESEP = os.linesep.encode("ascii")
+
+
+def read_bytes(path):
+    """Читает файл один раз и возвращает (байты как есть, кодировка) — кодировка из того же кэша."""
+    key, data = _read_raw(path)
+    return data, _cached_encoding(key, data)
+
+
+def decode_text(data: bytes, encoding: str) -> str:
+    """Текст из байт read_bytes() — тот же, что вернул бы read_file_safely()."""
+    with metrics.stage("decode"):
+        text = data.decode(encoding)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def is_cp1251_bytes(data: bytes, encoding: str) -> bool:
+    """Байты уже в cp1251 (или чистый ASCII) — их можно обрабатывать и писать без перекодирования."""
+    return encoding == "cp1251" or data.isascii()
+
+
+def normalize_newlines(data: bytes) -> bytes:
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    return data
+
+
+def iter_line_blocks(f, block_size: int = READ_BLOCK_SIZE):
+    """
+    Куски файла (открытого в "rb") по целым строкам: разрезаны после \\n или \\r, \\r\\n
+    не разрывается. Память — около block_size плюс самая длинная строка.
+    """
+    tail = b""
+    while True:
+        chunk = f.read(block_size)
+        if not chunk:
+            if tail:
+                yield tail
+            return
+        data = tail + chunk
+        pos = max(data.rfind(b"\n"), data.rfind(b"\r"))
+        if pos == len(data) - 1 and data[pos] == 0x0D:
+            # за \r в следующем куске может идти \n — режем по предыдущему переводу строки
+            pos = max(data.rfind(b"\n", 0, pos), data.rfind(b"\r", 0, pos))
+        if pos < 0:
+            tail = data
             continue
-    # если всё плохо — читаем с игнором ошибок
-    with open(path, "r", errors="ignore") as f:
-        return f.read()
+        yield data[:pos + 1]
+        tail = data[pos + 1:]
+
+
+def to_output_bytes(data: bytes) -> bytes:
+    """Переводы строк как при записи в текстовом режиме (os.linesep)."""
+    return data.replace(b"\n", OUTPUT_LINESEP) if OUTPUT_LINESEP != b"\n" else data
+
+
+def write_bytes(path, data: bytes):
+    """
+    Записывает файл целиком (с замером записи): сначала во временный файл рядом,
+    затем переименованием на место — при сбое посреди записи старое содержимое цело.
+    Права доступа существующего файла сохраняются.
+    """
+    tmp_file = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with metrics.stage("write"):
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            try:
+                os.chmod(tmp_file, stat.S_IMODE(os.stat(path).st_mode))
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_file, path)
+        except BaseException:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            raise
+    metrics.count("bytes_written", len(data))
+
+
+def read_file_safely(path):
+    """Пробует открыть файл в разных кодировках, возвращает текст"""
+    return read_text(path)[0]
+
+
+def detect_file_encoding(path, chunk_size: int = READ_CHUNK_SIZE) -> str:
+    """
+    Кодировка файла как у read_file_safely и read_bytes (тот же определитель и кэш),
+    но файл читается кусками — память не зависит от его размера.
+    """
+    key = _cache_key(path, os.stat(path))
+    encoding = _encoding_cache.get(key)
+    if encoding is None:
+        with metrics.stage("detect_encoding"), open(path, "rb") as f:
+            encoding = _detect_encoding(iter(partial(f.read, chunk_size), b""))
+        _remember_encoding(key, encoding)
+    return encoding
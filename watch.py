@@ -0,0 +1,334 @@
+# watch.py
+# Наблюдение за папкой: новые PNX-файлы, как только их перестали записывать,
+# проходят конвейер (pipeline.process_file) в небольшом пуле процессов.
+# На Linux изменения приходят от inotify (через ctypes), иначе папка опрашивается.
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from pipeline import pipeline_log_lines, process_file
+
+SETTLE_SECONDS = 2.0  # файл считается записанным, если столько секунд не менялся
+POLL_SECONDS = 1.0  # период опроса папки без inotify
+BUSY_POLL_SECONDS = 0.1  # как часто проверять готовность файлов в обработке (задержка в логе)
+WATCH_WORKERS = 2
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000  # очередь событий переполнилась, часть потеряна
+IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len — дальше имя длиной len
+
+
+class InotifyWatcher:
+    """
+    Имена файлов папки, которые создали, дописали или переместили в неё (Linux).
+    Если ядро сообщило о переполнении очереди событий, возвращаются все файлы папки.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, os.strerror(err), folder)
+
+    def changes(self, timeout: float):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                return set()
+            raise
+        names = set()
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                names.add(os.fsdecode(name))
+        if overflow:
+            # какие файлы менялись, уже не узнать — папка просматривается заново
+            names.update(os.listdir(self.folder))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Запасной вариант: раз в POLL_SECONDS сравнивает размер и mtime файлов папки."""
+
+    def __init__(self, folder, poll: float = POLL_SECONDS):
+        self.folder = folder
+        self.poll = poll
+        self._seen = self._scan()
+        self._scanned = time.monotonic()
+
+    def _scan(self):
+        seen = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        seen[entry.name] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+        return seen
+
+    def changes(self, timeout: float):
+        time.sleep(timeout)
+        if time.monotonic() - self._scanned < self.poll:
+            return set()
+        self._scanned = time.monotonic()
+        seen = self._scan()
+        names = {name for name, sig in seen.items() if self._seen.get(name) != sig}
+        self._seen = seen
+        return names
+
+    def close(self):
+        pass
+
+
+def make_watcher(folder, use_inotify=None):
+    """inotify, если он есть (use_inotify=None — определить самому), иначе опрос."""
+    if use_inotify is not False and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError):
+            if use_inotify:
+                raise
+    return PollingWatcher(folder)
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class FolderWatch:
+    """
+    Следит за папкой и прогоняет каждый новый файл с расширением file_ext (и search_text
+    в имени) через process_file с заданными этапами — как вкладка "Конвейер".
+    Файл берётся в работу, когда его размер и mtime не менялись settle секунд.
+    Для каждого файла в лог пишется задержка от первого события до готовых результатов.
+    Результаты разделения должны лежать в другой папке, иначе они снова попали бы в обработку;
+    файл, который конвейер сам переписал на месте, повторно не берётся.
+    """
+
+    def __init__(self, folder, compiled_rules=None, date_mode=None, manual_date: str = "",
+                 classifier=None, output_folder=None, file_ext: str = ".pnx", search_text: str = "",
+                 settle: float = SETTLE_SECONDS, workers: int = WATCH_WORKERS, executor: str = "process",
+                 process_existing: bool = False, use_inotify=None, log=None):
+        if classifier is not None and os.path.abspath(output_folder or folder) == os.path.abspath(folder):
+            raise ValueError("Для разделения при наблюдении укажите отдельную папку для результатов.")
+        self.folder = folder
+        self.stages = (compiled_rules, date_mode, manual_date, classifier, output_folder)
+        self.date_mode = date_mode
+        self.file_ext = file_ext
+        self.search_text = search_text
+        self.settle = settle
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.process_existing = process_existing
+        self.use_inotify = use_inotify
+        self.log = log or (lambda line: sys.stdout.write(line))
+        self.results = []
+        self._candidates = {}  # имя -> [первое событие, последнее изменение, (размер, mtime)]
+        self._processed = {}  # имя -> (размер, mtime) после обработки
+
+    def _wanted(self, name):
+        return name.endswith(self.file_ext) and self.search_text in name
+
+    def _touch(self, name, now):
+        if not self._wanted(name):
+            return
+        sig = _signature(os.path.join(self.folder, name))
+        if sig is None or self._processed.get(name) == sig:
+            return
+        candidate = self._candidates.get(name)
+        if candidate is None:
+            self._candidates[name] = [now, now, sig]
+        elif candidate[2] != sig:
+            candidate[1:] = [now, sig]
+
+    def _ready(self, now, busy):
+        """
+        Файлы, которые перестали меняться: ещё раз сверяет размер и mtime.
+        Файлы из busy (ещё обрабатываются) ждут окончания обработки.
+        """
+        ready = []
+        for name, candidate in list(self._candidates.items()):
+            if name in busy or now - candidate[1] < self.settle:
+                continue
+            sig = _signature(os.path.join(self.folder, name))
+            if sig is None or self._processed.get(name) == sig:
+                del self._candidates[name]
+            elif sig != candidate[2]:
+                candidate[1:] = [now, sig]
+            else:
+                del self._candidates[name]
+                ready.append((name, candidate[0]))
+        return ready
+
+    def _finish(self, name, first_seen, result):
+        latency = time.monotonic() - first_seen
+        result["latency"] = latency
+        # если конвейер переписал файл на месте, это изменение — не новое поступление
+        self._processed[name] = _signature(result["path"])
+        self.results.append(result)
+        for line in pipeline_log_lines(result, self.date_mode):
+            self.log(line)
+        self.log(f"{name}: готово через {latency:.2f} с после появления\n")
+
+    def _collect(self, future, name, first_seen):
+        """
+        Результат файла в лог и в results. Если задача упала (например, умер процесс пула),
+        файл записывается с ошибкой. Возвращает True, если пул сломан и его надо заменить.
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"path": os.path.join(self.folder, name), "replacements": [], "date": None,
+                      "dated_lines": 0, "created": [], "written": False, "error": f"{type(e).__name__}: {e}"}
+            self._finish(name, first_seen, result)
+            return isinstance(e, BrokenExecutor)
+        self._finish(name, first_seen, result)
+        return False
+
+    def _new_pool(self, old=None):
+        if old is not None:
+            self.log("Пул обработки сломался — запускается новый\n")
+            old.shutdown(wait=False)
+        pool_class = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        return pool_class(max_workers=self.workers)
+
+    def run(self, stop_event=None):
+        """
+        Работает, пока не установлен stop_event (threading.Event) или не пришёл Ctrl+C.
+        Возвращает список результатов process_file (с полем "latency" в секундах).
+        """
+        stop_event = stop_event or threading.Event()
+        watcher = make_watcher(self.folder, self.use_inotify)
+        self.log(f"Наблюдение за {self.folder} ({type(watcher).__name__})\n")
+        if self.process_existing:
+            now = time.monotonic()
+            for name in sorted(os.listdir(self.folder)):
+                self._touch(name, now)
+
+        running = {}
+        pool = self._new_pool()
+        try:
+            while not stop_event.is_set():
+                if running:
+                    timeout = BUSY_POLL_SECONDS
+                elif self._candidates:
+                    timeout = min(self.settle / 4, POLL_SECONDS)
+                else:
+                    timeout = POLL_SECONDS
+                changed = watcher.changes(timeout)
+                now = time.monotonic()
+                for name in changed:
+                    self._touch(name, now)
+
+                broken = False
+                for future in [f for f in running if f.done()]:
+                    broken |= self._collect(future, *running.pop(future))
+                if broken:
+                    pool = self._new_pool(pool)
+
+                busy = {name for name, _ in running.values()}
+                for name, first_seen in self._ready(time.monotonic(), busy):
+                    args = (process_file, os.path.join(self.folder, name), *self.stages)
+                    try:
+                        future = pool.submit(*args)
+                    except BrokenExecutor:
+                        pool = self._new_pool(pool)
+                        future = pool.submit(*args)
+                    running[future] = (name, first_seen)
+            # уже начатые файлы доделываются
+            for future, (name, first_seen) in running.items():
+                self._collect(future, name, first_seen)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown()
+            watcher.close()
+        return self.results
+
+
+def watch_summary(results):
+    """Итог наблюдения: (обработано файлов, текст с задержками)."""
+    ok = [result for result in results if not result["error"]]
+    if not ok:
+        return 0, "Обработано файлов: 0"
+    latencies = sorted(result["latency"] for result in ok)
+    return len(ok), (f"Обработано файлов: {len(ok)}. Задержка: средняя {sum(latencies) / len(latencies):.2f} с, "
+                     f"медиана {latencies[len(latencies) // 2]:.2f} с, макс. {latencies[-1]:.2f} с")
+
+
+def main(argv=None):
+    from add_date import DATE_RE
+    from replace import compiled_replace_rules
+    from split import compile_rules
+
+    parser = argparse.ArgumentParser(description="Наблюдение за папкой и автоматическая обработка новых PNX-файлов.")
+    parser.add_argument("folder", help="папка, куда поступают файлы")
+    parser.add_argument("-o", "--output-folder", help="папка для результатов разделения")
+    parser.add_argument("--replace", action="store_true", help="замена текста по сохранённым правилам")
+    parser.add_argument("--date", choices=("from_filename", "manual"), help="добавить дату")
+    parser.add_argument("--manual-date", default="", help="дата YYYY-MM-DD для --date manual")
+    parser.add_argument("--split", action="store_true", help="разделение по сохранённым правилам")
+    parser.add_argument("--ext", default=".pnx")
+    parser.add_argument("--search", default="", help="строка, которая должна быть в имени файла")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS)
+    parser.add_argument("-w", "--workers", type=int, default=WATCH_WORKERS)
+    parser.add_argument("--existing", action="store_true", help="обработать и уже лежащие в папке файлы")
+    parser.add_argument("--poll", action="store_true", help="опрашивать папку вместо inotify")
+    args = parser.parse_args(argv)
+    if args.date == "manual" and not DATE_RE.fullmatch(args.manual_date):
+        parser.error("Введите дату в формате YYYY-MM-DD (например 2025-12-19).")
+
+    watch = FolderWatch(
+        args.folder,
+        compiled_rules=compiled_replace_rules() if args.replace else None,
+        date_mode=args.date, manual_date=args.manual_date,
+        classifier=compile_rules() if args.split else None,
+        output_folder=args.output_folder, file_ext=args.ext, search_text=args.search,
+        settle=args.settle, workers=args.workers, process_existing=args.existing,
+        use_inotify=False if args.poll else None,
+    )
+    results = watch.run()
+    print(watch_summary(results)[1])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())